@@ -0,0 +1,6 @@
+"""Benchmarks for parts of the pipeline. These are scripts which are run by
+hand, for example `python -m benchmarks.savers`, and are not part of the test
+suite. `python -m benchmarks.stages` times key stages against a local
+stand-in database and writes the results as JSON, which can be compared
+between commits with `python -m benchmarks.compare`.
+"""
@@ -0,0 +1,69 @@
+"""Compare two results files written by `benchmarks.stages`. For each
+benchmark in both this shows the best time of each and the ratio of the
+throughputs, flagging any benchmark which has become slower by more than the
+given threshold.
+
+Usage:
+
+    python -m benchmarks.compare old.json new.json [--threshold 0.1]
+"""
+
+import json
+
+import click
+
+
+def load(filename):
+    """Load the results in a file, keyed by benchmark name."""
+    with open(filename, 'rb') as raw:
+        data = json.load(raw)
+    return data['commit'], dict((r['name'], r) for r in data['benchmarks'])
+
+
+def compare(old, new, threshold):
+    """Compare two sets of results.
+
+    Returns
+    -------
+    rows : list
+        A tuple of the name, old best, new best, speedup and if it is a
+        regression for each benchmark in both sets of results.
+    """
+
+    rows = []
+    for name in sorted(set(old) & set(new)):
+        before = old[name]['throughput'] or 0
+        after = new[name]['throughput'] or 0
+        speedup = after / before if before else float('nan')
+        rows.append((name, old[name]['best'], new[name]['best'], speedup,
+                     speedup < 1 - threshold))
+    return rows
+
+
+@click.command()
+@click.argument('old', type=click.Path(exists=True, dir_okay=False))
+@click.argument('new', type=click.Path(exists=True, dir_okay=False))
+@click.option('--threshold', default=0.1, type=float,
+              help='Fraction of throughput lost to count as a regression')
+@click.pass_context
+def main(ctx, old, new, threshold):
+    old_commit, old_results = load(old)
+    new_commit, new_results = load(new)
+    click.echo("Comparing %s to %s" % (old_commit[:10], new_commit[:10]))
+
+    regressed = False
+    for name, before, after, speedup, regression in \
+            compare(old_results, new_results, threshold):
+        line = '%-30s %8.3fs %8.3fs %6.2fx' % (name, before, after, speedup)
+        if regression:
+            regressed = True
+            click.secho(line + '  regression', fg='red')
+        else:
+            click.echo(line)
+
+    if regressed:
+        ctx.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+"""Build a local stand-in database for benchmarks. The schema is reflected
+from the configured database and created in a separate, empty database on
+the same server, named like the configured one with a '_benchmark' suffix.
+This means benchmarks never touch real data, and the stand-in can be
+dropped and rebuilt at any time. Foreign key checks are disabled in the
+stand-in, so stages can be loaded without their dependencies.
+"""
+
+import logging
+
+from sqlalchemy import event
+from sqlalchemy import create_engine
+from sqlalchemy.engine.url import make_url
+
+from pymotifs import models as mod
+
+"""The logger to use."""
+logger = logging.getLogger(__name__)
+
+"""The suffix of the name of the stand-in database."""
+SUFFIX = '_benchmark'
+
+
+def stand_in_url(uri, name=None):
+    """Compute the url of the stand-in for the given database.
+
+    Parameters
+    ----------
+    uri : str
+        The url of the database to copy the schema of.
+    name : str, optional
+        The name of the stand-in database, defaults to the name of the given
+        database with '_benchmark' appended.
+
+    Returns
+    -------
+    url : sqlalchemy.engine.url.URL
+        The url of the stand-in.
+    """
+
+    url = make_url(uri)
+    url.database = name or (url.database + SUFFIX)
+    return url
+
+
+def _disable_foreign_keys(connection, record):
+    cursor = connection.cursor()
+    cursor.execute('SET FOREIGN_KEY_CHECKS=0')
+    cursor.close()
+
+
+def build(config, name=None, drop=True):
+    """Create the stand-in database and all tables in it. This reflects the
+    models from the configured database, so afterwards all models in
+    `pymotifs.models` exist, and then binds them to the stand-in.
+
+    Parameters
+    ----------
+    config : dict
+        The configuration, the 'uri' of the 'db' section is the database to
+        copy the schema of.
+    name : str, optional
+        The name of the stand-in database.
+    drop : bool, optional
+        If any existing stand-in should be dropped first. Defaults to True
+        so each run starts from empty tables.
+
+    Returns
+    -------
+    engine : sqlalchemy.engine.Engine
+        An engine connected to the stand-in.
+    """
+
+    source = create_engine(config['db']['uri'])
+    mod.reflect(source)
+
+    url = stand_in_url(config['db']['uri'], name=name)
+    server = make_url(str(url))
+    server.database = None
+    admin = create_engine(server)
+    if drop:
+        admin.execute('DROP DATABASE IF EXISTS `%s`' % url.database)
+    admin.execute('CREATE DATABASE IF NOT EXISTS `%s`' % url.database)
+    admin.dispose()
+
+    engine = create_engine(url)
+    event.listen(engine, 'connect', _disable_foreign_keys)
+    logger.info("Creating %i tables in %s", len(mod.metadata.tables),
+                url.database)
+    mod.metadata.create_all(engine)
+    mod.metadata.bind = engine
+    source.dispose()
+    return engine
@@ -0,0 +1,62 @@
+"""Compare the rate at which `DatabaseSaver` writes the distances computed by
+`units.distances`, using the ORM and using bulk Core inserts. This requires a
+database configured like the testing database, as it will delete and then
+rewrite the distances of the given structure.
+
+Usage:
+
+    python -m benchmarks.savers [config] [cif]
+"""
+
+import os
+import sys
+import time
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from fr3d.cif.reader import Cif
+
+from pymotifs import models as mod
+from pymotifs.config import load as config_loader
+from pymotifs.units.distances import Loader
+
+
+def measure(loader, pdb, rows, bulk):
+    """Remove the stored distances and time writing them back.
+
+    Returns
+    -------
+    rate : float
+        The number of rows written per second.
+    """
+
+    loader.remove(pdb)
+    loader.bulk_insert = bulk
+    start = time.time()
+    loader.store(pdb, rows)
+    return len(rows) / (time.time() - start)
+
+
+def main(config_file='conf/bootstrap.json',
+         filename='test/files/cif/1GID.cif'):
+    config = config_loader(config_file)
+    engine = create_engine(config['db']['uri'])
+    mod.reflect(engine)
+
+    loader = Loader(config, sessionmaker(bind=engine))
+    pdb = os.path.splitext(os.path.basename(filename))[0].upper()
+    with open(filename, 'rb') as raw:
+        structure = Cif(raw).structure()
+    rows = list(loader.data(structure))
+
+    orm = measure(loader, pdb, rows, False)
+    bulk = measure(loader, pdb, rows, True)
+    print("units.distances %s: %i rows" % (pdb, len(rows)))
+    print("ORM:  %10.1f rows/sec" % orm)
+    print("Bulk: %10.1f rows/sec" % bulk)
+    print("Speedup: %.1fx" % (bulk / orm))
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
@@ -0,0 +1,504 @@
+"""Time key stages of the pipeline. Stages which load data are run against a
+local stand-in database, built by `benchmarks.database`, using the
+structures in test/files/cif. The grouping, ordering and discrepancy kernels
+are run on synthetic data. All random data comes from generators seeded with
+the given seed, so runs are reproducible. Each benchmark is run once to warm
+up and then `repeat` times, and the best time is used to compute the
+throughput. The results are written as JSON, by default to
+benchmarks/results/<commit>.json, and two results files can be compared
+with `benchmarks.compare`.
+
+Usage:
+
+    python -m benchmarks.stages [--config conf/bootstrap.json] [--seed 1]
+        [--repeat 3] [--only NAME ...] [--no-database] [--output FILE]
+"""
+
+import os
+import csv
+import json
+import time
+import zlib
+import random
+import shutil
+import logging
+import tempfile
+import subprocess
+import collections as coll
+from datetime import datetime
+
+import click
+import numpy as np
+
+from sqlalchemy.orm import sessionmaker
+
+from pymotifs import models as mod
+from pymotifs.config import load as config_loader
+from pymotifs.constants import NR_DISCREPANCY_CUTOFF
+from pymotifs.core.cache import StructureCache
+from pymotifs.units.info import Loader as InfoLoader
+from pymotifs.units.distances import Loader as DistancesLoader
+from pymotifs.units.coordinates import Loader as CoordinatesLoader
+from pymotifs.interactions.pairwise import Loader as PairwiseLoader
+from pymotifs.interactions.summary import Loader as SummaryLoader
+from pymotifs.nr.groups.simplified import Grouper
+from pymotifs.utils.union_find import connected_components
+from pymotifs.utils.unit_geometry import UnitGeometry
+from pymotifs.nr.ordering import Loader as OrderingLoader
+from pymotifs.chain_chain.comparison import Loader as ComparisonLoader
+
+from benchmarks import database
+
+"""The logger to use."""
+logger = logging.getLogger(__name__)
+
+"""The directory of structures to load."""
+CIF_DIRECTORY = os.path.join('test', 'files', 'cif')
+
+"""The directory results are written to by default."""
+RESULTS_DIRECTORY = os.path.join('benchmarks', 'results')
+
+"""The size of the synthetic data sets."""
+SIZES = {
+    'ifes': 500,
+    'members': 60,
+    'units': 200,
+    'pairs': 200,
+    'nodes': 100000,
+}
+
+"""Interaction annotations to pick from for synthetic pairwise data."""
+FAMILIES = ['cWW', 'tWW', 'cWH', 'tHS', 'cSS', 's35', 's53', 's55',
+            '1BPh', '3BPh', '0BPh', 'ncWW', 'ns35']
+
+
+class Environment(object):
+    """The configuration, stand-in database and structures shared by all
+    benchmarks in a run.
+
+    Attributes
+    ----------
+    config : dict
+        The configuration, with the locations of structures and caches
+        pointing into a temporary directory.
+    maker : sqlalchemy.orm.session.sessionmaker
+        The session maker bound to the stand-in database, or an unbound one
+        if there is no database.
+    pdbs : list
+        The PDB ids of the structures to load.
+    structures : pymotifs.core.cache.StructureCache
+        A cache of parsed structures shared between all stages.
+    seed : int
+        The seed for all random data.
+    """
+
+    def __init__(self, config_file, seed, use_database=True):
+        self.seed = seed
+        self.directory = tempfile.mkdtemp(prefix='pymotifs-benchmark-')
+        self.config = config_loader(config_file)
+        self.config['locations']['fr3d_root'] = self.directory
+        self.config['locations']['cache'] = os.path.join(self.directory,
+                                                         'cache')
+        self.config['structure_cache']['persistent'] = False
+
+        structures = os.path.join(self.directory, 'PDBFiles')
+        os.makedirs(structures)
+        self.pdbs = []
+        for filename in sorted(os.listdir(CIF_DIRECTORY)):
+            name, ext = os.path.splitext(filename)
+            if ext != '.cif':
+                continue
+            os.symlink(os.path.abspath(os.path.join(CIF_DIRECTORY, filename)),
+                       os.path.join(structures, filename))
+            self.pdbs.append(name.upper())
+
+        self.engine = None
+        if use_database:
+            self.engine = database.build(self.config)
+        self.maker = sessionmaker(bind=self.engine)
+        self.structures = StructureCache(
+            self.config['structure_cache']['max_size'])
+
+    def stage(self, klass):
+        """Create a stage which uses the stand-in and the shared cache of
+        structures.
+        """
+
+        stage = klass(self.config, self.maker)
+        stage.structures = self.structures
+        return stage
+
+    def random(self, name):
+        """Create the random number generators for a benchmark. Each one is
+        seeded by the run seed and the benchmark name, so the data of one
+        benchmark does not depend on which others are run.
+
+        Returns
+        -------
+        generators : tuple
+            A `random.Random` and a `numpy.random.RandomState`.
+        """
+
+        seed = (self.seed ^ zlib.crc32(name)) & 0xffffffff
+        return random.Random(seed), np.random.RandomState(seed)
+
+    def close(self):
+        """Remove all temporary files and disconnect from the database.
+        """
+
+        if self.engine is not None:
+            self.engine.dispose()
+        shutil.rmtree(self.directory)
+
+
+def loading(stage, pdbs):
+    """Create a function which reloads the data of a stage for all pdbs.
+
+    Returns
+    -------
+    run : function
+        A function which removes, computes and stores the data of each pdb and
+        returns the number of rows stored.
+    """
+
+    def run():
+        count = 0
+        for pdb in pdbs:
+            stage.remove(pdb)
+            rows = list(stage.data(pdb))
+            stage.store(pdb, rows)
+            count += len(rows)
+        return count
+    return run
+
+
+def units_info(env):
+    """Time loading units.info."""
+    return loading(env.stage(InfoLoader), env.pdbs), 'rows'
+
+
+def units_distances(env):
+    """Time loading units.distances."""
+    return loading(env.stage(DistancesLoader), env.pdbs), 'rows'
+
+
+def units_coordinates(env):
+    """Time loading units.coordinates."""
+    return loading(env.stage(CoordinatesLoader), env.pdbs), 'rows'
+
+
+def pairwise_interactions(env, pdb, rng):
+    """Store synthetic pairwise annotations between the RNA units of a pdb,
+    as if produced by FR3D. This requires that units.info has been loaded.
+    """
+
+    with env.stage(InfoLoader).session() as session:
+        query = session.query(mod.UnitInfo.unit_id).\
+            filter_by(pdb_id=pdb, unit_type_id='rna').\
+            order_by(mod.UnitInfo.unit_id)
+        units = [r.unit_id for r in query]
+
+    if not units:
+        return
+
+    loader = env.stage(PairwiseLoader)
+    filename = os.path.join(env.directory, pdb + '-interactions.csv')
+    with open(filename, 'wb') as raw:
+        writer = csv.writer(raw)
+        for _ in range(3 * len(units)):
+            writer.writerow([rng.choice(units), rng.choice(units),
+                             rng.choice(FAMILIES), rng.randint(0, 20)])
+
+    loader.remove(pdb)
+    loader.store(pdb, loader.parse(filename, pdb))
+    os.remove(filename)
+
+
+def interactions_summary(env):
+    """Time loading interactions.summary from synthetic annotations."""
+    rng, _ = env.random('interactions.summary')
+    loading(env.stage(InfoLoader), env.pdbs)()
+    for pdb in env.pdbs:
+        pairwise_interactions(env, pdb, rng)
+    return loading(env.stage(SummaryLoader), env.pdbs), 'rows'
+
+
+def synthetic_ifes(rng, count):
+    """Create synthetic IFEs, alignments and discrepancies. The IFEs come in
+    clusters of similar chains, most of which align and have a small
+    discrepancy to each other, with some noise to cause splits.
+
+    Returns
+    -------
+    data : tuple
+        The list of IFEs, the alignments and the discrepancies in the form
+        used by `Grouper.group`.
+    """
+
+    ifes = []
+    clusters = coll.defaultdict(list)
+    for index in range(count):
+        cluster = rng.randint(0, max(1, count // 8))
+        length = 20 + (10 * cluster) % 3000
+        ife = {
+            'id': '%04d|1|A' % index,
+            'pdb': '%04d' % index,
+            'db_id': index,
+            'name': 'A',
+            'bp': rng.randint(0, length // 2),
+            'length': length,
+            'species': rng.choice([None, 562, 9606, cluster]),
+            'resolution': rng.uniform(1.5, 4.5),
+            'method': 'X-RAY DIFFRACTION',
+        }
+        ife['chains'] = [dict(ife)]
+        ifes.append(ife)
+        clusters[cluster].append(index)
+
+    alignments = coll.defaultdict(dict)
+    discrepancies = coll.defaultdict(dict)
+    for members in clusters.values():
+        for first in members:
+            for second in members:
+                alignments[first][second] = rng.random() > 0.05
+                value = rng.uniform(0, NR_DISCREPANCY_CUTOFF * 1.2)
+                discrepancies[first][second] = value
+                discrepancies[second][first] = value
+    return ifes, dict(alignments), dict(discrepancies)
+
+
+def nr_grouper(env, use_candidates=True):
+    """Time grouping synthetic IFEs with the NR Grouper. Unless
+    use_candidates is False only the pairs of IFEs with a good alignment are
+    checked for equivalence."""
+    rng, _ = env.random('nr.groups.simplified.Grouper')
+    ifes, alignments, discrepancies = synthetic_ifes(rng, SIZES['ifes'])
+    grouper = Grouper(env.config, env.maker)
+    grouper.use_candidates = use_candidates
+
+    def run():
+        grouper.group(ifes, alignments, discrepancies)
+        return len(ifes)
+    return run, 'ifes'
+
+
+def nr_grouper_all_pairs(env):
+    """Time grouping the same IFEs as `nr_grouper` checking all pairs."""
+    return nr_grouper(env, use_candidates=False)
+
+
+def connected_sets(env):
+    """Time finding the connected components of a large synthetic graph, in
+    the form built by `Grouper.connections`. Most nodes are in small
+    clusters, with a few edges between clusters to build some large
+    components."""
+    rng, _ = env.random('utils.union_find')
+    count = SIZES['nodes']
+    graph = dict((node, set([node])) for node in range(count))
+    for node in range(count):
+        for _ in range(rng.randint(0, 3)):
+            other = min(count - 1, node + rng.randint(1, 20))
+            if rng.random() < 0.01:
+                other = rng.randint(0, count - 1)
+            graph[node].add(other)
+            graph[other].add(node)
+
+    def run():
+        connected_components(graph)
+        return count
+    return run, 'nodes'
+
+
+def nr_ordering(env):
+    """Time ordering a synthetic equivalence class."""
+    _, state = env.random('nr.ordering')
+    count = SIZES['members']
+    points = state.normal(size=(count, 3)) + \
+        state.randint(0, 4, size=(count, 1))
+    members = [('%04d|1|A' % i, i) for i in range(count)]
+    distances = coll.defaultdict(dict)
+    for i, (first, _) in enumerate(members):
+        for j, (second, _) in enumerate(members):
+            distances[first][second] = np.linalg.norm(points[i] - points[j])
+    loader = env.stage(OrderingLoader)
+
+    def run():
+        loader.ordered(members, distances)
+        return len(members)
+    return run, 'members'
+
+
+def rotation(state):
+    """Create a random rotation matrix."""
+    q, r = np.linalg.qr(state.normal(size=(3, 3)))
+    return q * np.sign(np.diag(r))
+
+
+def synthetic_geometry(pdb, centers, rotations):
+    """Create the stored geometry of a synthetic single chain structure."""
+    count = len(centers)
+    unit_ids = ['%s|1|A|G|%d' % (pdb, i) for i in range(count)]
+    return UnitGeometry(unit_ids, range(count), np.array(centers),
+                        np.array(rotations), {'A': (0, count)})
+
+
+def chain_chain_discrepancy(env):
+    """Time computing the discrepancies of chain_chain.comparison. One chain
+    is compared to many others like `Loader.compare` does, matching units
+    with `matched_rows` and using the batched kernel, but without looking up
+    the correspondences in the database. Some units in the other chains are
+    left unmatched so the batches are padded."""
+    _, state = env.random('chain_chain.discrepancy')
+    size = SIZES['units']
+    centers = state.normal(scale=10, size=(size, 3))
+    rotations = [rotation(state) for _ in range(size)]
+    geometry1 = synthetic_geometry('AAAA', centers, rotations)
+
+    others = []
+    for index in range(SIZES['pairs']):
+        turn = rotation(state)
+        moved = centers.dot(turn) + state.normal(scale=0.5, size=(size, 3))
+        geometry2 = synthetic_geometry('%04d' % index, moved,
+                                       [r.dot(turn) for r in rotations])
+        count = state.randint(size // 2, size + 1)
+        pairs = list(zip(geometry1.unit_ids[:count],
+                         geometry2.unit_ids[:count]))
+        others.append((geometry2, pairs))
+    loader = env.stage(ComparisonLoader)
+
+    def run():
+        matched = []
+        for geometry2, pairs in others:
+            rows1, rows2 = loader.matched_rows(pairs, geometry1, geometry2)
+            matched.append((geometry2, rows1, rows2))
+        loader.batch_discrepancies(geometry1, matched)
+        return len(others)
+    return run, 'pairs'
+
+
+"""All benchmarks, in the order they are run, with a flag for if they need
+the stand-in database."""
+BENCHMARKS = [
+    ('units.info', units_info, True),
+    ('units.distances', units_distances, True),
+    ('units.coordinates', units_coordinates, True),
+    ('interactions.summary', interactions_summary, True),
+    ('nr.groups.simplified.Grouper', nr_grouper, False),
+    ('nr.groups.simplified.Grouper.all_pairs', nr_grouper_all_pairs, False),
+    ('utils.union_find', connected_sets, False),
+    ('nr.ordering', nr_ordering, False),
+    ('chain_chain.discrepancy', chain_chain_discrepancy, False),
+]
+
+
+def measure(name, run, unit, repeat):
+    """Time a benchmark. It is run once to warm up, and then `repeat` times.
+
+    Returns
+    -------
+    result : dict
+        The name, the unit and number of items processed, the time of each
+        run, the best time and the throughput in items per second.
+    """
+
+    run()
+    seconds = []
+    items = 0
+    for _ in range(repeat):
+        start = time.time()
+        items = run()
+        seconds.append(time.time() - start)
+
+    best = min(seconds)
+    return {
+        'name': name,
+        'unit': unit,
+        'items': items,
+        'seconds': seconds,
+        'best': best,
+        'throughput': items / best if best else None,
+    }
+
+
+def commit():
+    """Find the current git commit, or 'unknown'."""
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD']).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def run_all(env, repeat, only=None):
+    """Run all benchmarks, or the ones named in only, which may be run in
+    this environment.
+
+    Returns
+    -------
+    results : list
+        The result of `measure` for each benchmark.
+    """
+
+    results = []
+    for name, build, needs_database in BENCHMARKS:
+        if only and name not in only:
+            continue
+        if needs_database and env.engine is None:
+            logger.info("Skipping %s without a database", name)
+            continue
+        logger.info("Running %s", name)
+        run, unit = build(env)
+        result = measure(name, run, unit, repeat)
+        logger.info("%s: %.1f %s/sec", name, result['throughput'] or 0, unit)
+        results.append(result)
+    return results
+
+
+@click.command()
+@click.option('--config', default='conf/bootstrap.json',
+              type=click.Path(exists=True, dir_okay=False),
+              help='Configuration with the database to copy the schema of')
+@click.option('--output', type=click.Path(dir_okay=False),
+              help='File to write results to')
+@click.option('--seed', default=1, type=int, help='Seed for random data')
+@click.option('--repeat', default=3, type=click.IntRange(min=1),
+              help='Number of timed runs of each benchmark')
+@click.option('--only', multiple=True, help='Name of a benchmark to run')
+@click.option('--no-database', is_flag=True, default=False,
+              help='Only run benchmarks which do not need a database')
+def main(config, output, seed, repeat, only, no_database):
+    logging.basicConfig(level=logging.INFO)
+    for name in ['pymotifs', 'core']:
+        logging.getLogger(name).setLevel(logging.WARNING)
+
+    env = Environment(config, seed, use_database=not no_database)
+    try:
+        results = run_all(env, repeat, only=set(only))
+    finally:
+        env.close()
+
+    revision = commit()
+    if not output:
+        if not os.path.isdir(RESULTS_DIRECTORY):
+            os.makedirs(RESULTS_DIRECTORY)
+        output = os.path.join(RESULTS_DIRECTORY, revision[:10] + '.json')
+
+    with open(output, 'wb') as raw:
+        json.dump({
+            'commit': revision,
+            'created': datetime.now().isoformat(),
+            'seed': seed,
+            'repeat': repeat,
+            'pdbs': env.pdbs,
+            'sizes': SIZES,
+            'benchmarks': results,
+        }, raw, indent=2)
+
+    for result in results:
+        click.echo('%-30s %8i %-8s %8.3fs %12.1f/s' % (
+            result['name'], result['items'], result['unit'],
+            result['best'], result['throughput'] or 0))
+    click.echo("Results written to %s" % output)
+
+
+if __name__ == '__main__':
+    main()
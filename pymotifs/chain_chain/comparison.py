@@ -8,32 +8,38 @@ in the database.
 This will only compare the first chain in each IFE.
 """
 
+import os
 import functools as ft
 import itertools as it
 import numpy as np
 import operator as op
-import pickle
 import time
 
 from collections import defaultdict
 
 from sqlalchemy import and_
 from sqlalchemy import or_
+from sqlalchemy import func
 from sqlalchemy.orm import aliased
 from sqlalchemy.sql import union_all
 
 from fr3d.geometry.discrepancy import matrix_discrepancy
 
 from pymotifs import core
+from pymotifs.core import parallel
 import pymotifs.utils as ut
 from pymotifs import models as mod
 from pymotifs.utils import discrepancy as disc
+from pymotifs.utils.unit_geometry import UnitGeometryStore
+from pymotifs.utils.position_index import PositionIndex
+from pymotifs.utils.pair_index import PairIndex
 
 from pymotifs.correspondence.loader import Loader as CorrespondenceLoader
 from pymotifs.exp_seq.mapping import Loader as ExpSeqUnitMappingLoader
 from pymotifs.ife.loader import Loader as IfeLoader
 from pymotifs.units.centers import Loader as CenterLoader
 from pymotifs.units.rotation import Loader as RotationLoader
+from pymotifs.export.pickle_units_rna import Exporter as UnitGeometryExporter
 
 from pymotifs.nr.groups.simplified import Grouper
 
@@ -105,15 +111,43 @@ class Loader(core.SimpleLoader):
     correspondences between ifes to compute the discrepancy between them.
     """
 
-    """The tuple of chains can't be marked in the database."""
-    mark = False
+    """The tuple of chains can't be marked in the database, marking instead
+    records the compared pairs in the pair index."""
+    mark = True
 
     """We allow for no data to be written when appropriate."""
     allow_no_data = True
 
     """The dependencies for this stage"""
     dependencies = set([CorrespondenceLoader, ExpSeqUnitMappingLoader,
-                        IfeLoader, CenterLoader, RotationLoader])
+                        IfeLoader, CenterLoader, RotationLoader,
+                        UnitGeometryExporter])
+
+    """Groups are processed one at a time, the pairs within each group are
+    split across worker processes instead."""
+    parallel = False
+
+    """Discrepancies are written with executemany INSERTs."""
+    bulk_insert = True
+
+    """The number of pairs of chains to compute discrepancies of at once."""
+    batch_size = 64
+
+    def __init__(self, *args, **kwargs):
+        super(Loader, self).__init__(*args, **kwargs)
+        self.geometry = UnitGeometryStore(
+            self.config['locations']['unit_geometry'])
+        self.positions = PositionIndex(
+            os.path.join(self.config['locations']['cache'], 'chain_chain'))
+        self.pairs = PairIndex(
+            os.path.join(self.config['locations']['cache'], 'chain_chain',
+                         'pairs'))
+        self._context = {}
+        self._compared = {}
+
+    @property
+    def table(self):
+        return mod.ChainChainSimilarity
 
 
     def known_unit_entries(self, table):
@@ -160,13 +194,175 @@ class Loader(core.SimpleLoader):
         return getter(chain) in known
 
 
+    def update_positions(self, pdbs, **kwargs):
+        """Bring the position index up to date for the given structures. The
+        units of a structure are added if they are not in the index, or if
+        its unit mapping has been marked as processed at another time than
+        when they were added. All position correspondences added since the
+        index was last updated are added as well. If older correspondences
+        have been removed or replaced, which is seen as fewer rows up to the
+        last one added than the index has, they are all loaded again. When
+        this stage is recomputed the index is built again from nothing.
+
+        Parameters
+        ----------
+        pdbs : list
+            The PDB ids whose units must be in the index.
+        """
+
+        if self.must_recompute(pdbs, **kwargs):
+            self.logger.info("Rebuilding the unit position index")
+            self.positions.clear()
+
+        EM = mod.ExpSeqUnitMapping
+        mapping_stage = ExpSeqUnitMappingLoader.__module__.replace('pymotifs.', '')
+        pdbs = sorted(set(pdbs))
+        marks = {}
+        with self.session() as session:
+            for chunk in ut.grouper(self.bulk_size, pdbs):
+                query = session.query(mod.PdbAnalysisStatus.pdb_id,
+                                      mod.PdbAnalysisStatus.time).\
+                    filter(mod.PdbAnalysisStatus.stage == mapping_stage).\
+                    filter(mod.PdbAnalysisStatus.pdb_id.in_(chunk))
+                for r in query:
+                    if r.time is not None:
+                        marks[r.pdb_id.upper()] = r.time.isoformat()
+
+        new = []
+        for pdb in pdbs:
+            if not self.positions.has_structure(pdb) or \
+                    self.positions.marked(pdb) != marks.get(pdb.upper()):
+                new.append(pdb)
+
+        self.logger.info('Adding %d structures to the unit position index' % len(new))
+        with self.session() as session:
+            for chunk in ut.grouper(self.bulk_size, new):
+                query = session.query(mod.UnitInfo.pdb_id,
+                                      EM.unit_id,
+                                      EM.exp_seq_position_id).\
+                    join(mod.UnitInfo, mod.UnitInfo.unit_id == EM.unit_id).\
+                    filter(mod.UnitInfo.pdb_id.in_(chunk))
+
+                mappings = defaultdict(list)
+                for r in query:
+                    if r.unit_id and len(r.unit_id.split("|")) > 3:
+                        mappings[r.pdb_id.upper()].append((r.unit_id, r.exp_seq_position_id))
+
+                for pdb in chunk:
+                    self.positions.add_structure(pdb, mappings[pdb.upper()],
+                                                 marked=marks.get(pdb.upper()))
+
+        last = self.positions.last_correspondence()
+        CP = mod.CorrespondencePositions
+        with self.session() as session:
+            known = session.query(func.count(CP.correspondence_positions_id)).\
+                filter(CP.correspondence_positions_id <= last).\
+                scalar()
+            largest = session.query(func.max(CP.correspondence_positions_id)).\
+                scalar()
+
+        if known != self.positions.correspondence_count() or \
+                (largest or 0) < last:
+            self.logger.info("Correspondences have changed, reloading all")
+            self.positions.clear_correspondences()
+            last = 0
+
+        with self.session() as session:
+            query = session.query(CP.correspondence_positions_id,
+                                  CP.exp_seq_position_id_1,
+                                  CP.exp_seq_position_id_2).\
+                filter(CP.correspondence_positions_id > last)
+
+            pairs = []
+            for r in query:
+                pairs.append((r.exp_seq_position_id_1, r.exp_seq_position_id_2))
+                last = max(last, r.correspondence_positions_id)
+
+        self.logger.info('Got %d new position to position correspondences' % len(pairs))
+        if pairs:
+            self.positions.add_correspondences(pairs, last)
+
+    def update_pairs(self, pdbs, **kwargs):
+        """Make sure the index of compared pairs of chains exists. The first
+        time it is used, or when this stage is recomputed, it is filled with
+        every pair that already has a discrepancy, using a single scan of
+        the table.
+
+        Parameters
+        ----------
+        pdbs : list
+            The PDB ids being processed.
+        """
+
+        if self.must_recompute(pdbs, **kwargs):
+            self.pairs.clear()
+
+        if self.pairs.is_seeded():
+            return
+
+        self.logger.info("Seeding the index of compared pairs of chains")
+        sim = mod.ChainChainSimilarity
+        with self.session() as session:
+            query = session.query(sim.chain_id_1, sim.chain_id_2)
+            self.pairs.seed((r.chain_id_1, r.chain_id_2) for r in query)
+
+    def plan(self, groups, explain=False, dry_run=False, **kwargs):
+        """Select the groups which have pairs of chains that have not been
+        compared. Groups where every pair has been compared, which are those
+        no chain was added to since the last run, are skipped. The number of
+        pairs which are skipped is logged, and with `explain` so is the plan
+        for each group.
+
+        Parameters
+        ----------
+        groups : list
+            The sorted lists of chain ids of each group.
+        explain : bool, optional
+            If true, log the number of new chains and of pairs to compare
+            and to skip in each group.
+        dry_run : bool, optional
+            If true, the chains are not recorded as grouped.
+
+        Returns
+        -------
+        groups : list
+            The groups that have pairs to compare.
+        """
+
+        selected = []
+        total = 0
+        needed = 0
+        for chain_ids in groups:
+            count = len(chain_ids) * (len(chain_ids) - 1) / 2
+            missing = len(self.pairs.missing(chain_ids))
+            new = self.pairs.new_members(chain_ids)
+            total += count
+            needed += missing
+            if missing:
+                selected.append(chain_ids)
+            if explain:
+                self.logger.info("explain: group of %d chains starting with "
+                                 "%s, %d new chains, %d pairs to compare, "
+                                 "%d pairs skipped", len(chain_ids),
+                                 chain_ids[0], len(new), missing,
+                                 count - missing)
+
+        if not dry_run:
+            self.pairs.add_members(c for g in groups for c in g)
+
+        self.logger.info("Comparing %d of %d pairs in %d of %d groups, "
+                         "skipped %d pairs already compared", needed, total,
+                         len(selected), len(groups), total - needed)
+        return selected
+
     def to_process(self, pdbs, **kwargs):
         """This will compute all pairs to compare. This will group all pdbs
         using only sequence and species and then produce a list of chains that
         are only the chains in the same group. It will also filter out all
         pairs that have a chain with a poor resolution or is too small. This
         will produce all comparisons that are needed for the NR set and no
-        more. If no groups are produced we raise an exception.
+        more. Groups where every pair has already been compared are skipped,
+        see `plan`. If no groups are produced we raise an exception.
 
         Parameters
         ----------
@@ -177,6 +373,8 @@ class Loader(core.SimpleLoader):
         ------
         pymotifs.core.InvalidState
             If there is no grouping produced.
+        pymotifs.core.Skip
+            If every pair in every group has already been compared.
 
         Returns
         -------
@@ -185,47 +383,10 @@ class Loader(core.SimpleLoader):
         """
 
 
-        GeneratePickleFiles = False   # appropriate to use when debugging the rest of the program
-        GeneratePickleFiles = True    # must be used in production, to update the files each week
-
-        if GeneratePickleFiles:
-            # query and write to disk unit correspondence data once per run of chain_chain/comparison.py
-            # takes about 10 minutes total
-            self.logger.info('Getting the unit_id to experimental sequence position table')
-            with self.session() as session:
-                EM = mod.ExpSeqUnitMapping
-                query = session.query(EM.unit_id,EM.exp_seq_position_id).select_from(EM)
-
-                unit_to_position = {}      # will be a dictionary of dictionaries
-                count = 0
-                for r in query:
-                    if r.unit_id and "|" in r.unit_id:    # not sure why, but some rows have None
-                        fields = r.unit_id.split("|")
-                        if len(fields) > 3:
-                            key = "|".join(fields[0:3])   # pdb id, model, chain is the top level key
-                            if not key in unit_to_position:
-                                unit_to_position[key] = {}
-                            unit_to_position[key][r.unit_id] = r.exp_seq_position_id
-                            count += 1
-                self.logger.info('Got %d unit to position mappings' % count)
-                pickle.dump(unit_to_position, open("unit_to_position.pickle", "wb" ), 2)
-                self.logger.info('Wrote pickle file unit_to_position.pickle')
-
-            self.logger.info('Getting the position to position mappings')
-            with self.session() as session:
-                CP = mod.CorrespondencePositions
-                query = session.query(CP.exp_seq_position_id_1,CP.exp_seq_position_id_2).select_from(CP)
-
-                count = 0
-                position_to_position = defaultdict(list)
-                for r in query:
-                    position_to_position[r.exp_seq_position_id_1].append(r.exp_seq_position_id_2)
-                    count += 1
-                self.logger.info('Got %d position to position correspondences' % count)
-                pickle.dump(position_to_position, open("position_to_position.pickle", "wb" ), 2)
-                self.logger.info('Wrote pickle file position_to_position.pickle')
-
-
+        # bring the index of unit positions and position correspondences up
+        # to date, this only adds new structures and correspondences
+        self.update_positions(pdbs, **kwargs)
+        self.update_pairs(pdbs, **kwargs)
 
 
         # to speed things up when debugging, return this (first,seconds) list for T.th. LSU
@@ -285,7 +446,11 @@ class Loader(core.SimpleLoader):
         # start with the largest group
         groups_of_chain_ids.sort(key=len,reverse=True)
 
-        return groups_of_chain_ids
+        # skip groups where every pair has already been compared
+        selected = self.plan(groups_of_chain_ids, **kwargs)
+        if groups_of_chain_ids and not selected:
+            raise core.Skip("All pairs of chains have been compared")
+        return selected
 
 
     def is_missing(self, entry, **kwargs):
@@ -537,31 +702,29 @@ class Loader(core.SimpleLoader):
         return OK_pairs
 
 
-    def load_centers_rotations_pickle(self,info,allunitdictionary):
+    def load_centers_rotations(self,info,allunitdictionary):
+        """
+        Add the centers and rotations of all units in the chains of an IFE to
+        the dictionary of known units, reading each chain from the unit
+        geometry store once. The values are views of the stored arrays.
+        """
 
         for chain_string in info['ife_id'].split('+'):
-            picklefile = 'pickle-FR3D/' + chain_string.replace('|','-') + '_RNA.pickle'
 
             if not chain_string in allunitdictionary:
 
-                try:
-                    unit_ids, chainIndices, centers, rotations = pickle.load(open(picklefile,"rb"))
-
-                    allunitdictionary[chain_string] = True    # note that this chain was read
+                data = self.geometry.chain(chain_string)
+                if data is None:
+                    self.logger.info("Could not find geometry of %s " % chain_string)
+                    continue
 
-                    # add center, rotation pairs to the dictionary according to unit id
-                    for i in range(0,len(unit_ids)):
-                        if len(centers[i]) == 3 and len(rotations[i]) == 3:
-                            allunitdictionary[unit_ids[i]] = (centers[i],rotations[i])
-                        else:
-                            self.logger.info("Trouble with center/rotation for %s" % unit_ids[i])
-                            self.logger.info(str(centers[i]))
-                            self.logger.info(str(rotations[i]))
+                allunitdictionary[chain_string] = True    # note that this chain was read
 
-                    self.logger.info('load_centers_rotations_pickle: Loaded %s' % chain_string)
+                unit_ids, chainIndices, centers, rotations = data
+                for i in range(0,len(unit_ids)):
+                    allunitdictionary[unit_ids[i]] = (centers[i],rotations[i])
 
-                except:
-                    self.logger.info("Could not read pickle file %s " % picklefile)
+                self.logger.info('load_centers_rotations: Loaded %s' % chain_string)
 
         return allunitdictionary
 
@@ -881,6 +1044,34 @@ class Loader(core.SimpleLoader):
                 disc = -1
 
 
+        return self.discrepancy_entries(info1, info2, corr_id, disc, len(c1))
+
+    def discrepancy_entries(self, info1, info2, corr_id, disc, count):
+        """
+        Create the data to store for the discrepancy between two chains, in
+        both orders.
+
+        Parameters
+        ----------
+        info1 : dict
+            The first chain.
+        info2 : dict
+            The second chain.
+        corr_id : int
+            The correspondence id.
+        disc : float
+            The discrepancy, -1 if it could not be computed.
+        count : int
+            The number of matched nucleotides.
+
+        Returns
+        -------
+        entries : list
+            A list of two dictonaries with keys `chain_id_1`, `chain_id_2`,
+            `model_1`, `model_2`, `correspondence_id`, `discrepancy` and
+            `num_nucleotides`.
+        """
+
         entry1 = {
             'chain_id_1': info1['chain_id'],
             'chain_id_2': info2['chain_id'],
@@ -888,7 +1079,7 @@ class Loader(core.SimpleLoader):
             'model_2': info2['model'],
             'correspondence_id': corr_id,
             'discrepancy': float(disc),
-            'num_nucleotides': len(c1)
+            'num_nucleotides': count
         }
 
         entry2 = {
@@ -898,16 +1089,40 @@ class Loader(core.SimpleLoader):
             'model_2': info1['model'],
             'correspondence_id': corr_id,
             'discrepancy': float(disc),
-            'num_nucleotides': len(c1)
+            'num_nucleotides': count
         }
 
         return [entry1, entry2]
 
+    def stored_pairs(self, chain_ids):
+        """Find the pairs of the given chains which have a discrepancy in the
+        database, with one query.
+
+        Parameters
+        ----------
+        chain_ids : list
+            The chain ids of a group.
+
+        Returns
+        -------
+        pairs : set
+            The (first, second) pairs of chain ids, with first < second.
+        """
+
+        sim = mod.ChainChainSimilarity
+        with self.session() as session:
+            query = session.query(sim.chain_id_1, sim.chain_id_2).\
+                filter(sim.chain_id_1.in_(chain_ids)).\
+                filter(sim.chain_id_2.in_(chain_ids))
+            return set((min(r.chain_id_1, r.chain_id_2),
+                        max(r.chain_id_1, r.chain_id_2)) for r in query)
+
     def data(self, chain_ids, **kwargs):
         """
         New in December 2020.
         Compute all chain to chain discrepancies in the given group.
-        Loop over all pairs of chain ids in this group.
+        Loop over all pairs of chain ids in this group which the pair index
+        does not list as compared and which have no stored discrepancy.
 
         This will get all
         corresponding chains to chain alignment for all chains in this pdb and
@@ -929,45 +1144,47 @@ class Loader(core.SimpleLoader):
         self.logger.info("data: Computing discrepancies for a group of %d chains" % L)
         self.logger.info("data: %d discrepancies needed in this group" % (L*(L-1)/2))
 
-        # from the list of chain_ids, find all pairs that already have a discrepancy computed
-        self.logger.info("data: Finding existing discrepancy data")
-        sim = mod.ChainChainSimilarity
-        with self.session() as session:
-            query = session.query(sim).\
-                filter(or_(and_(sim.chain_id_1.in_(chain_ids),sim.chain_id_2.in_(chain_ids))))
-
-            already_computed = []
-            already_computed_discrepancy = []
-            for r in query:
-                already_computed.append((r.chain_id_1,r.chain_id_2))
-                already_computed_discrepancy.append((r.chain_id_1,r.chain_id_2,r.discrepancy))
-        self.logger.info("data: Found %d discrepancy values already calculated" % (len(already_computed)/2))
-
-        # retrieve chain information for all chains once and store the data
+        # find the pairs in this group which have not been compared, using
+        # the index of compared pairs instead of querying for discrepancies
+        self.logger.info("data: Finding pairs which have not been compared")
+        missing = self.pairs.missing(chain_ids)
+
+        # pairs which were stored by a run that stopped before recording
+        # them in the index must not be inserted again
+        if missing:
+            stored = self.stored_pairs(chain_ids)
+            found = [pair for pair in missing if pair in stored]
+            if found:
+                self.logger.info("data: Found %d stored pairs missing from the index" % len(found))
+                if not kwargs.get('dry_run'):
+                    self.pairs.add_pairs(found)
+                missing = [pair for pair in missing if pair not in stored]
+        self.logger.info("data: Found %d discrepancy values already calculated" % (L*(L-1)/2 - len(missing)))
+
+        # retrieve chain information once for each chain in a missing pair
         # 50 seconds for T.th. SSU on rnatest in December 2020
         self.logger.info("data: Retrieving chain information once for each chain")
         chain_info = {}
-        for chain_id in chain_ids:
+        for chain_id in sorted(set(c for pair in missing for c in pair)):
             chain_info[chain_id] = self.info(chain_id)
 
-        # loop over pairs of chain ids in this group, skipping those that already have discrepancy calculated, look up corr_id
+        # loop over the missing pairs of chain ids in this group and look up corr_id
         # This took about 10 minutes on the T.th. SSU group of 451 chains on rnatest in December 2020,
         # possibly the slowest part of this whole procedure.  That is partly because there were 44,000
         # discrepancies to be calculated.  It is certainly because of the database query here.
+        # Pairs without a correspondence are recorded as compared along with
+        # the computed ones once this group is stored.
         self.logger.info("data: Organizing pairs of chains that need to be computed")
         required_pairs = []
-        for chain1_id in chain_ids:
-            info1 = chain_info[chain1_id]
-            for chain2_id in chain_ids:
-                info2 = chain_info[chain2_id]
-                if chain1_id < chain2_id and not (chain1_id, chain2_id) in already_computed:
-                    corr_id = self.corr_id(chain1_id, chain2_id)
-                    if corr_id is None:
-                        self.logger.info("data: No correspondence id between %s and %s" % (info1['ife_id'],info2['ife_id']))
-                        # Note: cannot store a discrepancy with a null correspondence id
-                    else:
-                        required_pairs.append((corr_id,chain1_id,chain2_id))
+        for (chain1_id, chain2_id) in missing:
+            corr_id = self.corr_id(chain1_id, chain2_id)
+            if corr_id is None:
+                self.logger.info("data: No correspondence id between %s and %s" % (chain_info[chain1_id]['ife_id'],chain_info[chain2_id]['ife_id']))
+                # Note: cannot store a discrepancy with a null correspondence id
+            else:
+                required_pairs.append((corr_id,chain1_id,chain2_id))
         self.logger.info("data: Found %d discrepancy values needing to be calculated" % len(required_pairs))
+        self._compared[tuple(chain_ids)] = missing
 
 
 
@@ -977,14 +1194,20 @@ class Loader(core.SimpleLoader):
 
         # check to see that we get the same discrepancy as before for some cases
         # this is for debugging; generally the program will be run with Recompute = False
-        if Recompute and len(already_computed_discrepancy) > 0:
-            # takes about 44 seconds on rnatest in December 2020
-            self.logger.info("Loading unit to position correspondences")
-            unit_to_position = pickle.load(open("unit_to_position.pickle","rb"))
+        if Recompute:
+            sim = mod.ChainChainSimilarity
+            with self.session() as session:
+                query = session.query(sim).\
+                    filter(and_(sim.chain_id_1.in_(chain_ids),sim.chain_id_2.in_(chain_ids)))
+                already_computed_discrepancy = [(r.chain_id_1,r.chain_id_2,r.discrepancy) for r in query]
+            for chain_id in chain_ids:
+                if chain_id not in chain_info:
+                    chain_info[chain_id] = self.info(chain_id)
 
-            # takes about 45 seconds on rnatest in December 2020
-            self.logger.info("Loading position to position correspondences")
-            position_to_position = pickle.load(open("position_to_position.pickle","rb"))
+        if Recompute and len(already_computed_discrepancy) > 0:
+            # positions of units are loaded one structure at a time as needed
+            unit_to_position = self.positions.units
+            position_to_position = self.positions.correspondences
 
             # Loop over needed pairs of chains, query for unit correspondences, and calculate discrepancies
             # The slowest part of the process is the query for unit correspondences.
@@ -1027,8 +1250,8 @@ class Loader(core.SimpleLoader):
                             self.logger.info("data: Matched %s and %s" % unit_pairs[i])
 
                         # load center and rotation data for the current ifes, if not already loaded
-                        allunitdictionary = self.load_centers_rotations_pickle(info1,allunitdictionary)
-                        allunitdictionary = self.load_centers_rotations_pickle(info2,allunitdictionary)
+                        allunitdictionary = self.load_centers_rotations(info1,allunitdictionary)
+                        allunitdictionary = self.load_centers_rotations(info2,allunitdictionary)
 
 
                     # gather matching centers and rotations for these chains
@@ -1051,75 +1274,206 @@ class Loader(core.SimpleLoader):
 
         if not Recompute and len(required_pairs) > 0:
 
-            # takes about 44 seconds on rnatest in December 2020
-            self.logger.info("Loading unit to position correspondences")
-            unit_to_position = pickle.load(open("unit_to_position.pickle","rb"))
-
-            # takes about 45 seconds on rnatest in December 2020
-            self.logger.info("Loading position to position correspondences")
-            position_to_position = pickle.load(open("position_to_position.pickle","rb"))
+            # positions of units are loaded one structure at a time as needed
+            unit_to_position = self.positions.units
+            position_to_position = self.positions.correspondences
+
+            # Group the needed pairs by their first chain, which are in order
+            # already, and split these groups across worker processes. Each
+            # worker finds the matching units, loads their centers and
+            # rotations and calculates the discrepancies of a whole group at
+            # once. Results come back in the order of required_pairs, whatever
+            # the number of workers.
+            tasks = []
+            for (corr_id,chain1_id,chain2_id) in required_pairs:
+                if not tasks or tasks[-1][0] != chain1_id:
+                    tasks.append((chain1_id, []))
+                tasks[-1][1].append((corr_id, chain2_id))
+
+            self._context = {
+                'chain_info': chain_info,
+                'unit_to_position': unit_to_position,
+                'position_to_position': position_to_position,
+            }
+            jobs = self.workers(**kwargs)
+            self.logger.info("data: Computing %d discrepancies with %d workers" % (len(required_pairs),jobs))
 
-            # Loop over needed pairs of chains, query for unit correspondences, and calculate discrepancies
-            # The slowest part of the process is the query for unit correspondences.
-            # One hope was that querying by corr_id and the two chains and then narrowing down to the desired
-            # PDBs would be faster than doing them individually, but that is sometimes much slower.
+            try:
+                current = 0
+                compared = parallel.map_in_pool(self, self.compare, tasks, jobs)
+                for discrepancies in compared:
+                    current += len(discrepancies) / 2
+                    self.logger.info("data: Computed discrepancy %d of %d for this group" % (current,len(required_pairs)))
+                    for d in discrepancies:
+                        yield d
+            finally:
+                self._context = {}
+
+    def mark_processed(self, chain_ids, dry_run=False, **kwargs):
+        """Record that all missing pairs of a group have been compared, once
+        their discrepancies have been stored. This includes the pairs which
+        have no correspondence, so they are not looked up again.
 
-            allunitdictionary = defaultdict()            # store up centers and rotations
+        Parameters
+        ----------
+        chain_ids : list
+            The chain ids of the group.
+        dry_run : bool, optional
+            If true nothing is recorded.
+        """
 
-            current = 1
-            chain1_seen = set()                          # count how many times a specific chain1 is seen
-            for (corr_id,chain1_id,chain2_id) in required_pairs:
+        compared = self._compared.pop(tuple(chain_ids), [])
+        if dry_run:
+            self.logger.debug("Marking %d pairs as compared", len(compared))
+            return
+        self.pairs.add_pairs(compared)
+        self.logger.info("Recorded %d compared pairs", len(compared))
 
-                self.logger.info("data: Computing discrepancy %d of %d for this group" % (current,len(required_pairs)))
-                current += 1
+    def workers(self, jobs=1, **kwargs):
+        """
+        Determine the number of worker processes to compute discrepancies
+        with. This is the number of jobs requested when running the stage,
+        or if that is 1 the 'jobs' entry of the 'chain_chain' section of the
+        configuration.
+        """
 
-                chain1_seen.add(chain1_id)
-                if len(chain1_seen) > 20:
-                    chain1_seen = set()
-                    allunitdictionary = defaultdict()    # avoid accumulating data forever; reset sometimes
+        if jobs and int(jobs) > 1:
+            return int(jobs)
+        return max(1, int(self.config['chain_chain'].get('jobs', 1)))
 
-                info1 = chain_info[chain1_id]
-                info2 = chain_info[chain2_id]
+    def matched_rows(self, unit_pairs, geometry1, geometry2):
+        """
+        Find the rows of the stored centers and rotations of each pair of
+        matching units, skipping pairs where either unit has no stored data.
+        Like gather_matching_centers_rotations this complains about units
+        which are matched more than once.
 
-                # will need to recognize multiple chains for IFEs made of more than one chain; currently only 1st chain is used
+        Returns
+        -------
+        rows : tuple
+            Two integer arrays of the rows of the units in the first and
+            second structure.
+        """
 
-                # new method
-                self.logger.info("data: Intersect for matching units for chain %s, chain %s" % (info1['ife_id'],info2['ife_id']))
-                unit_pairs = self.get_unit_correspondences_intersect(info1,info2,unit_to_position,position_to_position)
+        rows1 = []
+        rows2 = []
+        seen = set()
+        for (unit1,unit2) in unit_pairs:
+            if unit1 in seen:
+                raise core.InvalidState("matched_rows: Got duplicate unit1 %s" % unit1)
+            seen.add(unit1)
 
-                # filter out units with wrong symmetry or alt id
-                unit_pairs = self.filter_unit_correspondences(unit_pairs,info1,info2)
+            if unit2 in seen:
+                raise core.InvalidState("matched_rows: Got duplicate unit2 %s" % unit2)
+            seen.add(unit2)
 
-                """
-                # old method
-                self.logger.info("data: Query for matching units for chain %s, chain %s" % (info1['ife_id'],info2['ife_id']))
-                old_unit_pairs = self.get_unit_correspondences(corr_id,info1,info2)
+            if geometry1 is not None and geometry2 is not None and \
+                    unit1 in geometry1 and unit2 in geometry2:
+                rows1.append(geometry1.index[unit1])
+                rows2.append(geometry2.index[unit2])
 
-                # filter out units with wrong symmetry or alt id
-                old_unit_pairs = self.filter_unit_correspondences(old_unit_pairs,info1,info2)
-                self.logger.info("data: Found %d unit id pairs for chain %s chain %s" % (len(unit_pairs),info1['ife_id'],info2['ife_id']))
+        return np.array(rows1, dtype=int), np.array(rows2, dtype=int)
 
-                self.compare_list_of_pairs(old_unit_pairs,unit_pairs)
-                """
+    def batch_discrepancies(self, geometry1, matched):
+        """
+        Compute the discrepancies between one chain and several others with
+        the batched kernel. The matched units are stacked into arrays padded
+        to the largest number of matches, `batch_size` pairs at a time.
 
+        Parameters
+        ----------
+        geometry1 : pymotifs.utils.unit_geometry.UnitGeometry
+            The stored data of the structure of the first chain.
+        matched : list
+            A tuple for each other chain, of its stored data and the rows of
+            the matched units from matched_rows.
 
-                # show some matched units to build confidence
-                if len(unit_pairs) > 0:
-                    for i in range(0,min(5,len(unit_pairs))):
-                        self.logger.info("data: Matched %s and %s" % unit_pairs[i])
+        Returns
+        -------
+        discrepancies : numpy.ndarray
+            The discrepancy with each other chain, NaN if nothing matched.
+        """
 
-                    # load center and rotation data for the current ifes, if not already loaded
-                    allunitdictionary = self.load_centers_rotations_pickle(info1,allunitdictionary)
-                    allunitdictionary = self.load_centers_rotations_pickle(info2,allunitdictionary)
+        discrepancies = np.zeros(len(matched))
+        for start in range(0, len(matched), self.batch_size):
+            batch = matched[start:start + self.batch_size]
+            size = max(len(rows1) for _, rows1, _ in batch)
+            c1 = np.zeros((len(batch), size, 3))
+            c2 = np.zeros((len(batch), size, 3))
+            r1 = np.zeros((len(batch), size, 3, 3))
+            r2 = np.zeros((len(batch), size, 3, 3))
+            mask = np.zeros((len(batch), size), dtype=bool)
+            for index, (geometry2, rows1, rows2) in enumerate(batch):
+                count = len(rows1)
+                if not count:
+                    continue
+                c1[index, :count] = geometry1.centers[rows1]
+                r1[index, :count] = geometry1.rotations[rows1]
+                c2[index, :count] = geometry2.centers[rows2]
+                r2[index, :count] = geometry2.rotations[rows2]
+                mask[index, :count] = True
+
+            discrepancies[start:start + len(batch)] = \
+                disc.batch_matrix_discrepancy(c1, r1, c2, r2, mask=mask)
+
+        return discrepancies
+
+    def compare(self, task):
+        """
+        Compute the discrepancies between one chain and a list of other
+        chains. This runs in a worker process when there are several workers,
+        using the chain information and position mappings that data set up
+        before forking. The matched units of all pairs are found first and
+        then all discrepancies are computed together.
 
-                # gather matching centers and rotations for these chains
-                [c1, c2, r1, r2] = self.gather_matching_centers_rotations(unit_pairs,allunitdictionary)
-                self.logger.info("data: Gathered matching centers and rotations")
+        Parameters
+        ----------
+        task : tuple
+            The first chain id and a list of the correspondence id and chain
+            id of each chain to compare it to.
 
-                # compute the discrepancy between these IFEs
-                # if wrong numbers of matched nucleotides, discrepancy will be -1
-                discrepancies = self.calculate_discrepancy(info1, info2, corr_id, c1, c2, r1, r2)
+        Returns
+        -------
+        entries : list
+            The two dictionaries produced by discrepancy_entries for each
+            pair, in the given order.
+        """
 
-                self.logger.info("data: Discrepancy to load: %s" % discrepancies[0])
-                for d in discrepancies:
-                    yield mod.ChainChainSimilarity(**d)
+        chain1_id, others = task
+        chain_info = self._context['chain_info']
+        info1 = chain_info[chain1_id]
+        geometry1 = self.geometry.load(info1['ife_id'].split('|')[0])
+
+        matched = []
+        for (corr_id, chain2_id) in others:
+            info2 = chain_info[chain2_id]
+
+            # will need to recognize multiple chains for IFEs made of more than one chain; currently only 1st chain is used
+            self.logger.info("data: Intersect for matching units for chain %s, chain %s" % (info1['ife_id'],info2['ife_id']))
+            unit_pairs = self.get_unit_correspondences_intersect(info1,info2,
+                                                                 self._context['unit_to_position'],
+                                                                 self._context['position_to_position'])
+
+            # filter out units with wrong symmetry or alt id
+            unit_pairs = self.filter_unit_correspondences(unit_pairs,info1,info2)
+
+            geometry2 = self.geometry.load(info2['ife_id'].split('|')[0])
+            rows1, rows2 = self.matched_rows(unit_pairs, geometry1, geometry2)
+            matched.append((geometry2, rows1, rows2))
+
+        discrepancies = self.batch_discrepancies(geometry1, matched)
+
+        # if wrong numbers of matched nucleotides, discrepancy will be -1
+        entries = []
+        for (corr_id, chain2_id), (_, rows1, _), value in zip(others, matched, discrepancies):
+            info2 = chain_info[chain2_id]
+            if len(rows1) < 3:
+                self.logger.warning("Too few matched nucleotides to compute discrepancy for %s %s, using magic values instead" %
+                                      (info1['name'], info2['name']))
+                value = -1
+            elif np.isnan(value):
+                self.logger.warning("Could not compute discrepancy for %s %s, using magic values instead" %
+                                    (info1['name'], info2['name']))
+                value = -1
+            entries.extend(self.discrepancy_entries(info1, info2, corr_id, value, len(rows1)))
+        return entries
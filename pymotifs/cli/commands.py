@@ -28,6 +28,7 @@ from pymotifs import config as conf
 from pymotifs import transfer as _transfer
 from pymotifs.version import __VERSION__
 from pymotifs.dispatcher import Dispatcher
+from pymotifs.core.cache import CacheStore
 
 from pymotifs.skip_files import SKIP
 
@@ -95,6 +96,8 @@ def run(ctx, name, ids, config=None, engine=None, **kwargs):
         logging.exception(error)
         ctx.exit(1)
     finally:
+        if dispatcher.profiler.stages:
+            click.echo(dispatcher.profiler.table(), err=True)
         if kwargs['email']:
             mailer(name, ids=ids, error=error, **kwargs)
 
@@ -159,6 +162,21 @@ def cli(ctx, **options):
               help='Define a variable')
 @click.option('--comp-limit', type=int, help='Set maximum group size for discrepancy calcuations')
 @click.option('--data-limit', type=int, help='Maximum number of discrepancy calculations per group')
+@click.option('--jobs', default=1, type=click.IntRange(min=1),
+              help='Number of processes to use for each stage')
+@click.option('--explain', is_flag=True, default=False,
+              help='Log which chain to chain comparisons are skipped')
+@click.option('--concurrent-stages', default=1, type=click.IntRange(min=1),
+              help='Number of independent stages to run at once')
+@click.option('--stage-mode', default='thread',
+              type=click.Choice(['thread', 'process']),
+              help='Run concurrent stages in threads or processes')
+@click.option('--timings', type=click.Path(dir_okay=False, resolve_path=True),
+              help='File to append JSON lines of stage and entry timings to')
+@click.option('--profile', is_flag=True, default=False,
+              help='Profile each entry and dump the slowest with cProfile')
+@click.option('--profile-slowest', default=5, type=click.IntRange(min=1),
+              help='Number of slowest entries to keep profiles of')
 @click.argument('name')
 @click.argument('ids', nargs=-1, type=PDB)
 @click.pass_context
@@ -635,3 +653,87 @@ def transfer_chain_chain_import(ctx, **kwargs):
     """
     kwargs.update(ctx.parent.objs)
     _transfer.chain_chain.load(**kwargs)
+
+
+@cli.group(short_help='Inspect and prune cached data')
+@click.pass_context
+def cache(ctx):
+    """Inspect and prune the data that stages cache for later stages, such as
+    NR groupings and clustered motifs.
+    """
+    ctx.objs = ctx.parent.objs
+    config = ctx.objs['config']
+    ctx.objs['cache_store'] = CacheStore(
+        config['locations']['cache'],
+        max_size=config['cache'].get('max_size'),
+        compressed=config['cache'].get('compressed', False))
+
+
+def format_entries(entries):
+    """Format the metadata of cache entries as rows for a table.
+    """
+
+    def when(value):
+        return datetime.fromtimestamp(value).strftime('%Y-%m-%d %H:%M')
+
+    rows = [('Name', 'Creator', 'Input', 'Size (MB)', 'Created', 'Used')]
+    for entry in entries:
+        rows.append((entry['name'],
+                     entry['creator'] or '-',
+                     (entry.get('fingerprint') or '-')[:10],
+                     '%.1f' % (entry['size'] / 1024.0 ** 2),
+                     when(entry['created']),
+                     when(entry['accessed'])))
+    return rows
+
+
+@cache.command('ls', short_help='List cached data')
+@click.pass_context
+def cache_ls(ctx):
+    """List all cached data, along with which stage created it, the start of
+    the fingerprint of its input, its size and when it was created and last
+    used.
+    """
+    store = ctx.parent.objs['cache_store']
+    entries = store.entries()
+    for row in format_entries(entries):
+        click.echo('%-40s %-20s %-10s %10s %17s %17s' % row)
+    total = sum(e['size'] for e in entries)
+    click.echo("%i entries, %.1f MB" % (len(entries), total / 1024.0 ** 2))
+
+
+@cache.command('prune', short_help='Remove cached data')
+@click.option('--max-size', type=float, default=None,
+              help='Remove least recently used data above this many MB')
+@click.option('--older-than', type=float, default=None,
+              help='Remove data not used in this many days')
+@click.option('--name', multiple=True, help='Remove data with this name')
+@click.pass_context
+def cache_prune(ctx, max_size=None, older_than=None, name=None):
+    """Remove cached data. This can remove entries by name, entries which
+    have not been used recently, and the least recently used entries until
+    the cache is below a given size. Without options this uses the
+    configured maximum size.
+    """
+    store = ctx.parent.objs['cache_store']
+    for entry in name:
+        if not store.evict(entry):
+            click.secho("No cached data named %s" % entry, err=True,
+                        fg='red')
+
+    if max_size is not None:
+        max_size = int(max_size * 1024 ** 2)
+    elif older_than is None and not name:
+        max_size = store.max_size
+
+    if older_than is not None:
+        older_than = older_than * 24 * 60 * 60
+
+    if max_size is None and older_than is None:
+        return
+
+    removed = store.prune(max_size=max_size, older_than=older_than)
+    for entry in removed:
+        click.echo("Removed %s" % entry['name'])
+    click.echo("Removed %i entries, %.1f MB" %
+               (len(removed), sum(e['size'] for e in removed) / 1024.0 ** 2))
@@ -78,6 +78,23 @@ def defaults():
             'quality_reports': os.path.join(base, "MotifAtlas", 'quality',
                                             'validation-reports'),
             "pickle_fr3d": os.path.join(base, "pickle-FR3D"),
+            "unit_geometry": os.path.join(base, "pickle-FR3D", "units"),
+        },
+        'cache': {
+            'max_size': None,
+            'compressed': False,
+        },
+        'structure_cache': {
+            'max_size': 512 * 1024 ** 2,
+            'persistent': False,
+        },
+        'chain_chain': {
+            'jobs': 1,
+        },
+        'profile': {
+            'timings': None,
+            'directory': 'profiles',
+            'slowest': 5,
         },
         'recaculate': collections.defaultdict(lambda: False)
     }
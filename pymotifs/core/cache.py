@@ -0,0 +1,727 @@
+"""This contains caches which let stages share work. There is a cache of
+parsed structures, so that all stages in a single run of the pipeline can
+reuse the parsed mmCIF files instead of parsing them again, and an on disk
+store of parsed structures, so that later runs can skip parsing entirely.
+There is also the store of data that stages cache for later stages, such as
+NR groupings and clustered motifs.
+"""
+
+import os
+import gzip
+import json
+import time
+import pickle
+import shutil
+import hashlib
+import logging
+import tempfile
+import threading
+import collections as coll
+
+import numpy as np
+
+from fr3d.data import Atom
+from fr3d.data import Component
+from fr3d.data import Structure
+
+
+class StructureCache(object):
+    """A least recently used cache of parsed structures. Entries are keyed by
+    the filename and the modification time of the file they were parsed
+    from, so an updated file is parsed again. Each entry can hold several
+    objects built from the same file, such as the `fr3d.cif.reader.Cif` and
+    the `fr3d.data.Structure`. The memory used is bounded by the total
+    estimated size of the cached objects, see `estimate`, since parsed
+    objects are many times larger than the files they come from. This is
+    safe to share between threads.
+
+    Attributes
+    ----------
+    max_size : int
+        The maximum total estimated size, in bytes, of the cached objects.
+    size : int
+        The current total estimated size, in bytes, of the cached objects.
+    hits : int
+        The number of lookups which were found in the cache.
+    misses : int
+        The number of lookups which had to build the object.
+    evictions : int
+        The number of files removed from the cache to stay below max_size.
+    """
+
+    atom_size = 1024
+    """Estimated bytes used by each atom of a parsed structure, including its
+    share of the residue it belongs to"""
+
+    parsed_factor = 10
+    """Estimated ratio of the size of other parsed objects, like a `Cif`, to
+    the size of the file they were parsed from"""
+
+    def __init__(self, max_size):
+        """Create a new StructureCache.
+
+        Parameters
+        ----------
+        max_size : int
+            The maximum total estimated size, in bytes, of the cached
+            objects.
+        """
+
+        self.max_size = max_size
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.logger = logging.getLogger('core.StructureCache')
+        self._entries = coll.OrderedDict()
+        self._sizes = {}
+        self._lock = threading.RLock()
+
+    def _remove(self, key):
+        self._entries.pop(key)
+        self.size -= self._sizes.pop(key)
+
+    def _evict(self):
+        while self.size > self.max_size and self._entries:
+            key = next(iter(self._entries))
+            self.logger.debug("Evicting %s from structure cache", key[0])
+            self._remove(key)
+            self.evictions += 1
+
+    def estimate(self, value, file_size):
+        """Estimate the memory used by a parsed object. A `Structure` is
+        estimated from its number of atoms, anything else from the size of
+        the file it was parsed from.
+
+        Parameters
+        ----------
+        value : object
+            The parsed object.
+        file_size : int
+            The size, in bytes, of the file it was parsed from.
+
+        Returns
+        -------
+        size : int
+            The estimated size in bytes.
+        """
+
+        if isinstance(value, Structure):
+            return len(value.coordinates()) * self.atom_size
+        return file_size * self.parsed_factor
+
+    def fetch(self, filename, kind, build):
+        """Get an object built from a file, building it if needed.
+
+        Parameters
+        ----------
+        filename : str
+            The file the object is built from.
+        kind : str
+            The kind of object, for example 'cif' or 'structure'.
+        build : function
+            A function of no arguments which builds the object.
+
+        Returns
+        -------
+        value : object
+            The cached or newly built object.
+        """
+
+        info = os.stat(filename)
+        key = (filename, info.st_mtime)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and kind in entry:
+                self._entries[key] = self._entries.pop(key)
+                self.hits += 1
+                return entry[kind]
+            self.misses += 1
+
+        value = build()
+        size = self.estimate(value, info.st_size)
+        if size > self.max_size:
+            return value
+
+        with self._lock:
+            for old in [k for k in self._entries if k[0] == filename]:
+                if old != key:
+                    self._remove(old)
+
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                entry = {}
+                self._sizes[key] = 0
+            if kind not in entry:
+                self._sizes[key] += size
+                self.size += size
+            entry[kind] = value
+            self._entries[key] = entry
+            self._evict()
+        return value
+
+    def clear(self):
+        """Remove all entries from the cache. This does not reset the
+        counters.
+        """
+
+        with self._lock:
+            self._entries.clear()
+            self._sizes.clear()
+            self.size = 0
+
+    def log_stats(self):
+        """Log the counters of this cache.
+        """
+        self.logger.info("Structure cache: %i hits, %i misses, %i evictions",
+                         self.hits, self.misses, self.evictions)
+
+
+class ParsedStructureStore(object):
+    """An on disk store of parsed structures. For each PDB this stores the
+    atoms of the `fr3d.data.Structure` parsed from its mmCIF file as NumPy
+    arrays, which are memory mapped when loading. A structure can be rebuilt
+    from these much faster than parsing the mmCIF text again. Entries are
+    keyed by the checksum of the mmCIF file, so a changed file is never
+    loaded from an old entry.
+
+    The layout of the entry for a file is a directory named by PDB and
+    checksum containing:
+
+    coordinates.npy
+        A float64 N x 3 array of the coordinates of all atoms.
+    atom_residue.npy
+        An int32 array giving the index of the residue of each atom.
+    atom_fields.npy
+        An int32 N x len(ATOM_FIELDS) array of indexes into values.
+    residue_fields.npy
+        An int32 R x len(RESIDUE_FIELDS) array of indexes into values.
+    values.json
+        The list of distinct metadata values, and the PDB id.
+
+    Building a `Component` may add atoms, such as inferred hydrogens, which
+    would then be stored and added again when loading. If a loaded structure
+    does not have the same number of atoms as was stored, it is not used and
+    the store is disabled.
+
+    Attributes
+    ----------
+    location : str
+        The directory to store parsed structures in.
+    usable : bool
+        False if loading has produced a structure unlike the stored one.
+    """
+
+    """Attributes of each `Component` which are stored."""
+    RESIDUE_FIELDS = ('pdb', 'model', 'chain', 'sequence', 'number',
+                      'insertion_code', 'alt_id', 'symmetry', 'type',
+                      'polymeric', 'index')
+
+    """Attributes of each `Atom` which are stored."""
+    ATOM_FIELDS = ('name', 'group', 'type', 'alt_id')
+
+    """Attributes of each `Atom` which are taken from its `Component`."""
+    ATOM_RESIDUE_FIELDS = (
+        ('pdb', 'pdb'),
+        ('model', 'model'),
+        ('chain', 'chain'),
+        ('component_id', 'sequence'),
+        ('component_number', 'number'),
+        ('component_index', 'index'),
+        ('insertion_code', 'insertion_code'),
+        ('symmetry', 'symmetry'),
+        ('polymeric', 'polymeric'),
+    )
+
+    def __init__(self, location):
+        """Create a new ParsedStructureStore.
+
+        Parameters
+        ----------
+        location : str
+            The directory to store parsed structures in.
+        """
+        self.location = location
+        self.usable = True
+        self.logger = logging.getLogger('core.ParsedStructureStore')
+
+    def checksum(self, filename):
+        """Compute the checksum of a file.
+        """
+
+        md5 = hashlib.md5()
+        with open(filename, 'rb') as raw:
+            for block in iter(lambda: raw.read(2 ** 20), b''):
+                md5.update(block)
+        return md5.hexdigest()
+
+    def directory(self, filename, checksum=None):
+        """Compute the directory of the entry for the given mmCIF file.
+        """
+
+        name = os.path.splitext(os.path.basename(filename))[0].upper()
+        checksum = checksum or self.checksum(filename)
+        return os.path.join(self.location, name, checksum)
+
+    def load(self, filename, checksum=None):
+        """Load the structure parsed from the given file. If there is no
+        entry for the file or it cannot be loaded, None is returned.
+
+        Parameters
+        ----------
+        filename : str
+            The mmCIF file the structure was parsed from.
+        checksum : str, optional
+            The checksum of the file, if already known.
+
+        Returns
+        -------
+        structure : fr3d.data.Structure
+            The structure or None.
+        """
+
+        path = self.directory(filename, checksum=checksum)
+        if not self.usable or not os.path.isdir(path):
+            return None
+
+        try:
+            return self._load(path)
+        except Exception as err:
+            self.logger.warning("Could not load parsed structure in %s", path)
+            self.logger.exception(err)
+            return None
+
+    def _load(self, path):
+        def array(name):
+            return np.load(os.path.join(path, name + '.npy'), mmap_mode='r')
+
+        with open(os.path.join(path, 'values.json'), 'rb') as raw:
+            stored = json.load(raw)
+        values = [str(v) if isinstance(v, unicode) else v
+                  for v in stored['values']]
+        values.append(None)
+
+        coordinates = array('coordinates')
+        atom_residue = array('atom_residue')
+        atom_fields = array('atom_fields')
+        residue_fields = array('residue_fields')
+
+        residues = []
+        for info in residue_fields:
+            residues.append(dict(zip(self.RESIDUE_FIELDS,
+                                     [values[i] for i in info])))
+
+        atoms = [[] for _ in residues]
+        for index, residue in enumerate(atom_residue):
+            info = residues[residue]
+            data = dict(zip(self.ATOM_FIELDS,
+                            [values[i] for i in atom_fields[index]]))
+            for name, source in self.ATOM_RESIDUE_FIELDS:
+                data[name] = info[source]
+            x, y, z = coordinates[index]
+            atoms[residue].append(Atom(x=float(x), y=float(y), z=float(z),
+                                       **data))
+
+        components = []
+        for index, info in enumerate(residues):
+            count = len(atoms[index])
+            component = Component(atoms[index], **info)
+            if len(list(component.atoms())) != count:
+                self.usable = False
+                raise ValueError("Rebuilt %s does not match stored atoms" %
+                                 component.unit_id())
+            components.append(component)
+        return Structure(components, pdb=stored['pdb'])
+
+    def save(self, filename, structure, checksum=None):
+        """Store a structure parsed from the given file. The entry is written
+        to a temporary directory and then renamed, so a partially written
+        entry is never loaded. Entries for older versions of the file are
+        removed. Failing to store is logged but not raised.
+
+        Parameters
+        ----------
+        filename : str
+            The mmCIF file the structure was parsed from.
+        structure : fr3d.data.Structure
+            The parsed structure.
+        checksum : str, optional
+            The checksum of the file, if already known.
+        """
+
+        if not self.usable:
+            return
+
+        path = self.directory(filename, checksum=checksum)
+        parent = os.path.dirname(path)
+        try:
+            if not os.path.isdir(parent):
+                os.makedirs(parent)
+            temp = tempfile.mkdtemp(dir=parent)
+            try:
+                self._save(temp, structure)
+                for old in os.listdir(parent):
+                    if os.path.join(parent, old) != temp:
+                        shutil.rmtree(os.path.join(parent, old))
+                os.rename(temp, path)
+            except:
+                shutil.rmtree(temp, ignore_errors=True)
+                raise
+        except Exception as err:
+            self.logger.warning("Could not store parsed structure in %s",
+                                path)
+            self.logger.exception(err)
+
+    def _save(self, path, structure):
+        values = {}
+
+        def encode(value):
+            if value is None:
+                return -1
+            return values.setdefault((type(value), value), len(values))
+
+        coordinates = []
+        atom_residue = []
+        atom_fields = []
+        residue_fields = []
+        for index, residue in enumerate(structure.residues(polymeric=None)):
+            residue_fields.append([encode(getattr(residue, f, None))
+                                   for f in self.RESIDUE_FIELDS])
+            for atom in residue.atoms():
+                coordinates.append((atom.x, atom.y, atom.z))
+                atom_residue.append(index)
+                atom_fields.append([encode(getattr(atom, f, None))
+                                    for f in self.ATOM_FIELDS])
+
+        def write(name, data, dtype, shape):
+            data = np.array(data, dtype=dtype).reshape(shape)
+            np.save(os.path.join(path, name + '.npy'), data)
+
+        write('coordinates', coordinates, np.float64, (-1, 3))
+        write('atom_residue', atom_residue, np.int32, (-1,))
+        write('atom_fields', atom_fields, np.int32,
+              (-1, len(self.ATOM_FIELDS)))
+        write('residue_fields', residue_fields, np.int32,
+              (-1, len(self.RESIDUE_FIELDS)))
+
+        ordered = [v[1] for v in sorted(values, key=values.get)]
+        with open(os.path.join(path, 'values.json'), 'wb') as raw:
+            json.dump({'pdb': structure.pdb, 'values': ordered}, raw)
+
+
+def fingerprint(*values):
+    """Compute a fingerprint of the input some cached data is computed from,
+    such as the PDB ids and release ids used. Values are converted to JSON,
+    so the order of lists matters and they should be sorted first.
+
+    Parameters
+    ----------
+    *values : object
+        The values to fingerprint.
+
+    Returns
+    -------
+    fingerprint : str
+        A hex digest of the values.
+    """
+
+    encoded = json.dumps(values, sort_keys=True, default=repr)
+    return hashlib.sha1(encoded).hexdigest()
+
+
+class CacheStore(object):
+    """A directory of cached data. Each entry is a pickle file, which may be
+    compressed, along with a JSON file of metadata about it: the stage which
+    created it, a fingerprint of the input it was computed from, its size
+    and when it was created and last used. Writes are done to a temporary file
+    which is then renamed, so a partially written entry is never read. If a
+    maximum size is given then storing an entry will evict the least
+    recently used entries until the total size is below it.
+
+    Attributes
+    ----------
+    location : str
+        The directory to store entries in.
+    max_size : int
+        The maximum total size in bytes of all entries, or None for no limit.
+    compressed : bool
+        If new entries should be compressed with gzip.
+    """
+
+    def __init__(self, location, max_size=None, compressed=False):
+        """Create a new CacheStore.
+
+        Parameters
+        ----------
+        location : str
+            The directory to store entries in.
+        max_size : int, optional
+            The maximum total size in bytes of all entries.
+        compressed : bool, optional
+            If new entries should be compressed.
+        """
+
+        self.location = location
+        self.max_size = max_size
+        self.compressed = compressed
+        self.logger = logging.getLogger('core.CacheStore')
+
+    def filename(self, name, compressed=None):
+        """Compute the filename of the data for the given name. If the entry
+        exists this is the file it is in, otherwise it is where it would be
+        written.
+
+        Parameters
+        ----------
+        name : str
+            The name of the entry.
+        compressed : bool, optional
+            Get the filename for a compressed or uncompressed entry, instead
+            of the existing one.
+
+        Returns
+        -------
+        filename : str
+            The path to the data file.
+        """
+
+        base = os.path.join(self.location, name + '.pickle')
+        if compressed is None:
+            if os.path.exists(base + '.gz'):
+                return base + '.gz'
+            if os.path.exists(base):
+                return base
+            compressed = self.compressed
+        if compressed:
+            return base + '.gz'
+        return base
+
+    def _metadata_filename(self, name):
+        return os.path.join(self.location, name + '.meta.json')
+
+    def _write(self, filename, write):
+        directory = os.path.dirname(filename)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        handle, temp = tempfile.mkstemp(dir=directory)
+        try:
+            with os.fdopen(handle, 'wb') as raw:
+                write(raw)
+            os.rename(temp, filename)
+        except:
+            os.remove(temp)
+            raise
+
+    def _write_metadata(self, name, metadata):
+        self._write(self._metadata_filename(name),
+                    lambda raw: json.dump(metadata, raw))
+
+    def metadata(self, name):
+        """Get the metadata of an entry. Entries written without metadata,
+        by older versions of the pipeline, have metadata computed from the
+        file.
+
+        Parameters
+        ----------
+        name : str
+            The name of the entry.
+
+        Returns
+        -------
+        metadata : dict
+            The metadata or None if there is no such entry.
+        """
+
+        filename = self.filename(name)
+        if not os.path.exists(filename):
+            return None
+
+        try:
+            with open(self._metadata_filename(name), 'rb') as raw:
+                return json.load(raw)
+        except (IOError, ValueError):
+            info = os.stat(filename)
+            return {
+                'name': name,
+                'creator': None,
+                'fingerprint': None,
+                'size': info.st_size,
+                'created': info.st_mtime,
+                'accessed': info.st_atime,
+                'compressed': filename.endswith('.gz'),
+            }
+
+    def store(self, name, data, creator=None, fingerprint=None):
+        """Store data under a name, replacing any existing entry.
+
+        Parameters
+        ----------
+        name : str
+            The name to use.
+        data : object
+            The data to store, which must be picklable.
+        creator : str, optional
+            The name of the stage which created the data.
+        fingerprint : str, optional
+            A fingerprint of the input the data was computed from.
+        """
+
+        filename = self.filename(name, compressed=self.compressed)
+
+        def write(raw):
+            if self.compressed:
+                raw = gzip.GzipFile(fileobj=raw, mode='wb')
+            pickle.dump(data, raw, pickle.HIGHEST_PROTOCOL)
+            raw.close()
+
+        self._write(filename, write)
+        other = self.filename(name, compressed=not self.compressed)
+        if os.path.exists(other):
+            os.remove(other)
+
+        now = time.time()
+        self._write_metadata(name, {
+            'name': name,
+            'creator': creator,
+            'fingerprint': fingerprint,
+            'size': os.path.getsize(filename),
+            'created': now,
+            'accessed': now,
+            'compressed': self.compressed,
+        })
+
+        if self.max_size is not None:
+            self.prune(max_size=self.max_size, keep=set([name]))
+
+    def load(self, name, fingerprint=None):
+        """Load the data stored under a name. If a fingerprint is given and
+        the entry was stored with a different one, the entry is out of date
+        and is not loaded.
+
+        Parameters
+        ----------
+        name : str
+            The name of the entry.
+        fingerprint : str, optional
+            The fingerprint of the current input.
+
+        Returns
+        -------
+        data : object
+            The stored data or None if there is no such entry.
+        """
+
+        metadata = self.metadata(name)
+        if metadata is None:
+            return None
+
+        if fingerprint is not None and \
+                metadata.get('fingerprint') != fingerprint:
+            self.logger.info("Cached %s is out of date", name)
+            return None
+
+        filename = self.filename(name)
+        opener = open
+        if filename.endswith('.gz'):
+            opener = gzip.open
+        with opener(filename, 'rb') as raw:
+            data = pickle.load(raw)
+
+        metadata['accessed'] = time.time()
+        try:
+            self._write_metadata(name, metadata)
+        except (IOError, OSError) as err:
+            self.logger.warning("Could not update metadata of %s: %s",
+                                name, err)
+        return data
+
+    def evict(self, name):
+        """Remove an entry.
+
+        Parameters
+        ----------
+        name : str
+            The name of the entry.
+
+        Returns
+        -------
+        removed : bool
+            True if there was an entry to remove.
+        """
+
+        removed = False
+        for filename in [self.filename(name, compressed=False),
+                         self.filename(name, compressed=True)]:
+            if os.path.exists(filename):
+                os.remove(filename)
+                removed = True
+
+        metadata = self._metadata_filename(name)
+        if os.path.exists(metadata):
+            os.remove(metadata)
+        return removed
+
+    def entries(self):
+        """Get the metadata of all entries.
+
+        Returns
+        -------
+        entries : list
+            A list of the metadata of all entries, sorted by name.
+        """
+
+        if not os.path.isdir(self.location):
+            return []
+
+        names = set()
+        for root, _, files in os.walk(self.location):
+            for filename in files:
+                for suffix in ['.pickle', '.pickle.gz']:
+                    if filename.endswith(suffix):
+                        path = os.path.join(root, filename[:-len(suffix)])
+                        names.add(os.path.relpath(path, self.location))
+
+        found = [self.metadata(name) for name in sorted(names)]
+        return [entry for entry in found if entry]
+
+    def prune(self, max_size=None, older_than=None, keep=set()):
+        """Remove entries to free space. Entries last used more than
+        `older_than` seconds ago are removed, and then the least recently
+        used entries are removed until the total size is at most
+        `max_size`.
+
+        Parameters
+        ----------
+        max_size : int, optional
+            The maximum total size in bytes of all entries.
+        older_than : float, optional
+            The maximum time in seconds since an entry was last used.
+        keep : set, optional
+            Names of entries to never remove.
+
+        Returns
+        -------
+        removed : list
+            The metadata of the removed entries.
+        """
+
+        entries = sorted(self.entries(), key=lambda e: e['accessed'])
+        total = sum(e['size'] for e in entries)
+        now = time.time()
+        removed = []
+        for entry in entries:
+            if entry['name'] in keep:
+                continue
+
+            too_old = older_than is not None and \
+                now - entry['accessed'] > older_than
+            too_large = max_size is not None and total > max_size
+            if not too_old and not too_large:
+                continue
+
+            self.logger.info("Evicting cached %s", entry['name'])
+            self.evict(entry['name'])
+            total -= entry['size']
+            removed.append(entry)
+        return removed
@@ -4,6 +4,13 @@
 import logging
 from contextlib import contextmanager
 
+from sqlalchemy import select
+from sqlalchemy import tuple_
+from sqlalchemy.orm import class_mapper
+from sqlalchemy.sql.expression import Insert
+from sqlalchemy.ext.compiler import compiles
+
+from pymotifs.core import profiling
 from pymotifs.core.exceptions import Skip
 
 
@@ -47,9 +54,11 @@ class Session(object):
         """
 
         session = self.maker()
+        profiling.record('sessions')
         try:
             yield session
-            session.commit()
+            with profiling.phase('commit'):
+                session.commit()
         except Skip:
             session.rollback()
             raise
@@ -59,3 +68,93 @@ class Session(object):
             raise
         finally:
             session.close()
+
+
+class Upsert(Insert):
+    """An INSERT statement which updates existing rows instead of failing on
+    duplicate keys. On MySQL this is compiled to `INSERT ... ON DUPLICATE KEY
+    UPDATE`, setting every non primary key column to the inserted value. It
+    is meant to be executed with many rows at once, as in
+    `session.execute(upsert(table), rows)`.
+    """
+    pass
+
+
+@compiles(Upsert, 'mysql')
+def _compile_upsert(insert, compiler, **kwargs):
+    sql = compiler.visit_insert(insert, **kwargs)
+    preparer = compiler.preparer
+    updates = []
+    for column in insert.table.columns:
+        if column.primary_key:
+            continue
+        name = preparer.format_column(column)
+        updates.append('%s = VALUES(%s)' % (name, name))
+
+    if not updates:
+        return sql
+    return sql + ' ON DUPLICATE KEY UPDATE ' + ', '.join(updates)
+
+
+def upsert(table):
+    """Create an `Upsert` statement for the given table.
+
+    Parameters
+    ----------
+    table : Table or mapped class
+        The table, or a class mapped to it, to write to.
+
+    Returns
+    -------
+    statement : Upsert
+        The statement to execute.
+    """
+    return Upsert(getattr(table, '__table__', table))
+
+
+def delete_statement(query, limit=None):
+    """Translate a query for mapped objects into a DELETE of the same rows.
+    This produces `DELETE FROM table WHERE pk IN (SELECT pk FROM (query) AS
+    t)`, where the inner query selects only the primary key of the rows
+    from the given query, joins and all. Wrapping it in a derived table lets
+    MySQL delete from a table that is also selected from and allows a LIMIT,
+    so large deletes can be done in chunks by executing the statement until
+    fewer than `limit` rows are deleted.
+
+    Parameters
+    ----------
+    query : sqlalchemy.orm.query.Query
+        A query which selects a single mapped class.
+    limit : int, optional
+        The maximum number of rows to delete at once.
+
+    Raises
+    ------
+    ValueError
+        If the query does not select exactly one mapped class.
+
+    Returns
+    -------
+    statement : Delete
+        The DELETE statement.
+    """
+
+    entities = query.column_descriptions
+    if len(entities) != 1 or entities[0]['expr'] is not entities[0]['type']:
+        raise ValueError("Can only delete rows of a single mapped class")
+
+    mapper = class_mapper(entities[0]['type'])
+    keys = mapper.primary_key
+    if not keys:
+        raise ValueError("Cannot delete rows without a primary key")
+
+    ids = query.with_entities(*keys).order_by(None)
+    if limit:
+        ids = ids.limit(limit)
+    ids = ids.subquery()
+    inner = select(list(ids.c))
+
+    table = mapper.local_table
+    if len(keys) == 1:
+        return table.delete().where(keys[0].in_(inner))
+    return table.delete().where(tuple_(*keys).in_(inner))
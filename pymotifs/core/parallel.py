@@ -0,0 +1,284 @@
+"""This contains the logic for running the entries of a stage across a pool of
+processes. Each worker is a fork of the pipeline process which builds its own
+database engine and session maker, since connections cannot be shared safely
+between processes. The stage itself is inherited through the fork, so nothing
+about it needs to be picklable, only the entries and the results.
+"""
+
+import logging
+import itertools as it
+import multiprocessing as mp
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from pymotifs import models as mod
+from pymotifs.core import profiling
+from pymotifs.core.db import Session
+
+"""The logger to use."""
+logger = logging.getLogger(__name__)
+
+"""State shared with the forked workers. This is set by the parent before the
+pool is created and read by each worker after the fork. The state of each
+pool is stored under its own key, so that pools started at the same time by
+stages running in different threads do not overwrite each other's state."""
+_STATE = {}
+
+"""Source of the keys of each pool in `_STATE`."""
+_KEYS = it.count()
+
+
+def bound_engine(session):
+    """Find the engine that a session maker is bound to.
+
+    Parameters
+    ----------
+    session : pymotifs.core.db.Session or sqlalchemy.orm.session.sessionmaker
+        The session wrapper or session maker to inspect.
+
+    Returns
+    -------
+    engine : sqlalchemy.engine.Engine
+        The bound engine or None if there is none.
+    """
+
+    maker = getattr(session, 'maker', session)
+    return getattr(maker, 'kw', {}).get('bind')
+
+
+def rebind(stage):
+    """Give a stage its own database engine and session maker. This is meant
+    to be called in a process forked from the pipeline. It disposes of the
+    connections inherited from the parent and builds a new engine, with the
+    same url and a pool with the same settings, such as `pool_size` and
+    `max_overflow`, which belongs to the current process alone.
+
+    Parameters
+    ----------
+    stage : pymotifs.core.stages.Stage
+        The stage to rebind.
+    """
+
+    engine = bound_engine(stage.session)
+    if engine is None:
+        return
+
+    engine.dispose()
+    local = create_engine(engine.url, pool=engine.pool.recreate())
+    if mod.metadata.bind is engine:
+        mod.metadata.bind = local
+    stage.session = Session(sessionmaker(bind=local))
+
+
+def _forget_profiles(stage):
+    """Drop the spans and profiles a forked process inherits from the
+    profiler of its parent, so that only its own are sent back.
+    """
+    if stage.profiler is not None:
+        stage.profiler.take()
+
+
+def _initialize(key):
+    """Initialize a worker process of the pool by rebinding the stage.
+    """
+    rebind(_STATE[key]['stage'])
+    _forget_profiles(_STATE[key]['stage'])
+
+
+def _run(task):
+    """Process a single entry in a worker. The profiling counters recorded
+    while processing it, and its profile if any, are returned so the parent
+    can add them to its own spans.
+
+    Parameters
+    ----------
+    task : tuple
+        A tuple of the key of the pool, the index of the entry and the entry
+        to process.
+
+    Returns
+    -------
+    result : tuple
+        The entry, the status produced by `Stage.process_entry`, the
+        counters and the profiles from `Profiler.take`.
+    """
+
+    key, index, entry = task
+    state = _STATE[key]
+    stage = state['stage']
+    with profiling.collect() as counts:
+        status = stage.process_entry(index, entry, state['total'],
+                                     **state['kwargs'])
+    profiles = []
+    if stage.profiler is not None:
+        _, profiles = stage.profiler.take()
+    return entry, status, dict(counts), profiles
+
+
+def process_in_pool(stage, entries, jobs, **kwargs):
+    """Process all entries of a stage using a pool of worker processes. The
+    results are produced in the same order as the entries. The profiling
+    counters of each entry are added to the spans open in this thread, and
+    any profiles to the profiler of the stage. If processing any entry
+    raises, the pool is terminated and the exception is raised here.
+
+    Parameters
+    ----------
+    stage : pymotifs.core.stages.Stage
+        The stage to use.
+    entries : list
+        The entries to process.
+    jobs : int
+        The number of worker processes to use.
+    **kwargs : dict
+        Keyword arguments passed to `Stage.process_entry`.
+
+    Yields
+    ------
+    result : tuple
+        The entry and the status produced by `Stage.process_entry`.
+    """
+
+    engine = bound_engine(stage.session)
+    if engine is not None:
+        engine.dispose()
+
+    key = next(_KEYS)
+    _STATE[key] = {'stage': stage, 'kwargs': kwargs, 'total': len(entries)}
+    logger.info("Processing %i entries of %s with %i workers",
+                len(entries), stage.name, jobs)
+    pool = mp.Pool(processes=jobs, initializer=_initialize, initargs=(key,))
+    try:
+        tasks = ((key, index, entry) for index, entry in enumerate(entries))
+        results = pool.imap(_run, tasks, chunksize=1)
+        for entry, status, counts, profiles in results:
+            profiling.merge(counts, timings=True)
+            if stage.profiler is not None:
+                stage.profiler.add(profiles=profiles)
+            yield entry, status
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+        _STATE.pop(key, None)
+
+
+def _call(task):
+    """Apply the function shared with the workers to a single item.
+    """
+    key, item = task
+    return _STATE[key]['function'](item)
+
+
+def map_in_pool(stage, function, items, jobs):
+    """Apply a function to each item using a pool of worker processes. This
+    is meant for the work within a single entry which does not use the
+    database, such as parsing many structures, so the workers are not
+    rebound. The function is inherited through the fork, so only the items
+    and results need to be picklable. With a single job, or when already
+    running in a worker process of a stage, the function is applied in this
+    process. If any call raises, the pool is terminated and the exception is
+    raised here.
+
+    Parameters
+    ----------
+    stage : pymotifs.core.stages.Stage
+        The stage doing the work, its engine is disposed of before forking.
+    function : callable
+        The function to apply.
+    items : list
+        The items to apply it to.
+    jobs : int
+        The number of worker processes to use.
+
+    Yields
+    ------
+    result : object
+        The result of each call, in the same order as the items.
+    """
+
+    jobs = max(1, min(int(jobs or 1), len(items)))
+    if mp.current_process().daemon:
+        jobs = 1
+    if jobs == 1:
+        for item in items:
+            yield function(item)
+        return
+
+    engine = bound_engine(stage.session)
+    if engine is not None:
+        engine.dispose()
+
+    key = next(_KEYS)
+    _STATE[key] = {'function': function}
+    logger.info("Processing %i items of %s with %i workers", len(items),
+                stage.name, jobs)
+    pool = mp.Pool(processes=jobs)
+    try:
+        tasks = ((key, item) for item in items)
+        for result in pool.imap(_call, tasks, chunksize=1):
+            yield result
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+        _STATE.pop(key, None)
+
+
+def _run_stage(stage, entries, kwargs, results):
+    """Run a whole stage in a forked process. Any exception is logged and
+    turned into a non zero exit code, which is all the parent can see. If
+    given a connection, the finished spans and profiles of the stage are
+    sent through it, even if the stage failed.
+    """
+
+    rebind(stage)
+    _forget_profiles(stage)
+    try:
+        stage(entries, **kwargs)
+    except Exception as err:
+        logger.error("Stage %s failed in process", stage.name)
+        logger.exception(err)
+        raise SystemExit(1)
+    finally:
+        if results is not None:
+            taken = None
+            if stage.profiler is not None:
+                taken = stage.profiler.take()
+            results.send(taken)
+            results.close()
+
+
+def stage_process(stage, entries, results=None, **kwargs):
+    """Create a process which will run a whole stage. The process is not
+    started. The engine of the stage is disposed of first, so the forked
+    process does not inherit any open connections.
+
+    Parameters
+    ----------
+    stage : pymotifs.core.stages.Stage
+        The stage to run.
+    entries : list
+        The entries to give the stage.
+    results : multiprocessing.Connection, optional
+        A connection to send the result of `Profiler.take` through once the
+        stage is done, or None if there is no profiler.
+    **kwargs : dict
+        Keyword arguments to call the stage with.
+
+    Returns
+    -------
+    process : multiprocessing.Process
+        The process which will run the stage.
+    """
+
+    engine = bound_engine(stage.session)
+    if engine is not None:
+        engine.dispose()
+    return mp.Process(target=_run_stage, name=stage.name,
+                      args=(stage, entries, kwargs, results))
@@ -0,0 +1,496 @@
+"""This contains tools for profiling the pipeline. A `Profiler` times spans of
+work, one for each stage and one for each entry a stage processes. While a
+span is open, instrumented code records counters into it, such as the
+number of rows saved, the number of queries issued and the time spent in
+phases like `should_process`, `data` or saving. Finished spans are written as
+JSON lines to a file and summarized per stage at the end of a run.
+Optionally each entry can be run under cProfile, with the profiles of the
+slowest entries written out at the end.
+
+Counters are recorded into all open spans of the current thread, so code
+does not need a reference to the profiler and recording does nothing when
+no span is open. Work done in a helper thread, like the writer of a
+pipelined loader, is gathered with `collect` and added to the spans of the
+thread that started it with `merge`. Work done in other processes is sent
+back the same way: the counters of each entry processed in a pool, and the
+finished stages and profiles of a stage run in its own process, taken with
+`Profiler.take` and added with `Profiler.add`. Note that CPU time and peak
+RSS are for the process which opened the span, so they overlap when stages
+run concurrently in threads and leave out work done in other processes.
+"""
+
+import os
+import json
+import time
+import marshal
+import heapq
+import cProfile
+import logging
+import resource
+import threading
+import collections as coll
+from contextlib import contextmanager
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+"""The logger to use."""
+logger = logging.getLogger(__name__)
+
+"""The spans open in each thread."""
+_local = threading.local()
+
+"""The columns of the summary table, with the counter each comes from."""
+SUMMARY = [
+    ('Stage', 'stage'),
+    ('Entries', 'entries'),
+    ('Wall (s)', 'wall'),
+    ('CPU (s)', 'cpu'),
+    ('to_process', 'to_process_seconds'),
+    ('should_process', 'should_process_seconds'),
+    ('data', 'data_seconds'),
+    ('save', 'save_seconds'),
+    ('Rows', 'rows'),
+    ('Queries', 'queries'),
+    ('Peak RSS (MB)', 'peak_rss_mb'),
+]
+
+
+def _spans():
+    if not hasattr(_local, 'spans'):
+        _local.spans = []
+    return _local.spans
+
+
+def _cpu():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def _peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def active():
+    """Check if any span is open in the current thread.
+
+    Returns
+    -------
+    active : bool
+        True if there is an open span.
+    """
+    return bool(_spans())
+
+
+def record(key, value=1):
+    """Add a value to a counter of all open spans in the current thread.
+
+    Parameters
+    ----------
+    key : str
+        The name of the counter.
+    value : int or float, optional
+        The amount to add, defaults to 1.
+    """
+
+    for span in _spans():
+        span.counts[key] += value
+
+
+@contextmanager
+def phase(name, exclude=None):
+    """Record the time spent in a block of code as the counter
+    `<name>_seconds`. If `exclude` is given, the time recorded under the
+    `<exclude>_seconds` counter during the block is not counted, which is
+    used to separate the time spent saving from the time spent computing
+    the data being saved.
+
+    Parameters
+    ----------
+    name : str
+        The name of the phase.
+    exclude : str, optional
+        The name of a phase which may run inside this one.
+    """
+
+    spans = _spans()
+    if not spans:
+        yield
+        return
+
+    key = exclude + '_seconds' if exclude else None
+    before = spans[-1].counts[key] if key else 0
+    start = time.time()
+    try:
+        yield
+    finally:
+        elapsed = time.time() - start
+        if key:
+            elapsed -= spans[-1].counts[key] - before
+        record(name + '_seconds', elapsed)
+
+
+def timed(iterable, name):
+    """Record the time spent producing each value of an iterable, such as
+    a generator, as the counter `<name>_seconds`. Lists and other
+    containers are returned as they are.
+
+    Parameters
+    ----------
+    iterable : iterable
+        The iterable to time.
+    name : str
+        The name of the phase.
+
+    Returns
+    -------
+    iterable : iterable
+        An iterable of the same values.
+    """
+
+    if not active() or iter(iterable) is not iterable:
+        return iterable
+
+    def generator():
+        iterator = iter(iterable)
+        while True:
+            with phase(name):
+                try:
+                    value = next(iterator)
+                except StopIteration:
+                    return
+            yield value
+    return generator()
+
+
+@contextmanager
+def collect():
+    """Gather the counters recorded in the current thread while the block
+    runs, even if no span is open in it. This is meant for helper threads,
+    whose counters would otherwise be lost, see `merge`.
+
+    Yields
+    ------
+    counts : collections.defaultdict
+        The counters recorded so far.
+    """
+
+    span = Span('thread', None)
+    spans = _spans()
+    spans.append(span)
+    try:
+        yield span.counts
+    finally:
+        spans.remove(span)
+
+
+def merge(counts, timings=False):
+    """Add counters gathered with `collect` to all open spans in the
+    current thread. Timing counters are left out by default, since the time
+    spent in a helper thread overlaps the time of the thread which started
+    it.
+
+    Parameters
+    ----------
+    counts : dict
+        The counters to add.
+    timings : bool, optional
+        If the `<name>_seconds` counters should be added as well, as for
+        entries processed in another process instead of this thread.
+    """
+
+    for key, value in counts.items():
+        if timings or not key.endswith('_seconds'):
+            record(key, value)
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _count_query(*args, **kwargs):
+    if _spans():
+        record('queries')
+
+
+class Span(object):
+    """A timed span of work.
+
+    Attributes
+    ----------
+    kind : str
+        Either 'stage' or 'entry'.
+    stage : str
+        The name of the stage.
+    entry : object
+        The entry being processed, None for stages.
+    counts : collections.defaultdict
+        The counters recorded while this span was open.
+    """
+
+    def __init__(self, kind, stage, entry=None):
+        self.kind = kind
+        self.stage = stage
+        self.entry = entry
+        self.counts = coll.defaultdict(int)
+        self._wall = time.time()
+        self._cpu = _cpu()
+
+    def finish(self):
+        """Record the wall time, CPU time and peak RSS of this span.
+        """
+
+        self.counts['wall'] = time.time() - self._wall
+        self.counts['cpu'] = _cpu() - self._cpu
+        self.counts['peak_rss_mb'] = _peak_rss_mb()
+
+    def as_dict(self):
+        """Convert this span to a dictonary to write out.
+        """
+
+        data = dict(self.counts)
+        data.update({
+            'kind': self.kind,
+            'stage': self.stage,
+            'entry': self.entry,
+            'pid': os.getpid(),
+            'time': self._wall,
+        })
+        return data
+
+
+class Profiler(object):
+    """Times stages and entries of a pipeline run.
+
+    Attributes
+    ----------
+    filename : str
+        The file to append JSON lines of all spans to, or None.
+    profile : bool
+        If each entry should be profiled with cProfile.
+    slowest : int
+        The number of slowest entries to keep cProfile output for.
+    directory : str
+        The directory to write cProfile output to.
+    stages : list
+        The finished stage spans, in order.
+
+    The profiles of the slowest entries are kept as the statistics of
+    `cProfile.Profile`, which unlike the profiler itself can be sent between
+    processes.
+    """
+
+    def __init__(self, filename=None, profile=False, slowest=5,
+                 directory='profiles'):
+        self.filename = filename
+        self.profile = profile
+        self.slowest = slowest
+        self.directory = directory
+        self.stages = []
+        self._profiles = []
+        self._lock = threading.Lock()
+        self._handles = {}
+
+    @contextmanager
+    def span(self, kind, stage, entry=None):
+        """Open a span for a stage or an entry. If profiling, entries are
+        also run under cProfile.
+
+        Parameters
+        ----------
+        kind : str
+            Either 'stage' or 'entry'.
+        stage : str
+            The name of the stage.
+        entry : object, optional
+            The entry being processed.
+
+        Yields
+        ------
+        span : Span
+            The open span.
+        """
+
+        span = Span(kind, stage, entry=entry)
+        profile = None
+        if self.profile and kind == 'entry':
+            profile = cProfile.Profile()
+            profile.enable()
+
+        spans = _spans()
+        spans.append(span)
+        try:
+            yield span
+        finally:
+            spans.pop()
+            if profile is not None:
+                profile.disable()
+            span.finish()
+            self.finish(span, profile)
+
+    def finish(self, span, profile=None):
+        """Write out a finished span and keep it, or its profile, if
+        needed.
+        """
+
+        self.write(span)
+        stats = None
+        if profile is not None:
+            profile.create_stats()
+            stats = profile.stats
+        self.add(stages=[span] if span.kind == 'stage' else [],
+                 profiles=[(span, stats)] if stats is not None else [])
+
+    def add(self, stages=(), profiles=()):
+        """Keep finished stage spans and profiles, such as those taken from
+        the profiler of another process. The spans are not written out
+        again.
+
+        Parameters
+        ----------
+        stages : list
+            The finished stage spans.
+        profiles : list
+            Tuples of a finished entry span and its profile statistics.
+        """
+
+        with self._lock:
+            self.stages.extend(stages)
+            for span, stats in profiles:
+                item = (span.counts['wall'], id(span), span, stats)
+                if len(self._profiles) < self.slowest:
+                    heapq.heappush(self._profiles, item)
+                else:
+                    heapq.heappushpop(self._profiles, item)
+
+    def take(self):
+        """Remove and return the finished stage spans and kept profiles, to
+        send them to the profiler of another process.
+
+        Returns
+        -------
+        results : tuple
+            The stage spans and the profiles, in the form used by `add`.
+        """
+
+        with self._lock:
+            stages = self.stages
+            profiles = [(span, stats) for _, _, span, stats in self._profiles]
+            self.stages = []
+            self._profiles = []
+        return stages, profiles
+
+    def write(self, span):
+        """Append a span as a JSON line to the configured file.
+        """
+
+        if not self.filename:
+            return
+
+        line = json.dumps(span.as_dict(), default=str) + '\n'
+        with self._lock:
+            pid = os.getpid()
+            if pid not in self._handles:
+                self._handles = {pid: open(self.filename, 'ab')}
+            handle = self._handles[pid]
+            handle.write(line)
+            handle.flush()
+
+    def dump_profiles(self):
+        """Write the cProfile output of the slowest entries. Each is written
+        as `<stage>-<entry>.prof` in the configured directory, which can be
+        read with `pstats`, and each is logged.
+
+        Returns
+        -------
+        filenames : list
+            The files written, slowest first.
+        """
+
+        if not self._profiles:
+            return []
+
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+
+        filenames = []
+        for wall, _, span, stats in sorted(self._profiles, reverse=True):
+            name = '%s-%s.prof' % (span.stage, span.entry)
+            name = name.replace(os.sep, '_').replace(' ', '')
+            filename = os.path.join(self.directory, name)
+            with open(filename, 'wb') as raw:
+                marshal.dump(stats, raw)
+            filenames.append(filename)
+            logger.info("Entry %s of %s took %.2fs, profile in %s",
+                        span.entry, span.stage, wall, filename)
+        return filenames
+
+    def summary(self):
+        """Summarize the stages of this run.
+
+        Returns
+        -------
+        rows : list
+            A list of tuples, one for each stage, with the values in the
+            order of `SUMMARY`.
+        """
+
+        rows = []
+        for span in self.stages:
+            values = dict(span.counts)
+            values['stage'] = span.stage
+            rows.append(tuple(values.get(key, 0) for _, key in SUMMARY))
+        return rows
+
+    def table(self):
+        """Format the summary of this run as a text table.
+
+        Returns
+        -------
+        table : str
+            The formatted table.
+        """
+
+        def fmt(value):
+            if isinstance(value, float):
+                return '%.2f' % value
+            return str(value)
+
+        rows = [tuple(name for name, _ in SUMMARY)]
+        rows.extend(tuple(fmt(v) for v in row) for row in self.summary())
+        widths = [max(len(row[i]) for row in rows)
+                  for i in range(len(SUMMARY))]
+        lines = []
+        for row in rows:
+            lines.append('  '.join(v.ljust(w) for v, w in zip(row, widths)))
+        return '\n'.join(lines)
+
+    def close(self):
+        """Close the file spans are written to.
+        """
+
+        with self._lock:
+            for handle in self._handles.values():
+                handle.close()
+            self._handles = {}
+
+
+@contextmanager
+def span(profiler, kind, stage, entry=None):
+    """Open a span with the given profiler, doing nothing if there is no
+    profiler.
+
+    Parameters
+    ----------
+    profiler : Profiler
+        The profiler to use, or None.
+    kind : str
+        Either 'stage' or 'entry'.
+    stage : str
+        The name of the stage.
+    entry : object, optional
+        The entry being processed.
+    """
+
+    if profiler is None:
+        yield None
+    else:
+        with profiler.span(kind, stage, entry=entry) as opened:
+            yield opened
@@ -18,6 +18,8 @@ from contextlib import contextmanager
 
 from pymotifs import utils as ut
 
+from pymotifs.core import profiling
+from pymotifs.core.db import upsert
 from pymotifs.core.base import Base
 from pymotifs.core.exceptions import InvalidState
 
@@ -111,6 +113,7 @@ class Saver(Base):
                 for entry in chunk:
                     writer(entry)
                     saved = True
+            profiling.record('rows', len(chunk))
 
         if not saved:
             if not self.allow_no_data:
@@ -128,11 +131,19 @@ class DatabaseSaver(Saver):
     having it automatically converted to the correct object. This can be very
     useful for logging and debugging as the data remains in a nice printable
     form until the last possible moment.
+
+    If the stage sets `bulk_insert` then the session is skipped altogether.
+    The data, which may be dicts, tuples in the order of the stage's
+    `columns` or mapped objects, is written with Core executemany INSERTs of
+    `insert_max` rows at a time, all in one transaction. When merging this
+    uses `INSERT ... ON DUPLICATE KEY UPDATE`.
     """
 
     def __init__(self, *args, **kwargs):
         super(DatabaseSaver, self).__init__(*args, **kwargs)
         self.table = getattr(self.stage, 'table', None)
+        self.bulk = getattr(self.stage, 'bulk_insert', False)
+        self.columns = getattr(self.stage, 'columns', None)
 
     def to_savable(self, data):
         """Turn data into a table object if needed.
@@ -141,6 +152,67 @@ class DatabaseSaver(Saver):
             return self.table(**data)
         return data
 
+    def to_row(self, data):
+        """Turn data into a dictonary that can be inserted with Core.
+        """
+        if isinstance(data, dict):
+            return data
+        if isinstance(data, tuple):
+            return dict(zip(self.columns, data))
+        return ut.row2dict(data)
+
+    def bulk_save(self, pdb, data, dry_run=False, **kwargs):
+        """Save all data with executemany INSERTs in one transaction.
+
+        Parameters
+        ----------
+        pdb : str
+            The pdb this is a part of
+        data : iterable
+            The rows to save.
+        dry_run : bool, optional
+            If true nothing is written.
+
+        Returns
+        -------
+        saved : int
+            The number of rows saved.
+        """
+
+        if self.table is None:
+            raise InvalidState("Must set a table to bulk insert")
+
+        statement = getattr(self.table, '__table__', self.table).insert()
+        if self.merge:
+            statement = upsert(self.table)
+
+        saved = 0
+        with self.session() as session:
+            for chunk in ut.grouper(self.insert_max, data):
+                rows = [self.to_row(entry) for entry in chunk]
+                if dry_run:
+                    self.logger.debug("Saving %i rows", len(rows))
+                else:
+                    session.execute(statement, rows)
+                    profiling.record('rows', len(rows))
+                saved += len(rows)
+        self.logger.debug("Bulk saved %i rows for %s", saved, pdb)
+        return saved
+
+    def __call__(self, pdb, data, **kwargs):
+        if not self.bulk:
+            return super(DatabaseSaver, self).__call__(pdb, data, **kwargs)
+
+        to_save = data
+        if not isinstance(to_save, coll.Iterable) or \
+                isinstance(to_save, (dict, tuple)):
+            to_save = [data]
+
+        if not self.bulk_save(pdb, to_save, **kwargs):
+            if not self.allow_no_data:
+                raise InvalidState("No data saved")
+            self.logger.info("No data saved")
+
     @contextmanager
     def writer(self, *args, **kwargs):
         with self.session() as session:
@@ -6,14 +6,20 @@ the basic logic for all stages.
 import os
 import abc
 import sys
-import pickle
+import Queue
 import datetime
+import threading
+import collections as coll
+import itertools as it
 from contextlib import contextmanager
 
+from sqlalchemy import literal
+
 from fr3d.data import Structure
 from fr3d.cif.reader import Cif
 from fr3d.cif.reader import ComplexOperatorException
 
+from pymotifs.core import db
 from pymotifs.core import base
 from pymotifs.core.exceptions import Skip
 from pymotifs.core.exceptions import StageFailed
@@ -21,6 +27,9 @@ from pymotifs.core.exceptions import InvalidState
 from pymotifs import utils as ut
 from pymotifs import models as mod
 from pymotifs.core import savers
+from pymotifs.core import cache
+from pymotifs.core import parallel
+from pymotifs.core import profiling
 
 # Files that should be skipped.  Add others as necessary, and note reason
 # for exclusion when known.
@@ -34,6 +43,16 @@ from pymotifs.core import savers
 #
 SKIP = {}
 
+"""Markers put on the queue of a pipelined loader to end writing."""
+_DONE = object()
+_ABORT = object()
+
+"""The possible results of processing a single entry."""
+PROCESSED = 'processed'
+UNNEEDED = 'unneeded'
+SKIPPED = 'skipped'
+FAILED = 'failed'
+
 class Stage(base.Base):
     """This is a base class for both loaders and exporters to inherit from. It
     contains the functionality common to all things that are part of our
@@ -57,6 +76,18 @@ class Stage(base.Base):
         Class to use for saving
     use_marks : bool, False
         Flag to use mark data when skipping.
+    parallel : bool, False
+        Flag if entries may be processed by a pool of processes.
+    bulk_size : int, 500
+        Number of entries to check at once in `bulk_status`.
+    structures : pymotifs.core.cache.StructureCache, None
+        A cache of parsed files shared with other stages in the same run.
+    modifies_structure : bool, False
+        Flag if the stage modifies the structures it loads, such as by
+        inferring hydrogens. These stages get their own structure instead of
+        the one shared through `structures`.
+    profiler : pymotifs.core.profiling.Profiler, None
+        The profiler timing the stages and entries of the current run.
     """
 
     update_gap = None
@@ -66,6 +97,11 @@ class Stage(base.Base):
     skip = []
     saver = None
     use_marks = False
+    parallel = False
+    bulk_size = 500
+    structures = None
+    modifies_structure = False
+    profiler = None
 
     def __init__(self, *args, **kwargs):
         """Build a new Stage.
@@ -81,9 +117,19 @@ class Stage(base.Base):
         """
         super(Stage, self).__init__(*args, **kwargs)
         self._cif = ut.CifFileFinder(self.config)
+        self._store = None
+        if self.config['structure_cache'].get('persistent'):
+            location = os.path.join(self.config['locations']['cache'],
+                                    'structures')
+            self._store = cache.ParsedStructureStore(location)
+        self._cache_store = cache.CacheStore(
+            self.config['locations']['cache'],
+            max_size=self.config['cache'].get('max_size'),
+            compressed=self.config['cache'].get('compressed', False))
         self.skip = set(SKIP)
         self.skip.update(self.__class__.skip)
         self.skip.update(kwargs.get('skip_pdbs', []))
+        self._status = {}
 
     @abc.abstractmethod
     def is_missing(self, entry, **kwargs):
@@ -155,8 +201,19 @@ class Stage(base.Base):
         if isinstance(pdb, Cif):
             return pdb
 
+        filename = self._cif(pdb)
+        if self.structures is not None:
+            return self.structures.fetch(filename, 'cif',
+                                         lambda: self._parse(pdb, filename))
+        return self._parse(pdb, filename)
+
+    def _parse(self, pdb, filename):
+        """Parse the given mmCIF file, skipping it if it has a complex
+        operator and `skip_complex` is set.
+        """
+
         try:
-            with open(self._cif(pdb), 'rb') as raw:
+            with open(filename, 'rb') as raw:
                 return Cif(raw)
         except ComplexOperatorException as err:
             if self.skip_complex:
@@ -171,7 +228,13 @@ class Stage(base.Base):
         the Structure data. If given a `fr3d.data.structure.Structure`, then
         this will simply return it. If given a `fr3d.reader.cif.Cif` data
         structure then this will return the structure that is part of that
-        file.
+        file. If this stage has a structure cache, structures parsed by any
+        stage in this run are reused, unless this stage sets
+        `modifies_structure`, in which case it gets a structure of its own
+        so that other stages never see its changes. If the 'persistent'
+        option of the 'structure_cache' configuration is set, structures are
+        also loaded from, and added to, a
+        `pymotifs.core.cache.ParsedStructureStore` in the cache directory.
 
         Parameters
         ----------
@@ -186,13 +249,36 @@ class Stage(base.Base):
         if isinstance(pdb, Structure):
             return pdb
 
-        return self.cif(pdb).structure()
+        if isinstance(pdb, Cif):
+            return pdb.structure()
+
+        filename = self._cif(pdb)
+        if self.structures is not None and not self.modifies_structure:
+            return self.structures.fetch(
+                filename, 'structure',
+                lambda: self._load_structure(pdb, filename))
+        return self._load_structure(pdb, filename)
+
+    def _load_structure(self, pdb, filename):
+        """Load the structure from the store of parsed structures, if it is
+        there, otherwise parse it and add it to the store.
+        """
+
+        store = self._store
+        if store is None:
+            return self.cif(pdb).structure()
+
+        checksum = store.checksum(filename)
+        structure = store.load(filename, checksum=checksum)
+        if structure is None:
+            structure = self.cif(pdb).structure()
+            store.save(filename, structure, checksum=checksum)
+        return structure
 
     def cache_filename(self, name):
-        """Determine the path to cache file for the given name. This will
-        compute the full path to the configured cache directory and create the
-        directory if needed. If the pipeline does not have permission to do so
-        it will raise an error.
+        """Determine the path to cache file for the given name. This is the
+        file in the configured cache directory that the data is, or would
+        be, stored in.
 
         Parameters
         ----------
@@ -204,16 +290,12 @@ class Stage(base.Base):
         path : str
             The path to the cache file.
         """
+        return self._cache_store.filename(name)
 
-        cache_dir = self.config['locations']['cache']
-        if not os.path.isdir(cache_dir):
-            os.mkdir(cache_dir)
-
-        return os.path.join(cache_dir, name + '.pickle')
-
-    def cache(self, name, data):
-        """Cache some data under a name. This will write the given data to a
-        file in the configured 'cache' directory using the given name.
+    def cache(self, name, data, fingerprint=None):
+        """Cache some data under a name. This will write the given data to
+        the `pymotifs.core.cache.CacheStore` in the configured 'cache'
+        directory using the given name, recording this stage as the creator.
 
         Parameters
         ----------
@@ -222,11 +304,49 @@ class Stage(base.Base):
 
         data : object
             The data to cache.
+
+        fingerprint : str, optional
+            A fingerprint of the input the data was computed from.
         """
 
-        filename = self.cache_filename(name)
-        with open(filename, 'wb') as raw:
-            pickle.dump(data, raw)
+        self._cache_store.store(name, data, creator=self.name,
+                                fingerprint=fingerprint)
+
+    def fingerprint(self, *values):
+        """Compute a fingerprint of the input of some cached data, see
+        `pymotifs.core.cache.fingerprint`.
+
+        Parameters
+        ----------
+        *values : object
+            The values to fingerprint.
+
+        Returns
+        -------
+        fingerprint : str
+            The fingerprint.
+        """
+        return cache.fingerprint(*values)
+
+    def cached_fingerprint(self, name):
+        """Get the fingerprint that some cached data was stored with.
+
+        Parameters
+        ----------
+        name : str
+            The cache file name.
+
+        Returns
+        -------
+        fingerprint : str
+            The fingerprint or None if there is no such data or it was stored
+            without one.
+        """
+
+        metadata = self._cache_store.metadata(name)
+        if metadata is None:
+            return None
+        return metadata.get('fingerprint')
 
     def evict(self, name):
         """Clear cached data for the given name. This will remove cached data
@@ -238,13 +358,10 @@ class Stage(base.Base):
             The name of the cache to remove
         """
 
-        filename = self.cache_filename(name)
-        if not os.path.exists(filename):
+        if not self._cache_store.evict(name):
             self.logger.warning("Attempt to remove nonexisting cache %s", name)
-            return None
-        os.remove(filename)
 
-    def cached(self, name, remove=False):
+    def cached(self, name, remove=False, fingerprint=None):
         """Load some cached data. This will load the cache file if it exists.
         If not it will return `None`.
 
@@ -254,6 +371,9 @@ class Stage(base.Base):
             The cache file name.
         remove : bool, optional
             If we should delete the file after loading it.
+        fingerprint : str, optional
+            If given, data cached with a different fingerprint is out of
+            date and `None` is returned.
 
         Returns
         -------
@@ -261,12 +381,7 @@ class Stage(base.Base):
             The cached object.
         """
 
-        filename = self.cache_filename(name)
-        data = None
-        if os.path.exists(filename):
-            with open(filename, 'rb') as raw:
-                data = pickle.load(raw)
-
+        data = self._cache_store.load(name, fingerprint=fingerprint)
         if remove:
             self.evict(name)
 
@@ -320,13 +435,17 @@ class Stage(base.Base):
         if not self.update_gap or ignore_time:
             return False
 
-        with self.session() as session:
-            current = session.query(mod.PdbAnalysisStatus).\
-                filter_by(pdb_id=pdb, stage=self.name).\
-                first()
-            if not current:
-                return True
-            current = current.time
+        found, current = self.prefetched('marks', pdb)
+        if not found:
+            with self.session() as session:
+                current = session.query(mod.PdbAnalysisStatus).\
+                    filter_by(pdb_id=pdb, stage=self.name).\
+                    first()
+                if current:
+                    current = current.time
+
+        if not current:
+            return True
         # If this has been marked as done in the far future do it anyway. That
         # is a silly thing to do
         diff = abs(datetime.datetime.now() - current)
@@ -342,12 +461,121 @@ class Stage(base.Base):
         :returns: True if this was done and marked in the past.
         """
 
+        found, current = self.prefetched('marks', pdb)
+        if found:
+            return current is not None
+
         with self.session() as session:
             query = session.query(mod.PdbAnalysisStatus).\
                 filter_by(pdb_id=pdb, stage=self.name).\
                 limit(1)
             return bool(query.count())
 
+    def bulk_has_data(self, entries, **kwargs):
+        """Determine which of the given entries already have data, using as
+        few queries as possible. By default stages cannot do this in bulk and
+        so this returns None, which means `is_missing` is used for each entry.
+
+        Parameters
+        ----------
+        entries : list
+            The entries to check.
+
+        Returns
+        -------
+        has_data : set or None
+            The set of entries which have data, or None if unknown.
+        """
+        return None
+
+    def bulk_status(self, entries, **kwargs):
+        """Load the status of all given entries at once. This loads the marks
+        of this stage, if they are needed, and which entries have data, using
+        `bulk_has_data`. Marks are loaded in chunks of `bulk_size`, so this
+        requires a handful of queries instead of several per entry.
+
+        Parameters
+        ----------
+        entries : list
+            The entries to check, only PDB ids will have their marks loaded.
+        **kwargs : dict
+            Keyword arguments passed on to `bulk_has_data`.
+
+        Returns
+        -------
+        status : dict
+            A dict with 'entries', the set of entries which were checked,
+            'marks', a dict from each marked entry to the time of the mark, or
+            None if marks were not needed, and 'has_data', as produced by
+            `bulk_has_data`. Entries which cannot be hashed, like lists, are
+            not checked, and if there are only such entries `bulk_has_data`
+            is not used.
+        """
+
+        checked = set()
+        hashable = []
+        for entry in entries:
+            try:
+                checked.add(entry)
+            except TypeError:
+                continue
+            hashable.append(entry)
+
+        pdbs = [e for e in checked if isinstance(e, basestring)]
+        marks = None
+        if pdbs and (self.update_gap or self.use_marks):
+            marks = {}
+            with self.session() as session:
+                for chunk in ut.grouper(self.bulk_size, pdbs):
+                    query = session.query(mod.PdbAnalysisStatus.pdb_id,
+                                          mod.PdbAnalysisStatus.time).\
+                        filter(mod.PdbAnalysisStatus.stage == self.name).\
+                        filter(mod.PdbAnalysisStatus.pdb_id.in_(chunk))
+                    marks.update((r.pdb_id, r.time) for r in query)
+
+        has_data = None
+        if hashable:
+            has_data = self.bulk_has_data(hashable, **kwargs)
+
+        return {
+            'entries': checked,
+            'marks': marks,
+            'has_data': has_data,
+        }
+
+    def prefetched(self, key, entry):
+        """Look up the status of an entry as loaded by `bulk_status`.
+
+        Parameters
+        ----------
+        key : str
+            Either 'marks' or 'has_data'.
+        entry : object
+            The entry to look up.
+
+        Returns
+        -------
+        result : tuple
+            A tuple of a flag if the status of the entry is known and the
+            value, the time it was marked or if it has data.
+        """
+
+        values = self._status.get(key)
+        if values is None:
+            return False, None
+
+        try:
+            if entry not in self._status['entries']:
+                return False, None
+        except TypeError:
+            return False, None
+
+        if key == 'has_data':
+            return True, entry in values
+        if not isinstance(entry, basestring):
+            return False, None
+        return True, values.get(entry)
+
     def should_process(self, entry, **kwargs):
         """Determine if we should process this entry. This is true if we are
         told to recompute, if we do not have data for this pdb or it has been
@@ -383,7 +611,12 @@ class Stage(base.Base):
             self.logger.info("Time gap for %s too large, recomputing", entry)
             return True
 
-        is_missing = self.is_missing(entry, **kwargs)
+        found, has_data = self.prefetched('has_data', entry)
+        if found:
+            is_missing = not has_data
+        else:
+            is_missing = self.is_missing(entry, **kwargs)
+
         if is_missing and self.use_marks and self.allow_no_data:
             if self.was_marked(entry, **kwargs):
                 self.logger.info("Marked as completed, despite no data")
@@ -423,62 +656,153 @@ class Stage(base.Base):
                 session.merge(status)
         self.logger.info('Updated %s status for pdb %s', self.name, pdb)
 
+    def jobs(self, entries, jobs=1, **kwargs):
+        """Determine the number of processes to use for processing the given
+        entries. Only stages which set `parallel` will use more than one
+        process and there is never more processes than entries.
+
+        Parameters
+        ----------
+        entries : list
+            The entries that will be processed.
+        jobs : int, optional
+            The requested number of processes.
+
+        Returns
+        -------
+        jobs : int
+            The number of processes to use.
+        """
+
+        if not self.parallel or not jobs:
+            return 1
+        return max(1, min(int(jobs), len(entries)))
+
+    def process_entry(self, index, entry, total, **kwargs):
+        """Process a single entry. This uses `should_process` to determine if
+        we should process the entry and if so calls `process` and then
+        `mark_processed`. If processing fails, the data is cleaned up with
+        `remove`. This is the work done for each entry by `__call__`, both
+        when running serially and when running in a pool of processes.
+
+        Parameters
+        ----------
+        index : int
+            The index of the entry, used for logging.
+        entry : object
+            The entry to process.
+        total : int
+            The total number of entries, used for logging.
+        **kwargs : dict
+            Keyword arguments passed on to various methods.
+
+        Raises
+        ------
+        InvalidState
+            If processing failed and we could not clean up.
+
+        Returns
+        -------
+        status : str
+            One of `PROCESSED`, `UNNEEDED`, `SKIPPED` or `FAILED`.
+        """
+
+        self.logger.info("Processing %s: %s/%s", entry, index + 1, total)
+
+        with profiling.span(self.profiler, 'entry', self.name, entry=entry):
+            return self._process_entry(entry, **kwargs)
+
+    def _process_entry(self, entry, **kwargs):
+        """Process a single entry inside of its profiling span. This is the
+        body of `process_entry`.
+        """
+
+        try:
+            with profiling.phase('should_process'):
+                needed = self.should_process(entry, **kwargs)
+            if not needed:
+                self.logger.debug("No need to process %s", entry)
+                return UNNEEDED
+            self.process(entry, **kwargs)
+
+        except Skip as err:
+            self.logger.warn("Skipping entry %s. Reason %s",
+                             str(entry), str(err))
+            return SKIPPED
+
+        except Exception as err:
+            self.logger.error("Error raised in processing of %s", entry)
+            self.logger.exception(err)
+
+            try:
+                self.remove(entry, **kwargs)
+            except Exception as err:
+                raise InvalidState("Could not cleanup failed data %s",
+                                   entry)
+            return FAILED
+
+        if self.mark:
+            self.mark_processed(entry, **kwargs)
+        return PROCESSED
+
     def __call__(self, given, **kwargs):
         """Process all given inputs. This will first transform all inputs with
         the `to_process` method. If there are no entries then a critical
-        exception is raised. We then use `should_process` to determine if we
-        should process each entry. If this returns
-        true then we call `process`. Once done we call `mark_processed`.
+        exception is raised. The status of all entries is loaded at once with
+        `bulk_status` and then we use `should_process` to determine if we
+        should process each entry. If this returns true then we call
+        `process`. Once done we call `mark_processed`. If given `jobs` and
+        this stage is `parallel` the entries are processed by a pool of that
+        many processes.
 
         :given: A list of pdbs to process.
         :kwargs: Keyword arguments passed on to various methods.
         :returns: Nothing
         """
 
-        entries = None
-        try:
-            entries = self.to_process(given, **kwargs)
-        except Skip as err:
-            self.logger.warn("Skipping this stage. Reason %s", str(err))
-            return []
+        with profiling.span(self.profiler, 'stage', self.name):
+            entries = None
+            try:
+                with profiling.phase('to_process'):
+                    entries = self.to_process(given, **kwargs)
+            except Skip as err:
+                self.logger.warn("Skipping this stage. Reason %s", str(err))
+                return []
 
-        if not entries:
-            self.logger.critical("Nothing to process")
-            raise InvalidState("Nothing to process")
+            if not entries:
+                self.logger.critical("Nothing to process")
+                raise InvalidState("Nothing to process")
 
-        failed = []
-        processed = []
-        for index, entry in enumerate(entries):
-            self.logger.info("Processing %s: %s/%s", entry, index + 1,
-                             len(entries))
+            if not self.must_recompute(entries, **kwargs):
+                with profiling.phase('bulk_status'):
+                    self._status = self.bulk_status(entries, **kwargs)
 
             try:
-                if not self.should_process(entry, **kwargs):
-                    self.logger.debug("No need to process %s", entry)
-                    continue
-                self.process(entry, **kwargs)
+                return self._process_all(entries, **kwargs)
+            finally:
+                self._status = {}
 
-            except Skip as err:
-                self.logger.warn("Skipping entry %s. Reason %s",
-                                 str(entry), str(err))
-                continue
+    def _process_all(self, entries, **kwargs):
+        """Process all entries, either serially or in a pool of processes,
+        and collect which ones failed. This is the main loop of `__call__`.
+        """
 
-            except Exception as err:
-                self.logger.error("Error raised in processing of %s", entry)
-                self.logger.exception(err)
+        jobs = self.jobs(entries, **kwargs)
+        if jobs > 1:
+            results = parallel.process_in_pool(self, entries, jobs, **kwargs)
+        else:
+            total = len(entries)
+            results = ((e, self.process_entry(i, e, total, **kwargs))
+                       for i, e in enumerate(entries))
 
-                try:
-                    self.remove(entry, **kwargs)
-                except Exception as err:
-                    raise InvalidState("Could not cleanup failed data %s",
-                                       entry)
-                else:
-                    failed.append(entry)
-                    continue
-
-            if self.mark:
-                self.mark_processed(entry, **kwargs)
-            processed.append(entry)
+        failed = []
+        processed = []
+        for entry, status in results:
+            profiling.record('entries')
+            if status == FAILED:
+                failed.append(entry)
+            elif status == PROCESSED:
+                processed.append(entry)
 
         if failed:
             ids = ' '.join(str(f) for f in failed)
@@ -508,9 +832,21 @@ class Loader(Stage):
     table = None
     """Sqlalchmey model to save to"""
 
+    bulk_insert = False
+    """ A flag to save data with Core executemany INSERTs into `table`. """
+
+    columns = None
+    """ Column names of the tuples to save when using `bulk_insert`. """
+
     saver = savers.DatabaseSaver
     """Use a `pymotifs.core.savers.DatabaseSaver` """
 
+    pipelined = False
+    """ A flag to write data in a background thread while computing it. """
+
+    pipeline_depth = 4
+    """ Max number of chunks of `insert_max` waiting to be written. """
+
     @abc.abstractmethod
     def data(self, pdb, **kwargs):
         """Compute the data for the given cif file.
@@ -556,7 +892,8 @@ class Loader(Stage):
         :kwargs: Keyword arguments.
         """
         saver = self.saver(self.config, self.session, stage=self)
-        saver(pdb, data, **kwargs)
+        with profiling.phase('save', exclude='data'):
+            saver(pdb, data, **kwargs)
 
     def process(self, entry, **kwargs):
         """Get the data for a particular entry. This will get the data and then
@@ -574,7 +911,9 @@ class Loader(Stage):
                 self.logger.debug("Removing old data for %s", entry)
                 self.remove(entry)
 
-        data = self.data(entry, **kwargs)
+        with profiling.phase('data'):
+            data = self.data(entry, **kwargs)
+        data = profiling.timed(data, 'data')
 
         if not data:
             if not self.allow_no_data:
@@ -584,7 +923,84 @@ class Loader(Stage):
                 self.logger.warning("No data produced for %s", str(entry))
                 return
 
-        self.store(entry, data, **kwargs)
+        if self.pipelined:
+            self.store_pipelined(entry, data, **kwargs)
+        else:
+            self.store(entry, data, **kwargs)
+
+    def store_pipelined(self, pdb, data, **kwargs):
+        """Store data while it is still being computed. The data is split
+        into chunks of `insert_max` in this thread, which are put on a queue
+        of at most `pipeline_depth` chunks. A background thread writes them
+        with `store`, so computing and writing overlap. When the queue is
+        full computing waits for the writer to catch up.
+
+        If computing the data fails the writer is stopped, which rolls back
+        what it is writing, and the error is raised here so the entry is
+        cleaned up with `remove` as usual. If writing fails, computing stops
+        and the error from the writer is raised. Counters recorded while
+        writing, such as the rows saved, are added to the profiling spans
+        of this thread once the writer is done.
+
+        :pdb: The entry the data belongs to.
+        :data: The data to store, usually a generator.
+        :kwargs: Keyword arguments for `store`.
+        """
+
+        single = (dict, tuple) if self.bulk_insert else dict
+        if isinstance(data, single) or not isinstance(data, coll.Iterable):
+            data = [data]
+
+        chunks = Queue.Queue(maxsize=self.pipeline_depth)
+        failure = []
+        counts = {}
+
+        def consume():
+            while True:
+                chunk = chunks.get()
+                if chunk is _DONE:
+                    return
+                if chunk is _ABORT:
+                    raise InvalidState("Computing data for %s failed" % pdb)
+                for entry in chunk:
+                    yield entry
+
+        def write():
+            with profiling.collect() as collected:
+                try:
+                    self.store(pdb, consume(), **kwargs)
+                except Exception:
+                    failure.append(sys.exc_info())
+            counts.update(collected)
+
+        writer = threading.Thread(target=write, name='%s-writer' % self.name)
+        writer.daemon = True
+
+        def put(chunk):
+            while writer.is_alive():
+                try:
+                    chunks.put(chunk, timeout=0.1)
+                    return True
+                except Queue.Full:
+                    pass
+            return False
+
+        writer.start()
+        try:
+            for chunk in ut.grouper(self.insert_max, data):
+                if not put(chunk):
+                    break
+        except Exception:
+            error = sys.exc_info()
+            put(_ABORT)
+            writer.join()
+            raise error[0], error[1], error[2]
+
+        put(_DONE)
+        writer.join()
+        profiling.merge(counts)
+        if failure:
+            raise failure[0][0], failure[0][1], failure[0][2]
 
 
 class SimpleLoader(Loader):
@@ -596,20 +1012,68 @@ class SimpleLoader(Loader):
 
     __metaclass__ = abc.ABCMeta
 
+    delete_max = 10000
+    """ Max number of rows to delete in one transaction. """
+
     def has_data(self, args, **kwargs):
         """Check if we already have data.
         """
         with self.session() as session:
             return bool(self.query(session, args).limit(1).count())
 
+    def bulk_has_data(self, entries, **kwargs):
+        """Check which entries already have data. This builds an EXISTS
+        subquery from `query` for each entry and combines those for
+        `bulk_size` entries into a single UNION ALL query. This is only done
+        for stages which use the default `has_data` and `is_missing`, as a
+        stage which overrides either may mean something other than "query
+        has rows". If the query for any entry cannot be built or run this
+        gives up and returns None, so each entry is checked with `has_data`.
+
+        Parameters
+        ----------
+        entries : list
+            The entries to check.
+
+        Returns
+        -------
+        has_data : set or None
+            The entries which have data, or None if unknown.
+        """
+
+        klass = type(self)
+        if klass.has_data.__func__ is not SimpleLoader.has_data.__func__ or \
+                klass.is_missing.__func__ is not Loader.is_missing.__func__:
+            return None
+
+        found = set()
+        try:
+            with self.session() as session:
+                for chunk in ut.grouper(self.bulk_size, entries):
+                    queries = []
+                    for index, entry in enumerate(chunk):
+                        exists = self.query(session, entry).exists()
+                        queries.append(session.query(
+                            literal(index).label('position'),
+                            exists.label('found')))
+
+                    query = queries[0].union_all(*queries[1:])
+                    found.update(chunk[r.position] for r in query if r.found)
+        except Exception as err:
+            self.logger.warning("Cannot check data in bulk: %s", err)
+            return None
+        return found
+
     def remove(self, args, **kwargs):
         """This will delete all entries for the given arguments. If the keyword
         argument dry_run is given then this will not actually delete anything.
         This will also check if there is nothing to delete and do nothing in
-        that case. This also deals with the fact that SQLalchemly does not
-        support joins in delete for mysql by finding all data, and then
-        deleting each entry. This is very slow but does allow us to use joins
-        in the query method.
+        that case. SQLalchemly does not support joins in delete for mysql, so
+        the query is translated with `pymotifs.core.db.delete_statement` into
+        a DELETE of the primary keys it selects. This is executed repeatedly,
+        deleting at most `delete_max` rows in each transaction. If the query
+        cannot be translated we fall back to finding all data, and then
+        deleting each entry, which is very slow.
 
         :param args: The argument to remove, generally a PDB id.
         """
@@ -620,12 +1084,34 @@ class SimpleLoader(Loader):
 
         with self.session() as session:
             query = self.query(session, args)
-            if not query.count():
-                self.logger.info("Nothing to delete for %s", str(args))
-                return True
+            try:
+                statement = db.delete_statement(query, limit=self.delete_max)
+            except Exception as err:
+                self.logger.warning("Cannot delete in bulk for %s: %s",
+                                    str(args), err)
+                statement = None
+
+            if statement is None:
+                if not query.count():
+                    self.logger.info("Nothing to delete for %s", str(args))
+                    return True
+
+                for row in query:
+                    session.delete(row)
+                return None
 
-            for row in query:
-                session.delete(row)
+        deleted = 0
+        while True:
+            with self.session() as session:
+                count = session.execute(statement).rowcount
+            deleted += count
+            if count < self.delete_max:
+                break
+
+        if not deleted:
+            self.logger.info("Nothing to delete for %s", str(args))
+            return True
+        self.logger.info("Deleted %i rows for %s", deleted, str(args))
 
     @abc.abstractmethod
     def query(self, session, entry):
@@ -669,6 +1155,12 @@ class MassLoader(Loader):
     def to_process(self, pdbs, **kwargs):
         return [tuple(super(MassLoader, self).to_process(pdbs))]
 
+    def bulk_status(self, entries, **kwargs):
+        """Load the status of each pdb in all given collections of pdbs.
+        """
+        pdbs = list(it.chain.from_iterable(entries))
+        return super(MassLoader, self).bulk_status(pdbs, **kwargs)
+
     def should_process(self, pdbs, **kwargs):
         """We check if we have data for all pdbs. If we are missing 1 then we
         will recompute.
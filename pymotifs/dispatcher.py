@@ -3,10 +3,16 @@ class is what will determine each stage to run and then run them in the correct
 order.
 """
 
+import Queue
 import logging
+import threading
+import multiprocessing as mp
 import itertools as it
 
 from pymotifs import core
+from pymotifs.core import parallel
+from pymotifs.core.cache import StructureCache
+from pymotifs.core.profiling import Profiler
 from pymotifs.cli import introspect as intro
 
 from pymotifs.utils import flatten
@@ -36,14 +42,58 @@ class Dispatcher(object):
             A list, set or tuple of stage names to exclude. This will also
             exclude all dependencies of the stage if they are only used for the
             stage.
+        concurrent_stages : int, optional
+            The maximum number of stages to run at once. Defaults to 1, which
+            runs all stages serially.
+        stage_mode : str, optional
+            Either 'thread' or 'process', how to run stages concurrently.
+            Defaults to 'thread'. Stages which use a pool of processes, when
+            `jobs` is larger than 1, share module level state with the
+            workers and must not fork from threads, so those always run
+            concurrently in processes.
+        jobs : int, optional
+            The number of processes each stage may use.
+        timings : str, optional
+            A file to append JSON lines of the timing of each stage and entry
+            to. Defaults to the 'timings' entry of the 'profile' section of
+            the configuration.
+        profile : bool, optional
+            If each entry should be run under cProfile, keeping the profiles
+            of the `profile_slowest` slowest entries. Defaults to False.
         """
 
         self.name = name
         self._args = args
         self.skip_dependencies = kwargs.get('skip_dependencies')
         self.exclude = set(kwargs.get('exclude', []) or [])
+        self.concurrent_stages = kwargs.get('concurrent_stages') or 1
+        self.stage_mode = kwargs.get('stage_mode') or 'thread'
+        self.profiler = self.build_profiler(**kwargs)
         self.logger = logging.getLogger(__name__)
 
+        if self.concurrent_stages > 1 and self.stage_mode == 'thread' and \
+                (kwargs.get('jobs') or 1) > 1:
+            self.logger.warning("Running concurrent stages in processes, "
+                                "as they use several jobs")
+            self.stage_mode = 'process'
+
+    def build_profiler(self, **kwargs):
+        """Create the profiler to time all stages in this run. The settings
+        come from the given keyword arguments, falling back to the 'profile'
+        section of the configuration.
+
+        :returns: A new `pymotifs.core.profiling.Profiler`.
+        """
+
+        config = self._args[0] if self._args else {}
+        options = config.get('profile', {})
+        return Profiler(
+            filename=kwargs.get('timings') or options.get('timings'),
+            profile=bool(kwargs.get('profile')),
+            slowest=kwargs.get('profile_slowest') or options.get('slowest', 5),
+            directory=options.get('directory', 'profiles'),
+        )
+
     def to_exclude(self, *names, **kwargs):
         """Compute a set of stages to exclude. This will load all stages in the
         exclude property to do so. If one entry there is a StageContainer then
@@ -156,18 +206,15 @@ class Dispatcher(object):
             raise core.InvalidState("No stages to run")
         return stages
 
-    def stages(self, name):
-        """Determine all stages to run and in what order for the given stage
-        name. If dependencies is set to True then this will go through all
-        dependecies of the given stage and place them in a tree, as well as all
-        of their dependecies and so forth. The stages will be sorted
-        topologically and then returned in that order.
-
-        If dependecies is False, then a list of one element, the specified
-        stage will be returned.
+    def plan(self, name):
+        """Compute the dependency graph and the exclude and allowed flags for
+        the given stage name. If dependencies is set to True then this will go
+        through all dependecies of the given stage and place them in a tree,
+        as well as all of their dependecies and so forth.
 
         :param str name: The name of the stage to run.
-        :returns: A list of the stages to run.
+        :returns: A tuple of the dependency graph, the stages to exclude and
+        the stages which are allowed.
         """
 
         allowed = set()
@@ -191,21 +238,214 @@ class Dispatcher(object):
         else:
             deps = self.dependencies([klass])
 
-        return self.flatten(deps, exclude, allowed)
+        return deps, exclude, allowed
+
+    def stages(self, name):
+        """Determine all stages to run and in what order for the given stage
+        name. The stages will be sorted topologically and then returned in
+        that order.
+
+        If dependecies is False, then a list of one element, the specified
+        stage will be returned.
+
+        :param str name: The name of the stage to run.
+        :returns: A list of the stages to run.
+        """
+        return self.flatten(*self.plan(name))
+
+    def requirements(self, stages, dependencies):
+        """Compute which of the stages to run must finish before each stage
+        can start. Stages which are not run do not need to finish, but
+        anything they depend upon, which is run, does. This means that
+        excluding a stage never allows its dependents to start before the
+        stages it depends on.
+
+        Parameters
+        ----------
+        stages : list
+            The stages that will be run.
+        dependencies : dict
+            The dependency graph from `dependencies`.
+
+        Returns
+        -------
+        requirements : dict
+            A mapping from the name of each stage to the set of names of the
+            stages which must finish first.
+        """
+
+        names = dict((type(s), s.name) for s in stages)
+
+        def required(klass, seen):
+            found = set()
+            for dep in dependencies.get(klass, set()):
+                if dep in seen:
+                    continue
+                seen.add(dep)
+                if dep in names:
+                    found.add(dep)
+                else:
+                    found.update(required(dep, seen))
+            return found
+
+        requirements = {}
+        for stage in stages:
+            deps = required(type(stage), set([type(stage)]))
+            requirements[stage.name] = set(names[d] for d in deps)
+        return requirements
+
+    def _start(self, stage, entries, done, **kwargs):
+        """Start running a single stage concurrently. Once the stage is
+        finished the stage and any exception it raised, or None, are placed
+        into the done queue. A stage run in a process sends its timings and
+        profiles back to the profiler of this dispatcher.
+
+        :returns: The started thread or process.
+        """
+
+        self.logger.info("Starting stage: %s", stage.name)
+        if self.stage_mode == 'process':
+            receiver, sender = mp.Pipe(duplex=False)
+            worker = parallel.stage_process(stage, entries, results=sender,
+                                            **kwargs)
+            worker.start()
+            sender.close()
+
+            def wait():
+                try:
+                    taken = receiver.recv()
+                except EOFError:
+                    taken = None
+                receiver.close()
+                worker.join()
+                if taken is not None:
+                    stages, profiles = taken
+                    self.profiler.add(stages=stages, profiles=profiles)
+                error = None
+                if worker.exitcode:
+                    error = core.StageFailed("Stage %s exited with %s" %
+                                             (stage.name, worker.exitcode))
+                done.put((stage, error))
+
+            waiter = threading.Thread(target=wait, name=stage.name)
+            waiter.daemon = True
+            waiter.start()
+            return waiter
+
+        def run():
+            try:
+                stage(entries, **kwargs)
+            except Exception as err:
+                self.logger.exception(err)
+                done.put((stage, err))
+            else:
+                done.put((stage, None))
+
+        thread = threading.Thread(target=run, name=stage.name)
+        thread.daemon = True
+        thread.start()
+        return thread
+
+    def run_concurrently(self, stages, requirements, entries, **kwargs):
+        """Run the given stages with up to `concurrent_stages` at once. A
+        stage is started as soon as all stages it requires have finished,
+        without waiting for the rest of its level. Stages which are ready at
+        the same time are started in the order given. If any stage fails no
+        new stages are started, the running ones are allowed to finish and
+        then the first error is raised.
+
+        :param list stages: The stages to run, in topological order.
+        :param dict requirements: The requirements from `requirements`.
+        :param list entries: The entries to use as input.
+        :kwargs: Keyword arguments to pass to each stage.
+        """
+
+        pending = list(stages)
+        finished = set()
+        running = {}
+        done = Queue.Queue()
+        error = None
+
+        while pending or running:
+            if error is None:
+                for stage in list(pending):
+                    if len(running) >= self.concurrent_stages:
+                        break
+                    if requirements[stage.name] <= finished:
+                        pending.remove(stage)
+                        running[stage.name] = self._start(stage, entries,
+                                                          done, **kwargs)
+
+            if not running:
+                break
+
+            stage, err = done.get()
+            running.pop(stage.name).join()
+            if err is not None:
+                self.logger.error("Uncaught exception with stage: %s",
+                                  stage.name)
+                error = error or err
+            else:
+                self.logger.info("Finished stage: %s", stage.name)
+                finished.add(stage.name)
+
+        if error is not None:
+            raise error
 
     def __call__(self, entries, **kwargs):
         """Call the specified stages using the given entries as input. This
         will determine what stages to run using the name property and then run
-        them in the correct order.
+        them in the correct order. If `concurrent_stages` is larger than 1
+        then independent stages are run at the same time.
 
         :param list entries: The entries to use as input.
         :kwargs: Keyword arguments to pass to each stage.
         """
 
-        stages = self.stages(self.name)
+        dependencies, exclude, allowed = self.plan(self.name)
+        stages = self.flatten(dependencies, exclude, allowed)
         self.logger.info('Running stages: %s',
                          ', '.join(s.name for s in stages))
 
+        structures = self.structure_cache()
+        for stage in stages:
+            stage.structures = structures
+            stage.profiler = self.profiler
+
+        try:
+            if self.concurrent_stages > 1:
+                requirements = self.requirements(stages, dependencies)
+                self.run_concurrently(stages, requirements, entries, **kwargs)
+            else:
+                self.run_serially(stages, entries, **kwargs)
+        finally:
+            structures.log_stats()
+            structures.clear()
+            self.profiler.close()
+            self.profiler.dump_profiles()
+
+        self.logger.info("Finished pipeline")
+
+    def structure_cache(self):
+        """Create the cache of parsed structures to share between all stages
+        in this run. The size is set by the 'max_size' entry of the
+        'structure_cache' section of the configuration.
+
+        :returns: A new `pymotifs.core.cache.StructureCache`.
+        """
+
+        config = self._args[0] if self._args else {}
+        max_size = config.get('structure_cache', {}).get('max_size', 0)
+        return StructureCache(max_size)
+
+    def run_serially(self, stages, entries, **kwargs):
+        """Run the given stages one after the other.
+
+        :param list stages: The stages to run, in topological order.
+        :param list entries: The entries to use as input.
+        :kwargs: Keyword arguments to pass to each stage.
+        """
+
         for stage in stages:
             try:
                 self.logger.info("Running stage: %s", stage.name)
@@ -214,5 +454,3 @@ class Dispatcher(object):
                 self.logger.error("Uncaught exception with stage: %s",
                                   self.name)
                 raise err
-
-        self.logger.info("Finished pipeline")
@@ -1,13 +1,16 @@
-"""Module for export of unit center/rotation data 
-in pickle format for FR3D.
+"""Module for export of unit center/rotation data for FR3D. The base
+centers and rotation matrices of all RNA units in a structure are written to
+the columnar `pymotifs.utils.unit_geometry` store, ordered by chain and
+position, so the data of any chain can be read back as array views.
 """
 
-import numpy as np
 import os
-import pickle
+
+import numpy as np
 
 from pymotifs import core
 from pymotifs import models as mod
+from pymotifs.utils.unit_geometry import UnitGeometryStore
 
 from pymotifs.chains.info import Loader as ChainLoader
 from pymotifs.units.centers import Loader as CentersLoader
@@ -16,12 +19,9 @@ from pymotifs.exp_seq.mapping import Loader as MappingLoader
 from pymotifs.exp_seq.positions import Loader as PositionLoader
 from pymotifs.ife.info import Loader as IfeInfoLoader
 
-from os import path
-
 
 class Exporter(core.Loader):
-    """Export unit data in pickle format, one file per 
-    IFE-chain.
+    """Export unit data for FR3D, one store entry per structure.
     """
 
 
@@ -31,31 +31,26 @@ class Exporter(core.Loader):
     dependencies = set([ChainLoader, CentersLoader, RotationsLoader, 
                         PositionLoader, IfeInfoLoader, MappingLoader])
 
+    def __init__(self, *args, **kwargs):
+        super(Exporter, self).__init__(*args, **kwargs)
+        self.store = UnitGeometryStore(
+            self.config['locations']['unit_geometry'])
 
-    def has_data(self, entry, *args, **kwargs):
-        self.logger.info("has_data: entry: %s" % str(entry))
-        filename = self.filename(entry)
-        self.logger.info("has_data: filename: %s" % filename)
-        if os.path.exists(filename) is True:
-            self.logger.info("has_data: filename %s exists" % filename)
-            return True
-        self.logger.info("has_data: filename %s is missing" % filename)
-        return False
+    def has_data(self, pdb, *args, **kwargs):
+        return self.store.has(pdb)
 
 
-    def remove():
-        pass
+    def remove(self, pdb, *args, **kwargs):
+        self.store.remove(pdb)
 
 
-    def filename(self, ichain, **kwargs):
-        """Create the filename for the given IFE-chain.
+    def filename(self, pdb, **kwargs):
+        """Get the directory the data of the given structure is written to.
 
         Parameters
         ----------
-        ichain : tuple
-            The components (PDB ID, model, and chain) of the 
-            IFE-chain name (hyphen-deliminted concatenation) 
-            for which to create a file.
+        pdb : str
+            The PDB id.
 
         Returns
         -------
@@ -63,41 +58,26 @@ class Exporter(core.Loader):
             The path to write to.
         """
 
-        # TO DO: put the important directories into the config
-
-        pdb = ichain[0]
-        mdl = ichain[1]
-        chn = ichain[2]
+        return self.store.path(pdb)
 
-        chain_string = pdb + '-' + str(mdl) + '-' + chn
 
-        self.logger.debug("filename: chain_string: %s" % chain_string)
-
-        return os.path.join("pickle-FR3D",chain_string + "_RNA.pickle")
-
-
-    def data(self, ichain, **kwargs):
-        """Get all unit listings for the given IFE-chain, centers and
-        rotations, and format them for convenient use by FR3D.
+    def data(self, pdb, **kwargs):
+        """Get the centers and rotations of all RNA units in the given
+        structure, ordered by model, chain and position.
 
         Parameters
         ----------
-        ichain : tuple
-            The IFE-chain for which to look up centers and rotation data.
+        pdb : str
+            The PDB id for which to look up centers and rotation data.
 
         Returns
         -------
-        resultset : list of dicts
+        resultset : list
+            A list of the unit ids, positions, an N x 3 array of centers and
+            an N x 3 x 3 array of rotations.
         """
 
-        pdb = ichain[0]
-        mdl = ichain[1]
-        chn = ichain[2]
-
         with self.session() as session:
-            self.logger.debug("cenrot: Inside data retrieval routine")
-            self.logger.debug("cenrot: building query")
-
             query = session.query(mod.UnitInfo.unit_id,
                                mod.ExpSeqPosition.index.label('position_order'),
                                mod.UnitCenters.x,
@@ -120,85 +100,64 @@ class Exporter(core.Loader):
                      filter(mod.UnitInfo.unit_type_id == 'rna').\
                      filter(mod.UnitCenters.name == 'base').\
                      filter(mod.UnitInfo.pdb_id == pdb).\
-                     filter(mod.UnitInfo.model == str(mdl)).\
-                     filter(mod.UnitInfo.chain == chn).\
-                     order_by(mod.ExpSeqPosition.index)
-
-            self.logger.debug("cenrot: query built")
+                     order_by(mod.UnitInfo.model,
+                              mod.UnitInfo.chain,
+                              mod.ExpSeqPosition.index)
 
-            units = []
-            order = []
-            cntrs = []
-            rttns = [] 
-            rsset = []
+            rows = query.all()
 
-            for row in query:
-                units.append(row.unit_id)
-                order.append(row.position_order)
-                cntrs.append(np.asarray([row.x, row.y, row.z]))
-                rttns.append(np.asarray([np.asarray([row.cell_0_0, row.cell_0_1, row.cell_0_2]),
-                             np.asarray([row.cell_1_0, row.cell_1_1, row.cell_1_2]),
-                             np.asarray([row.cell_2_0, row.cell_2_1, row.cell_2_2])]))
-                
-            rsset = [ units, order, cntrs, rttns ]
+        units = [row.unit_id for row in rows]
+        order = [row.position_order for row in rows]
+        cntrs = np.array([(row.x, row.y, row.z) for row in rows],
+                         dtype=float).reshape(-1, 3)
+        rttns = np.array([(row.cell_0_0, row.cell_0_1, row.cell_0_2,
+                           row.cell_1_0, row.cell_1_1, row.cell_1_2,
+                           row.cell_2_0, row.cell_2_1, row.cell_2_2)
+                          for row in rows], dtype=float).reshape(-1, 3, 3)
 
-            self.logger.debug("cenrot: units: %s" % str(units))
-            self.logger.debug("cenrot: order: %s" % str(order))
-            self.logger.debug("cenrot: cntrs: %s" % str(cntrs))
-            self.logger.debug("cenrot: rttns: %s" % str(rttns))
-            self.logger.debug("cenrot: rsset: %s" % str(rsset))
-
-            return rsset
+        self.logger.debug("cenrot: Found %i units in %s", len(units), pdb)
+        return [units, order, cntrs, rttns]
 
 
     def to_process(self, pdbs, **kwargs):
-        """Look up the list of IFE-chains to process.  Ignores the pdbs input.
+        """Look up the structures with RNA units to process.
 
         Parameters
         ----------
         pdbs : list
-            Ignored.
+            The PDB ids to consider.
 
         Returns
         -------
-        (pdb_id, model, chain) : tuple
-            The components of the IFE-chains to be processed.
+        pdbs : list
+            The PDB ids with RNA units.
         """
 
         with self.session() as session:
-            query = session.query(
-                       mod.UnitInfo.pdb_id,
-                       mod.UnitInfo.model,
-                       mod.UnitInfo.chain
-                   ).\
+            query = session.query(mod.UnitInfo.pdb_id).\
                    distinct().\
-                   filter(mod.UnitInfo.unit_type_id == 'rna')
+                   filter(mod.UnitInfo.unit_type_id == 'rna').\
+                   filter(mod.UnitInfo.pdb_id.in_(pdbs))
 
-            return [(r.pdb_id, r.model, r.chain) for r in query]
+            return sorted(r.pdb_id for r in query)
 
 
     def process(self, entry, **kwargs):
-        """Load centers/rotations data for the given IFE-chain.
+        """Store centers/rotations data for the given structure.
 
         Parameters
         ----------
-        entry : object
-            The entry to process.
+        entry : str
+            The PDB id to process.
         **kwargs : dict
             Generic keyword arguments.
         """
 
-        webroot = self.config['locations']['fr3d_pickle_base'] + "/units/"
-
-        filename = self.filename(entry)
-
-        uinfo = self.data(entry)
-
-        with open(filename, 'wb') as fh:
-            self.logger.debug("process: filename open: %s" % filename)
-            # Use 2 for "HIGHEST_PROTOCOL" for Python 2.3+ compatibility.
-            pickle.dump(uinfo, fh, 2)
-
-        os.system("rsync -u %s %s" % (filename, webroot))
-        self.logger.debug("rsync -u %s %s" % (filename, webroot))
+        units, order, cntrs, rttns = self.data(entry)
+        filename = self.store.write(entry, units, order, cntrs, rttns)
 
+        webroot = self.config['locations'].get('fr3d_pickle_base')
+        if webroot:
+            webroot = webroot + "/units/"
+            os.system("rsync -ru %s %s" % (filename, webroot))
+            self.logger.debug("rsync -ru %s %s" % (filename, webroot))
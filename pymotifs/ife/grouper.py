@@ -10,6 +10,7 @@ from pymotifs import core
 from pymotifs.constants import IFE_EXTERNAL_INTERNAL_FRACTION as CUTOFF
 from pymotifs.ife.helpers import IfeLoader
 from pymotifs.ife.helpers import IfeGroup
+from pymotifs.utils.union_find import UnionFind
 
 
 class Grouper(core.Base):
@@ -97,22 +98,22 @@ class Grouper(core.Base):
         interactions.
         """
 
-        groups = {}
-        for ife in ifes:
-            groups[ife.id] = IfeGroup(ife)
-
         same, rest = self.parition_interactions(ifes, inters)
 
         # If both groups are structured or not structured and the ifes can be
         # joined then they should be merged into one group and both ifes should
         # reflect this. Basically connections between these types of ifes
-        # are transitive.
+        # are transitive, so the groups are the connected components.
+        by_id = dict((ife.id, ife) for ife in ifes)
+        components = UnionFind(ife.id for ife in ifes)
         for ife1, ife2 in self.joinable(same, ifes):
-            current = groups[ife1.id]
-            current.merge(groups[ife2.id])
-            linked = set(groups[ife1.id].chains() + groups[ife2.id].chains())
-            for ife in linked:
-                groups[ife.id] = current
+            components.union(ife1.id, ife2.id)
+
+        groups = {}
+        for ids in components.components().values():
+            current = IfeGroup(*[by_id[id] for id in ids])
+            for id in ids:
+                groups[id] = current
 
         # Here if we are merging an unstructured into a structured we only
         # should update the structured one, the unstructured chain may be part
@@ -16,6 +16,9 @@ class Loader(core.SimpleLoader):
     allow_no_data = True
     dependencies = set([UnitLoader, PdbLoader])
 
+    """Hydrogens are inferred in place, so the structure is not shared"""
+    modifies_structure = True
+
     @property
     def table(self):
         return mod.UnitAaInteractions
@@ -0,0 +1,133 @@
+"""Shared logic of the stages which add the data of modified nucleotides
+that are missing it. All units of known modified nucleotides without data
+are found with a single query, grouped by structure, and then each
+structure is parsed and the data computed for its missing units. Structures
+are independent, so with more than one job they are processed in a pool of
+worker processes.
+"""
+
+import abc
+import collections as coll
+
+from pymotifs import core
+from pymotifs import models as mod
+from pymotifs.core import parallel
+
+
+# list the modified nucleotides that should be checked to see if they have
+# centers and a rotation matrix, if not they will be computed
+# there needs to be a mapping of atoms in each modified nucleotide to the
+# parent atoms, in fr3d-python.fr3d.modified_parent_mapping.py
+# this list was produced directly from modified_parent_mapping, plus DNA
+# nucleotides
+mod_ref = ('DA','DC','DG','DT','10C', '125', '126', '127', '12A', '1MA', '1MG', '1SC', '23G', '2AU', '2MA', '2MG', '2MU', '2OM', '3AU', '3MU', '3TD', '4OC', '4SU', '5BU', '5FA', '5FU', '5IC', '5MC', '5MU', '6IA', '70U', '7MG', '8AN', 'A23', 'A2L', 'A2M', 'A3P', 'A44', 'A5M', 'A5O', 'AET', 'AP7', 'AVC', 'C2L', 'C31', 'C43', 'CBV', 'CCC', 'CG1', 'CH', 'CNU', 'CSF', 'FHU', 'G25', 'G2L', 'G46', 'G48', 'G7M', 'GAO', 'GDP', 'GH3', 'GOM', 'GRB', 'GTP', 'H2U', 'IC', 'IG', 'IU', 'KAG', 'LCA', 'M2G', 'M4C', 'M5M', 'MA6', 'MAD', 'MGQ', 'MGV', 'MIA', 'MNU', 'MTU', 'N5M', 'N6G', 'O2G', 'OMC', 'OMG', 'OMU', 'ONE', 'P5P', 'PGP', 'PMT', 'PPU', 'PSU', 'PU', 'PYO', 'QUO', 'RIA', 'RSQ', 'RUS', 'S4C', 'SRA', 'SSU', 'SUR', 'T6A', 'TPG', 'U2L', 'U2P', 'U31', 'U34', 'U36', 'U37', 'U8U', 'UAR', 'UD5', 'UMP', 'UR3', 'URD', 'US5', 'XTS', 'YG', 'YYG', 'ZAD', 'ZBC', 'ZBU', 'ZCY', 'ZGU')
+
+
+class Loader(core.MassLoader):
+    """A base class for loading the missing data of modified nucleotides.
+    Subclasses provide the table to check and the rows for a residue.
+    """
+
+    __metaclass__ = abc.ABCMeta
+
+    allow_no_data = True
+    """pipeline won't crash when we pass back no data"""
+
+    all_structures = True
+    """Fill in units from every structure in the database, not only the
+    given ones"""
+
+    def has_data(self, pdb, **kwargs):
+        """Missing units are found when computing the data, so this is
+        always False.
+        """
+        return False
+
+    def group_units(self, units_list):
+        """Organize unit ids by the structure they are from.
+
+        :units_list: An iterable of unit ids.
+        :returns: A dict from PDB id to the sorted list of its unit ids.
+        """
+
+        grouped = coll.defaultdict(list)
+        for unit_id in units_list:
+            grouped[unit_id.split('|')[0]].append(unit_id)
+        return dict((pdb, sorted(units)) for pdb, units in grouped.items())
+
+    def missing(self, pdbs):
+        """Query the database once to find all units of modified nucleotides
+        which are not in `table`.
+
+        :pdbs: The PDB ids to limit to, unless `all_structures` is set.
+        :returns: A list of unit ids.
+        """
+
+        with self.session() as session:
+            info = mod.UnitInfo
+            query = session.query(info.unit_id).\
+                outerjoin(self.table, self.table.unit_id == info.unit_id).\
+                filter(self.table.unit_id == None).\
+                filter(info.unit.in_(mod_ref))
+
+            if not self.all_structures:
+                query = query.filter(info.pdb_id.in_(pdbs))
+
+            return [r.unit_id for r in query]
+
+    def compute(self, entry):
+        """Compute the rows for the missing units of one structure.
+
+        :entry: A tuple of the PDB id and the list of missing unit ids.
+        :returns: A list of rows to store.
+        """
+
+        pdb_id, unit_ids = entry
+        self.logger.info('Loading 3D structure file %s' % pdb_id)
+        wanted = set(unit_ids)
+        rows = []
+        try:
+            structure = self.structure(pdb_id)
+            foundone = False
+            for residue in structure.residues():
+                if residue.unit_id() in wanted:
+                    foundone = True
+                    rows.extend(self.rows(pdb_id, residue))
+
+            if not foundone:
+                self.logger.info("No matches to %s" % unit_ids)
+
+        except Exception as err:
+            self.logger.info("Could not load %s: %s" % (pdb_id, err))
+
+        return rows
+
+    @abc.abstractmethod
+    def rows(self, pdb_id, residue):
+        """Compute the rows for one residue that is missing data.
+
+        :pdb_id: The PDB id of the structure, not of the pdbs passed in.
+        :residue: The residue.
+        :returns: An iterable of dictionaries to store.
+        """
+        pass
+
+    def data(self, pdbs, jobs=1, **kwargs):
+        """Find all units missing data and compute it, one structure at a
+        time and in parallel if requested.
+
+        :pdbs: The PDB ids being processed.
+        :jobs: The number of processes to use.
+        :returns: A list of dictionaries to store.
+        """
+
+        grouped = self.group_units(self.missing(pdbs))
+        self.logger.info('Computing data for %d nucleotides in %d files' %
+                         (sum(len(u) for u in grouped.values()),
+                          len(grouped)))
+
+        data = []
+        entries = sorted(grouped.items())
+        for rows in parallel.map_in_pool(self, self.compute, entries, jobs):
+            data.extend(rows)
+        return data
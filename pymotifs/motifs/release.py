@@ -272,7 +272,8 @@ class Loader(core.MassLoader):
 
         builder = Builder(self.config, self.session)
         motifs = builder(releases.parent, releases.current, folder)
-        self.cache(loop_type, motifs)
+        fingerprint = self.fingerprint(loop_type, list(releases), folder)
+        self.cache(loop_type, motifs, fingerprint=fingerprint)
 
     def next_motif_release_id(self, **kwargs):
         """Get the next motif id.
@@ -320,7 +321,9 @@ class Loader(core.MassLoader):
         self.logger.info("Starting to cluster all %s", loop_type)
         builder = Builder(self.config, self.session)
         motifs = builder(loop_type, releases.parent, releases.current, loops)
-        self.cache(loop_type, motifs)
+        fingerprint = self.fingerprint(loop_type, list(releases),
+                                       sorted(ifes), size_limit)
+        self.cache(loop_type, motifs, fingerprint=fingerprint)
         self.logger.info("Done clustering %s", loop_type)
         return motifs
 
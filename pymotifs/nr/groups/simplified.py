@@ -13,6 +13,7 @@ import operator as op
 
 from pymotifs import core
 from pymotifs import models as mod
+from pymotifs import utils as ut
 from pymotifs.utils import result2dict
 from pymotifs.utils import discrepancy as disc
 from pymotifs.constants import NR_DISCREPANCY_CUTOFF
@@ -20,7 +21,7 @@ from pymotifs.constants import EQUIVALENT_PAIRS
 from pymotifs.constants import SYNTHENIC_SPECIES_ID
 from pymotifs.constants import NR_MIN_HOMOGENEOUS_SIZE
 
-from pymotifs.utils import connectedsets as cs
+from pymotifs.utils.union_find import connected_components
 from pymotifs.utils import correspondence as cr
 from pymotifs.utils.structures import SYNTHEIC
 
@@ -61,6 +62,17 @@ class Grouper(core.Base):
     """A flag to force groups to have distinct species"""
     must_enforce_single_species = True
 
+    """A flag to only check pairs of chains which have a good alignment,
+    instead of all pairs of chains"""
+    use_candidates = True
+
+    """The number of rows to fetch at once when loading ifes in bulk"""
+    fetch_size = 1000
+
+    """The number of pdbs to load ifes for in each query when loading in
+    bulk"""
+    bulk_size = 500
+
     def valid_ife(self, ife):
         """Check if the given ife is valid. If not a warning statement will be
         produced and false returned. Ifes are valid if they have a non zero
@@ -78,6 +90,69 @@ class Grouper(core.Base):
         self.logger.warning("Invalid ife %s, 0 length", ife['id'])
         return False
 
+    def ifes_query(self, session):
+        """Build the query for the data of all ife chains. This has no filter
+        on the pdb, callers must add one.
+
+        :param session: The session to query with.
+        :returns: A query of one row per chain, ordered by ife and then
+        by the index of the chain in the ife.
+        """
+
+        return session.query(mod.ChainInfo.sequence,
+                             mod.ChainInfo.chain_name.label('name'),
+                             mod.IfeChains.chain_id.label('db_id'),
+                             mod.IfeChains.is_integral,
+                             mod.IfeChains.is_accompanying,
+                             mod.IfeInfo.ife_id.label('id'),
+                             mod.IfeInfo.bp_count.label('bp'),
+                             mod.IfeInfo.pdb_id.label('pdb'),
+                             mod.IfeInfo.length,
+                             mod.PdbInfo.resolution,
+                             mod.PdbInfo.experimental_technique.label('method'),
+                             mod.ChainSpecies.species_id.label('species')).\
+            join(mod.IfeInfo,
+                 mod.IfeInfo.pdb_id == mod.ChainInfo.pdb_id).\
+            join(mod.IfeChains,
+                 (mod.IfeChains.ife_id == mod.IfeInfo.ife_id) &
+                 (mod.IfeChains.chain_id == mod.ChainInfo.chain_id)).\
+            join(mod.PdbInfo,
+                 mod.PdbInfo.pdb_id == mod.ChainInfo.pdb_id).\
+            join(mod.ChainSpecies,
+                 mod.ChainSpecies.chain_id == mod.ChainInfo.chain_id).\
+            join(mod.ExpSeqPdb,
+                 mod.ExpSeqPdb.chain_id == mod.ChainInfo.chain_id).\
+            join(mod.ExpSeqInfo,
+                 mod.ExpSeqInfo.exp_seq_id == mod.ExpSeqPdb.exp_seq_id).\
+            filter(mod.IfeInfo.new_style == True).\
+            filter(mod.ExpSeqInfo.was_normalized == 1).\
+            order_by(mod.IfeChains.ife_id, mod.IfeChains.index)
+
+    def group_ifes(self, chains):
+        """Group the rows of chains into ifes.
+
+        :param chains: An iterable of chain dictionaries, ordered by ife, as
+        produced by `ifes_query`.
+        :returns: A list of dictionaries, one per ife.
+        """
+
+        groups = []
+        for ife_id, members in it.groupby(chains, op.itemgetter('id')):
+            members = list(members)
+            groups.append({
+                'id':  ife_id,
+                'pdb': members[0]['pdb'],
+                'bp': members[0]['bp'],
+                'name': members[0]['name'],
+                'length': members[0]['length'],
+                'species': members[0]['species'],
+                'chains': members,
+                'db_id': members[0]['db_id'],
+                'resolution': members[0]['resolution'],
+                'method': members[0]['method'],
+            })
+        return groups
+
     def ifes(self, pdb):
         """Load all ife chains from a given pdb. This will get the RNA chains as
         well as load some interaction data about the chains.
@@ -88,64 +163,48 @@ class Grouper(core.Base):
         """
 
         with self.session() as session:
-            query = session.query(mod.ChainInfo.sequence,
-                                  mod.ChainInfo.chain_name.label('name'),
-                                  mod.IfeChains.chain_id.label('db_id'),
-                                  mod.IfeChains.is_integral,
-                                  mod.IfeChains.is_accompanying,
-                                  mod.IfeInfo.ife_id.label('id'),
-                                  mod.IfeInfo.bp_count.label('bp'),
-                                  mod.IfeInfo.pdb_id.label('pdb'),
-                                  mod.IfeInfo.length,
-                                  mod.PdbInfo.resolution,
-                                  mod.PdbInfo.experimental_technique.label('method'),
-                                  mod.ChainSpecies.species_id.label('species')).\
-                join(mod.IfeInfo,
-                     mod.IfeInfo.pdb_id == mod.ChainInfo.pdb_id).\
-                join(mod.IfeChains,
-                     (mod.IfeChains.ife_id == mod.IfeInfo.ife_id) &
-                     (mod.IfeChains.chain_id == mod.ChainInfo.chain_id)).\
-                join(mod.PdbInfo,
-                     mod.PdbInfo.pdb_id == mod.ChainInfo.pdb_id).\
-                join(mod.ChainSpecies,
-                     mod.ChainSpecies.chain_id == mod.ChainInfo.chain_id).\
-                join(mod.ExpSeqPdb,
-                     mod.ExpSeqPdb.chain_id == mod.ChainInfo.chain_id).\
-                join(mod.ExpSeqInfo,
-                     mod.ExpSeqInfo.exp_seq_id == mod.ExpSeqPdb.exp_seq_id).\
-                filter(mod.IfeInfo.pdb_id == pdb).\
-                filter(mod.IfeInfo.new_style == True).\
-                filter(mod.ExpSeqInfo.was_normalized == 1).\
-                order_by(mod.IfeChains.ife_id, mod.IfeChains.index)
-
-            if query.count() == 0:
-                self.logger.warn("No ifes found for %s" % pdb)
-                return []
-
-            grouped = it.imap(result2dict, query)
-            grouped = it.groupby(grouped, op.itemgetter('id'))
-            groups = []
-            for ife_id, chains in grouped:
-                chains = list(chains)
-                groups.append({
-                    'id':  ife_id,
-                    'pdb': chains[0]['pdb'],
-                    'bp': chains[0]['bp'],
-                    'name': chains[0]['name'],
-                    'length': chains[0]['length'],
-                    'species': chains[0]['species'],
-                    'chains': chains,
-                    'db_id': chains[0]['db_id'],
-                    'resolution': chains[0]['resolution'],
-                    'method': chains[0]['method'],
-                })
+            query = self.ifes_query(session).\
+                filter(mod.IfeInfo.pdb_id == pdb)
+            groups = self.group_ifes(it.imap(result2dict, query))
 
         if not groups:
-            raise core.InvalidState("No stored ifes for %s", pdb)
+            self.logger.warn("No ifes found for %s" % pdb)
+            return []
 
         self.logger.info("Found %i ifes for %s", len(groups), pdb)
         return groups
 
+    def bulk_ifes(self, pdbs):
+        """Load all ife chains from all given pdbs with one query per chunk
+        of `bulk_size` pdbs. The rows are streamed and grouped as they
+        arrive. This produces the same ifes, in the same order, as calling
+        `ifes` on each pdb.
+
+        :param list pdbs: The pdbs to get the chains for.
+        :returns: A list of dictionaries with data about all chains.
+        """
+
+        chains = coll.defaultdict(list)
+        with self.session() as session:
+            for chunk in ut.grouper(self.bulk_size, sorted(set(pdbs))):
+                query = self.ifes_query(session).\
+                    filter(mod.IfeInfo.pdb_id.in_(chunk)).\
+                    yield_per(self.fetch_size)
+                for result in query:
+                    chain = result2dict(result)
+                    chains[chain['pdb'].upper()].append(chain)
+
+        ifes = []
+        for pdb in pdbs:
+            groups = self.group_ifes(dict(c) for c in
+                                     chains.get(pdb.upper(), []))
+            if not groups:
+                self.logger.warn("No ifes found for %s" % pdb)
+                continue
+            self.logger.info("Found %i ifes for %s", len(groups), pdb)
+            ifes.extend(groups)
+        return ifes
+
     def discrepancies(self, groups):
         """Load the discrepancies for the given groups. If use_discrepancy is
         False this will return an empty dictionary. The returned data structure
@@ -433,8 +492,56 @@ class Grouper(core.Base):
         missing = it.ifilterfalse(lambda c: c in matrix, missing)
         return bool(list(missing))
 
+    def candidates(self, chains, alignments):
+        """Generate the pairs of chains which may be equivalent. Chains can
+        only be equivalent if they have a good alignment, are a hard coded
+        join or are the same chain, so this builds the pairs from the good
+        alignments of each chain instead of checking all pairs of chains.
+        The pairs are produced in the same order, and with the chains in the
+        same order in each pair, as `it.combinations` would.
+
+        :param list chains: The chains to build pairs of.
+        :param dict alignments: The alignments to use, as from `alignments`.
+        :returns: A list of (chain1, chain2) pairs.
+        """
+
+        def simple(ife_id):
+            parts = ife_id.split('|')
+            return (parts[0], parts[-1])
+
+        by_db_id = coll.defaultdict(list)
+        by_name = coll.defaultdict(list)
+        by_id = coll.defaultdict(list)
+        for index, chain in enumerate(chains):
+            by_db_id[chain.get('db_id')].append(index)
+            by_name[simple(chain['id'])].append(index)
+            by_id[chain['id']].append(index)
+
+        edges = set()
+        for index, chain in enumerate(chains):
+            aligned = alignments.get(chain.get('db_id'), {})
+            for db_id, good in aligned.iteritems():
+                if good:
+                    edges.update((index, o) for o in by_db_id.get(db_id, [])
+                                 if o > index)
+
+        for name1, name2 in EQUIVALENT_PAIRS:
+            for first in by_name.get(name1, []):
+                for second in by_name.get(name2, []):
+                    if first != second:
+                        edges.add((min(first, second), max(first, second)))
+
+        for indexes in by_id.itervalues():
+            edges.update(it.combinations(indexes, 2))
+
+        self.logger.debug("Found %i candidate pairs of %i chains",
+                          len(edges), len(chains))
+        return [(chains[i], chains[j]) for i, j in sorted(edges)]
+
     def pairs(self, chains, alignments, discrepancies):
-        """Generate an iterator of all equivalent pairs of chains.
+        """Generate an iterator of all equivalent pairs of chains. Unless
+        use_candidates is False only the pairs from `candidates` are checked,
+        which gives the same pairs as checking all pairs of chains.
 
         :chains: The chains to build pairs of.
         :alignments: Alignments to use for checking validity.
@@ -442,15 +549,11 @@ class Grouper(core.Base):
         :returns: An iterable of all valid pairs.
         """
 
-        # It should be possible to rewrite this section such that it only
-        # iterates over the chains which have been aligned. In addition, it is
-        # possible to change the alignment loading to only load the good
-        # alignments. If both these changes are done the run time is decreased
-        # greatly (I think to ~30 min). For some reason this produces the
-        # incorrect results though. This is likely been due to bugs that have
-        # been fixed now.
         equiv = ft.partial(self.are_equivalent, alignments, discrepancies)
-        pairs = it.combinations(chains, 2)
+        if self.use_candidates:
+            pairs = self.candidates(chains, alignments)
+        else:
+            pairs = it.combinations(chains, 2)
         return it.ifilter(lambda p: equiv(*p), pairs)
 
     def connections(self, chains, alignments, discrepancies):
@@ -483,7 +586,7 @@ class Grouper(core.Base):
         in a group.
         """
 
-        return cs.find_connected(graph).values()
+        return connected_components(graph).values()
 
     def group(self, chains, alignments, discrepancies):
         """Group all chains into connected components.
@@ -509,8 +612,7 @@ class Grouper(core.Base):
         return groups
 
     def all_ifes(self, pdbs):
-        ifes = it.imap(self.ifes, pdbs)
-        ifes = it.chain.from_iterable(ifes)
+        ifes = self.bulk_ifes(pdbs)
         ifes = it.ifilter(self.valid_ife, ifes)
         ifes = list(ifes)
         if not ifes:
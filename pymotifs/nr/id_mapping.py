@@ -104,5 +104,6 @@ class Loader(core.MassLoader):
 
         mapping = self.mapping(data['release'], data['groups'])
         data['groups'] = self.transform(data['groups'], mapping)
-        self.cache(NR_CACHE_NAME, data)
+        self.cache(NR_CACHE_NAME, data,
+                   fingerprint=self.cached_fingerprint(NR_CACHE_NAME))
         return None
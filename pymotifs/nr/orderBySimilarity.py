@@ -1,7 +1,8 @@
 import numpy as np
-from scipy.cluster.hierarchy import dendrogram, linkage
+from scipy.cluster.hierarchy import dendrogram, linkage, cophenet
 from scipy.spatial.distance import squareform
-from random import shuffle
+import functools as ft
+import random
 import math
 
 def treePenalty(distance,link="average"):
@@ -19,20 +20,9 @@ def treePenalty(distance,link="average"):
     Z = linkage(squareform(distance),link)
 #    print("regular",Z)
 
-    penalty = np.zeros(distance.shape)
-
-    group = []
-    for i in range(0,distance.shape[0]):
-        group.append([i])
-
-    for merger in Z:
-        a = int(merger[0])
-        b = int(merger[1])
-        group.append(group[a]+group[b])
-        for i in group[a]:
-            for j in group[b]:
-                penalty[i][j] = merger[2]
-                penalty[j][i] = merger[2]
+    # the penalty of a pair is the height of the merger which first joins
+    # them, which is the cophenetic distance of the tree
+    penalty = squareform(cophenet(Z))
 
     if 0 > 1:
         for i in range(0,len(distance)):
@@ -46,11 +36,11 @@ def treePenalty(distance,link="average"):
 
     return penalty
 
-def treePenalizedPathLength(distance,repetitions=100):
+def treePenalizedPathLength(distance,repetitions=100,seed=None,mapper=map):
     n = distance.shape[0]
     if n > 2:
         penalizedMatrix = distance + treePenalty(distance)
-        order = multipleGreedyInsertionPathLength(penalizedMatrix,repetitions)
+        order = multipleGreedyInsertionPathLength(penalizedMatrix,repetitions,seed,mapper)
         order = orientPath(distance,order)
     else:
         order = range(0,n)
@@ -63,42 +53,65 @@ def optimalLeafOrder(distance):
     return dn['leaves']
 
 def greedyInsertionPathLength(distance, order=[], verbose=False):
+    distance = np.asarray(distance)
+
     # if no starting ordering
     if len(order) == 0:
         order = range(0,len(distance))
-        shuffle(order)          # random starting ordering
-    path = order[:2]            # first two points of the current ordering
+        random.shuffle(order)   # random starting ordering
+    order = np.asarray(order, dtype=int)
+
+    path = np.zeros(len(order), dtype=int)
+    path[:2] = order[:2]        # first two points of the current ordering
+    length = 2
     score = distance[path[0], path[1]]
 
     for p in range(2, len(order)):
-        # score inserting point order[p] at beginning of path
-        bestScore = distance[order[p]][path[0]]
-        bestPosition = 0
-
-        # score inserting point order[p] at end of path
-        currentScore = distance[path[-1]][order[p]]
-        if currentScore < bestScore:
-            bestScore = distance[path[-1]][order[p]]
-            bestPosition = len(path)
-
-        # score inserting point order[p] at various points within the path
-        for position in range(1, len(path)):
-            currentScore = distance[path[position-1]][order[p]] + distance[order[p]][path[position]] - distance[path[position-1]][path[position]]
+        point = order[p]
+        current = path[:length]
+
+        # score inserting point order[p] at the beginning of the path, at the
+        # end and at every point within the path at once. The costs are in
+        # the order they are considered, so the first smallest one wins.
+        costs = np.zeros(length + 1)
+        costs[0] = distance[point, current[0]]
+        costs[1] = distance[current[-1], point]
+        costs[2:] = distance[current[:-1], point] + distance[point, current[1:]] - distance[current[:-1], current[1:]]
+
+        best = int(np.argmin(costs))
+        if best == 0:
+            position = 0
+        elif best == 1:
+            position = length
+        else:
+            position = best - 1
 
-            if currentScore < bestScore:
-                bestScore = currentScore
-                bestPosition = position
+        path[position+1:length+1] = path[position:length].copy()
+        path[position] = point
+        length += 1
+        score += costs[best]
 
-        path.insert(bestPosition, order[p])
-        score += bestScore
+    return path.tolist(), score
 
-    return path, score
+def startingOrders(n, repetitions, seed=None):
+    # random starting orderings, from their own generator if given a seed so
+    # they do not depend on anything else using random numbers
+    rng = random if seed is None else random.Random(seed)
+    orders = []
+    for rep in range(0,repetitions):
+        order = range(0,n)
+        rng.shuffle(order)
+        orders.append(order)
+    return orders
 
-def multipleGreedyInsertionPathLength(distance, repetitions=100):
+def multipleGreedyInsertionPathLength(distance, repetitions=100, seed=None, mapper=map):
+    # mapper applies a function to each starting ordering and gives back the
+    # results in order, it may spread them over a pool of processes
+    orders = startingOrders(len(distance), repetitions, seed)
+    insert = ft.partial(greedyInsertionPathLength, distance)
 
     bestScore = float("inf")
-    for rep in range(0,repetitions):
-        path, score = greedyInsertionPathLength(distance)
+    for path, score in mapper(insert, orders):
         if score < bestScore:
             bestScore = score
             bestPath = path
@@ -152,24 +165,19 @@ def reorderList(oldList,newOrder):
     return newList
 
 def imputeNANValues(distance):
-    newDistance = np.zeros(distance.shape)
-
-    maxVal = 0
-    for i in range(0,newDistance.shape[0]):
-        for j in range(i+1,newDistance.shape[1]):
-            if not math.isnan(distance[i][j]):
-                maxVal = max(maxVal,distance[i][j])
-
-    for i in range(0,newDistance.shape[0]):
-        for j in range(i+1,newDistance.shape[1]):
-            if math.isnan(distance[i][j]) or distance[i][j] < 0:
-                newDistance[i][j] = maxVal
-                newDistance[j][i] = maxVal
-            else:
-                newDistance[i][j] = distance[i][j]
-                newDistance[j][i] = distance[i][j]
-
-        newDistance[i][i] = 0
+    distance = np.asarray(distance, dtype=float)
+    upper = distance[np.triu_indices(distance.shape[0], 1)]
+    upper = upper[~np.isnan(upper)]
+
+    maxVal = max(0, upper.max()) if len(upper) else 0
+
+    # use the upper triangle for both halves, with missing values set to the
+    # largest one
+    newDistance = np.triu(distance, 1)
+    with np.errstate(invalid='ignore'):
+        missing = np.isnan(newDistance) | (newDistance < 0)
+    newDistance[missing] = maxVal
+    newDistance = newDistance + newDistance.T
 
     return newDistance
 
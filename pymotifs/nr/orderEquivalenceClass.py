@@ -4,7 +4,9 @@ from scipy.cluster.hierarchy import dendrogram, linkage
 from scipy.spatial.distance import squareform
 from numpy import median
 from numpy import isnan
-from random import shuffle
+
+from orderBySimilarity import greedyInsertionPathLength
+from orderBySimilarity import multipleGreedyInsertionPathLength
 
 
 def fixDistanceMatrix(distance,scanForNan=False):
@@ -46,55 +48,11 @@ def orderEquivalenceClassWithOLO(distance,scanForNan=False):
 
   return bestOrder
 
-def greedyInsertionPathLength(distance, order=[], verbose=False):
-
-    # if no starting ordering
-    if len(order) == 0:
-        order = range(0,len(distance))
-        shuffle(order)          # random starting ordering
-    path = order[:2]            # first two points of the current ordering
-    score = distance[path[0], path[1]]
-
-    for p in range(2, len(order)):
-        # score inserting point order[p] at beginning of path
-        bestScore = distance[order[p]][path[0]]
-        bestPosition = 0
-
-        # score inserting point order[p] at end of path
-        currentScore = distance[path[-1]][order[p]]
-        if currentScore < bestScore:
-            bestScore = distance[path[-1]][order[p]]
-            bestPosition = len(path)
-
-        # score inserting point order[p] at various points within the path
-        for position in range(1, len(path)):
-            currentScore = distance[path[position-1]][order[p]] + distance[order[p]][path[position]] - distance[path[position-1]][path[position]]
-
-            if currentScore < bestScore:
-                bestScore = currentScore
-                bestPosition = position
-
-        path.insert(bestPosition, order[p])
-        score += bestScore
-
-    return path, score
-
-def multipleGreedyInsertionPathLength(distance, repetitions=100):
-
-    bestScore = float("inf")
-    for rep in range(0,repetitions):
-        path, score = greedyInsertionPathLength(distance)
-        if score < bestScore:
-            bestScore = score
-            bestPath = path
-
-    return bestPath
-
-def orderEquivalenceClassWithPathLength(distance,scanForNan=False,repetitions=100):
+def orderEquivalenceClassWithPathLength(distance,scanForNan=False,repetitions=100,seed=None,mapper=map):
 
   distance = fixDistanceMatrix(distance,scanForNan)
 
-  bestOrder = multipleGreedyInsertionPathLength(distance, repetitions)
+  bestOrder = multipleGreedyInsertionPathLength(distance, repetitions, seed, mapper)
 
   print("ordering",len(distance),bestOrder)
 
@@ -8,6 +8,8 @@ chains will not show up in the final ordering.
 """
 
 import collections as coll
+import functools as ft
+import zlib
 from collections import defaultdict
 
 import numpy as np
@@ -25,6 +27,7 @@ from pprint import pprint
 
 from pymotifs import core
 from pymotifs import models as mod
+from pymotifs.core import parallel
 
 from pymotifs.constants import NR_CACHE_NAME
 
@@ -34,6 +37,92 @@ from pymotifs.nr.cqs import NrQualityLoader
 from pymotifs.chain_chain.comparison import Loader as SimilarityLoader
 
 
+class ReleaseDistances(object):
+    """The discrepancies between the members of every NR class of a release.
+    Each class has a dense matrix of discrepancies, indexed by the position of
+    each IFE in the class, with NaN for pairs that have no discrepancy.
+
+    Attributes
+    ----------
+    release_id : str
+        The NR release id.
+    index : dict
+        A dict from class id to a dict of the position of each IFE.
+    matrices : dict
+        A dict from class id to the matrix of discrepancies.
+    """
+
+    def __init__(self, release_id, members):
+        """Build the matrices, with no discrepancies filled in.
+
+        Parameters
+        ----------
+        release_id : str
+            The NR release id.
+        members : dict
+            A dict from class id to the list of IFE ids in the class.
+        """
+
+        self.release_id = release_id
+        self.index = {}
+        self.matrices = {}
+        for class_id, ife_ids in members.items():
+            self.index[class_id] = dict((ife_id, i) for i, ife_id in
+                                        enumerate(ife_ids))
+            self.matrices[class_id] = np.full((len(ife_ids), len(ife_ids)),
+                                              np.nan)
+
+    def add(self, class_id, ife1, ife2, discrepancy):
+        """Fill in the discrepancy between two members of a class. Unknown
+        classes or IFEs are ignored.
+
+        Parameters
+        ----------
+        class_id : int
+            The NR class id.
+        ife1 : str
+            The IFE id of the row.
+        ife2 : str
+            The IFE id of the column.
+        discrepancy : float
+            The discrepancy, None is stored as NaN.
+        """
+
+        index = self.index.get(class_id)
+        if index is None or ife1 not in index or ife2 not in index:
+            return
+        if discrepancy is None:
+            discrepancy = np.nan
+        self.matrices[class_id][index[ife1], index[ife2]] = discrepancy
+
+    def matrix(self, class_id, ife_ids):
+        """Get the discrepancies between the given IFEs of a class.
+
+        Parameters
+        ----------
+        class_id : int
+            The NR class id.
+        ife_ids : list
+            The IFE ids, in the order to use for the rows and columns.
+
+        Returns
+        -------
+        matrix : numpy.ndarray
+            The discrepancy between each pair of the IFEs, NaN if there is
+            none.
+        """
+
+        matrix = np.full((len(ife_ids), len(ife_ids)), np.nan)
+        index = self.index.get(class_id, {})
+        found = [(i, index[ife_id]) for i, ife_id in enumerate(ife_ids)
+                 if ife_id in index]
+        if found:
+            rows, positions = zip(*found)
+            matrix[np.ix_(rows, rows)] = \
+                self.matrices[class_id][np.ix_(positions, positions)]
+        return matrix
+
+
 class Loader(core.SimpleLoader):
     """The actual Loader to compute and store ordering.
 
@@ -46,6 +135,58 @@ class Loader(core.SimpleLoader):
     trials = 100
     dependencies = set([NrChainLoader, NrClassLoader, NrQualityLoader, SimilarityLoader])
 
+    """Classes are ordered one at a time, and the random restarts of each
+    one are spread over the worker processes instead"""
+    parallel = False
+
+    """The largest class whose discrepancies are loaded from the database,
+    those of larger classes are read from a flat file"""
+    database_max = 300
+
+    def __init__(self, *args, **kwargs):
+        super(Loader, self).__init__(*args, **kwargs)
+        self._release = None
+
+    def ordering_seed(self, nr_class_name, seed=None, **kwargs):
+        """Compute the seed for the random starting orderings of a class. This
+        depends only on the name of the class and the seed given when
+        running, so the same class is always ordered the same way.
+
+        Parameters
+        ----------
+        nr_class_name : str
+            The name of the class, like NR_4.0_56726.1.
+        seed : int, optional
+            The random seed given when running.
+
+        Returns
+        -------
+        seed : int
+            The seed to use.
+        """
+
+        value = zlib.crc32(nr_class_name)
+        if seed is not None:
+            value ^= seed
+        return value & 0xffffffff
+
+    def mapper(self, jobs=1, **kwargs):
+        """Create the function to apply the greedy insertion to each starting
+        ordering with. With more than one job the starting orderings are
+        split across a pool of worker processes.
+
+        Parameters
+        ----------
+        jobs : int, optional
+            The number of processes to use.
+
+        Returns
+        -------
+        mapper : callable
+            A function like `map` which yields results in order.
+        """
+        return ft.partial(parallel.map_in_pool, self, jobs=jobs)
+
     def to_process(self, pdbs, **kwargs):
         """Look up all NR classes. This ignores the given PDBs and just creates
         a list of all NR class ids.
@@ -114,6 +255,10 @@ class Loader(core.SimpleLoader):
                     else:
                         self.logger.info("to_process: already ordered release %s class %s" % (nr_release,nr_name))
 
+            # keep the classes of each release together, so the discrepancies
+            # of each release are only loaded once
+            pairs_to_process.sort(key=lambda p: p[0])
+
             return pairs_to_process
 
 #        return [(latest, r.nr_class_id) for r in query]
@@ -364,6 +509,142 @@ class Loader(core.SimpleLoader):
 
         return distances_revised
 
+    def small_classes(self, session, release_id):
+        """Build a subquery of the ids of the classes in a release with at
+        most `database_max` members.
+
+        Parameters
+        ----------
+        session : pymotifs.core.db.Session
+            The session to use.
+        release_id : str
+            The NR release id.
+
+        Returns
+        -------
+        subquery : Alias
+            A subquery with a single nr_class_id column.
+        """
+
+        nch = aliased(mod.NrChains)
+        return session.query(nch.nr_class_id).\
+            filter(nch.nr_release_id == release_id).\
+            group_by(nch.nr_class_id).\
+            having(func.count(nch.ife_id) <= self.database_max).\
+            subquery()
+
+    def prefetch(self, release_id):
+        """Load all discrepancies between members of the same class for every
+        class in a release with at most `database_max` members, with one
+        query for the members and one for the discrepancies. Larger classes
+        are read from a flat file instead. The most recently loaded release
+        is kept, so loading the classes of a release one after another only
+        loads it once. This relies on `to_process` keeping the classes of a
+        release together and on the classes being processed in one process,
+        which is why this stage is not `parallel`.
+
+        Parameters
+        ----------
+        release_id : str
+            The NR release id.
+
+        Returns
+        -------
+        distances : ReleaseDistances
+            The discrepancies of all classes in the release.
+        """
+
+        if self._release is not None and \
+                self._release.release_id == release_id:
+            return self._release
+
+        self.logger.info("prefetch: loading discrepancies of release %s" % release_id)
+        self._release = None
+
+        with self.session() as session:
+            sizes = self.small_classes(session, release_id)
+
+            query = session.query(mod.NrChains.nr_class_id,
+                                  mod.NrChains.ife_id).\
+                join(sizes, sizes.c.nr_class_id == mod.NrChains.nr_class_id).\
+                filter(mod.NrChains.nr_release_id == release_id)
+
+            members = coll.defaultdict(list)
+            for result in query:
+                members[result.nr_class_id].append(result.ife_id)
+
+        release = ReleaseDistances(release_id, members)
+        with self.session() as session:
+            chains1 = aliased(mod.IfeChains)
+            chains2 = aliased(mod.IfeChains)
+            nr1 = aliased(mod.NrChains)
+            nr2 = aliased(mod.NrChains)
+            sim = mod.ChainChainSimilarity
+            sizes = self.small_classes(session, release_id)
+
+            query = session.query(nr1.nr_class_id,
+                                  sim.discrepancy,
+                                  chains1.ife_id.label('ife1'),
+                                  chains2.ife_id.label('ife2'),
+                                  ).\
+                join(chains1, chains1.chain_id == sim.chain_id_1).\
+                join(chains2, chains2.chain_id == sim.chain_id_2).\
+                join(nr1, nr1.ife_id == chains1.ife_id).\
+                join(nr2, nr2.ife_id == chains2.ife_id).\
+                join(sizes, sizes.c.nr_class_id == nr1.nr_class_id).\
+                filter(nr1.nr_class_id == nr2.nr_class_id).\
+                filter(nr1.nr_release_id == nr2.nr_release_id).\
+                filter(nr1.nr_release_id == release_id)
+
+            # rows are written into the matrices as they are streamed
+            for result in query.yield_per(1000):
+                release.add(result.nr_class_id, result.ife1, result.ife2,
+                            result.discrepancy)
+
+        self._release = release
+        self.logger.info("prefetch: loaded %d classes of release %s" % (len(members), release_id))
+        return self._release
+
+    def class_distances(self, release_id, class_id, members):
+        """Get the matrix of discrepancies between members of a class, from
+        the prefetched discrepancies of its release.
+
+        Parameters
+        ----------
+        release_id : str
+            The first representative sets release that contains the class.
+        class_id : int
+            The first class_id value for the NR class.
+        members : list
+            A list of members as from `Loader.members_revised`.
+
+        Raises
+        ------
+        core.Skip
+            If there are no distances.
+
+        Returns
+        -------
+        matrix : numpy.ndarray
+            The discrepancies between members, in the order of members, with
+            NaN for pairs without one.
+        """
+
+        matrix = self.prefetch(release_id).matrix(class_id,
+                                                  [m[0] for m in members])
+
+        found = ~np.isnan(matrix)
+        if not found.any():
+            raise core.Skip("No distances, skipping class: %i" % class_id)
+
+        if not found.any(axis=1).all():
+            missing = ', '.join(m[0] for m, f in zip(members, found.any(axis=1))
+                                if not f)
+            self.logger.warning("Did not load distances for all pairs in: %i."
+                                " Missing %s", class_id, missing)
+
+        return matrix
+
     def distances(self, nr_release_id, class_id, members):
         """Load all compute distances for members of the NR class. This may not
         load distances for all members, as we do not compute discrepancies for
@@ -423,7 +704,7 @@ class Loader(core.SimpleLoader):
 
         return distances
 
-    def ordered_revised(self, members, distances):
+    def ordered_revised(self, members, distances, seed=None, mapper=map):
         """Compute an ordering for the members of an equivalence set given the
         distance matrix.
 
@@ -433,6 +714,11 @@ class Loader(core.SimpleLoader):
             A list of members as from `Loader.members`.
         distances : collections.defaultdict
             A defaultdict of distances as from `Loader.distances`.
+        seed : int, optional
+            The seed for the random starting orderings.
+        mapper : callable, optional
+            The function to apply the greedy insertion with, as from
+            `Loader.mapper`.
 
         Returns
         -------
@@ -444,19 +730,72 @@ class Loader(core.SimpleLoader):
 
         self.logger.info("ordered_revised: %s members" % len(members))
 
-        dist = np.zeros((len(members), len(members)))
+        dist = self.distance_matrix(members, distances, np.nan)
+        return self.order_matrix(members, dist, seed, mapper)
+
+    def distance_matrix(self, members, distances, missing):
+        """Build the matrix of distances between members from a dict-of-dicts
+        of distances.
+
+        Parameters
+        ----------
+        members : list
+            A list of members as from `Loader.members`.
+        distances : dict
+            A dict-of-dicts of distances as from `Loader.distances`.
+        missing : float
+            The value to use for pairs without a distance.
+
+        Returns
+        -------
+        dist : numpy.ndarray
+            The distance between each pair of members.
+        """
 
-        for index1, member1 in enumerate(members):
-            curr = distances.get(member1[0], {})
-            for index2, member2 in enumerate(members):
-                val = curr.get(member2[0], None)
-                if member2[0] not in curr:
-                    val = None
-                dist[index1, index2] = val
-                self.logger.debug("ordered: dist[%s, %s] = %s" % (index1, index2, val))
+        positions = coll.defaultdict(list)
+        for index, member in enumerate(members):
+            positions[member[0]].append(index)
+
+        rows = []
+        cols = []
+        values = []
+        for ife1, curr in distances.items():
+            for index1 in positions.get(ife1, []):
+                for ife2, val in curr.items():
+                    for index2 in positions.get(ife2, []):
+                        rows.append(index1)
+                        cols.append(index2)
+                        values.append(val)
+
+        dist = np.full((len(members), len(members)), missing, dtype=float)
+        if values:
+            dist[rows, cols] = np.array(values, dtype=float)
+        return dist
+
+    def order_matrix(self, members, dist, seed=None, mapper=map):
+        """Compute an ordering for the members of an equivalence set from the
+        matrix of discrepancies between them.
+
+        Parameters
+        ----------
+        members : list
+            A list of members as from `Loader.members_revised`.
+        dist : numpy.ndarray
+            The discrepancies between members, NaN where there is none.
+        seed : int, optional
+            The seed for the random starting orderings.
+        mapper : callable, optional
+            The function to apply the greedy insertion with, as from
+            `Loader.mapper`.
+
+        Returns
+        -------
+        ordered_members : list
+            The members in order.
+        """
 
         newDist = imputeNANValues(dist)
-        ordering = treePenalizedPathLength(newDist,max(self.trials,len(members)))
+        ordering = treePenalizedPathLength(newDist,max(self.trials,len(members)),seed,mapper)
 
         return [members[index] for index in ordering]
 
@@ -484,14 +823,7 @@ class Loader(core.SimpleLoader):
         if len(members) == 2:
             ordering = [0,1]
         else:
-            dist = np.zeros((len(members), len(members)))
-            for index1, member1 in enumerate(members):
-                curr = distances.get(member1[0], {})
-                for index2, member2 in enumerate(members):
-                    val = curr.get(member2[0], -1)
-                    if member2[0] not in curr:
-                        val = -1
-                    dist[index1, index2] = val
+            dist = self.distance_matrix(members, distances, -1)
 
     #        ordering, _, _ = orderWithPathLengthFromDistanceMatrix(dist,
     #                                                               self.trials,
@@ -555,27 +887,33 @@ class Loader(core.SimpleLoader):
         members_revised = self.members_revised(orig_class_id, orig_release_id)
         self.logger.info("data: members_revised: %s (class_id %s)" % (str(members_revised), orig_class_id))
 
+        # the random starting orderings are seeded by the class name, and may
+        # be split across processes
+        seed = self.ordering_seed(nr_class_name, **kwargs)
+        mapper = self.mapper(**kwargs)
+
         if len(members_revised) <= 2:
             # no need to try to find an ordering, all possible orderings are equivalent
             ordered_revised = members_revised
-        elif len(members_revised) <= 300:
+        elif len(members_revised) <= self.database_max:
             # look up distances using database for smallish groups
             # on 10/15/2019, database lookup of a group with 299 members took 1.04 seconds
             # flat file reading of groups up to 450 members took under 2 seconds
             # 300 is a good cutoff between the two
             # before reading the flat file, it could take hours to look up discrepancies from the database for large groups
 
+            # the discrepancies of the whole release are loaded once, and the
+            # matrix of this class is sliced out of them
             starttime = time.clock()
             #distances = self.distances(nr_release_id, class_id, members)
-            distances_revised = self.distances_revised(orig_release_id, orig_class_id, members_revised)
+            dist = self.class_distances(orig_release_id, orig_class_id, members_revised)
 
             self.logger.info("data: time to read a group of size %d from database was %8.4f seconds" % (len(members_revised),time.clock()-starttime))
 
             #self.logger.info("data: distances: %s (class_id %s)" % (str(distances), class_id))
-            #self.logger.info("data: distances_revised: %s (class_id %s)" % (str(distances_revised), orig_class_id))
 
             #ordered = self.ordered(members, distances)
-            ordered_revised = self.ordered_revised(members_revised, distances_revised)
+            ordered_revised = self.order_matrix(members_revised, dist, seed, mapper)
 
         else:
             self.logger.info("large group %s:  reading flat file of discrepancies" % nr_class_name)
@@ -603,7 +941,7 @@ class Loader(core.SimpleLoader):
                     dist[index1, index2] = val
 
             newDist = imputeNANValues(dist)
-            ordering = treePenalizedPathLength(newDist,max(self.trials,len(members_revised)))
+            ordering = treePenalizedPathLength(newDist,max(self.trials,len(members_revised)),seed,mapper)
 
             ordered_revised = [members_revised[index] for index in ordering]
             self.logger.info("large group:  produced a new ordering")
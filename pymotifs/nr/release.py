@@ -44,7 +44,10 @@ class Loader(core.MassLoader):
 
     def build(self, pdbs, current_release, next_release, **kwargs):
         builder = Builder(self.config, self.session)
-        self.cache(NR_CACHE_NAME, builder(pdbs, current_release, next_release))
+        fingerprint = self.fingerprint(sorted(pdbs), current_release,
+                                       next_release)
+        self.cache(NR_CACHE_NAME, builder(pdbs, current_release, next_release),
+                   fingerprint=fingerprint)
 
     def next_id(self, current):
         return rel.next_id(current, mode=self.config['release_mode']['nrlist'])
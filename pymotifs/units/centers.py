@@ -14,20 +14,41 @@ class Loader(core.SimpleLoader):
 
     dependencies = set([InfoLoader])
     allow_no_data = True
+    bulk_insert = True
+
+    parallel = True
+    """Each structure is independent so they may be processed in parallel"""
+
+    @property
+    def table(self):
+        return mod.UnitCenters
 
     def query(self, session, pdb):
         return session.query(mod.UnitCenters).\
             filter(mod.UnitCenters.pdb_id == pdb)
 
+    def rows(self, pdb, residue):
+        """Create the rows for all centers of a residue.
+
+        :pdb: The pdb id the residue is from.
+        :residue: The residue to get centers for.
+        :yields: A dictionary for each center which has 3 coordinates.
+        """
+
+        for name in residue.centers.definitions():
+            center = residue.centers[name]
+            if len(center) == 3:
+                yield {
+                    'unit_id': residue.unit_id(),
+                    'name': name,
+                    'pdb_id': pdb,
+                    'x': float(center[0]),
+                    'y': float(center[1]),
+                    'z': float(center[2]),
+                }
+
     def data(self, pdb, **kwargs):
         structure = self.structure(pdb)
         for residue in structure.residues():
-            for name in residue.centers.definitions():
-                center = residue.centers[name]
-                if len(center) == 3:
-                    yield mod.UnitCenters(unit_id=residue.unit_id(),
-                                          name=name,
-                                          pdb_id=pdb,
-                                          x=float(center[0]),
-                                          y=float(center[1]),
-                                          z=float(center[2]))
+            for row in self.rows(pdb, residue):
+                yield row
@@ -3,8 +3,16 @@ will write one row per non-water residue into the unit_coordinates table in the
 database. Data is written in the CIF format. This will write only the ATOM
 level entries (atom_site in cif) but will not include the header lines like
 'loop_' or '_atom_site.group_PDB'.
+
+By default the atom_site block of the whole structure is written once and
+then split into the entries of each unit. The columns of each entry are
+realigned as if the unit was written by itself. Before this is used the
+result is compared to writing a few units one at a time, and if they differ
+every unit is written by itself.
 """
 
+import re
+import collections as coll
 from cStringIO import StringIO
 
 import pymotifs.core as core
@@ -22,6 +30,13 @@ class Loader(core.SimpleLoader):
 
     dependencies = set([InfoLoader])
 
+    single_pass = True
+    """Write the whole structure once and split it into units"""
+
+    sample_size = 20
+    """Number of evenly spaced units to compare against writing them one at
+    a time, in addition to one unit of each kind"""
+
     def query(self, session, pdb):
         """Create a query to find all entries in `units_coordinates` for the
         given PDB id.
@@ -69,10 +84,25 @@ class Loader(core.SimpleLoader):
         sio = StringIO()
         writer = CifAtom(sio, unit_ids=False, protect_lists_of_lists=True)
         writer(structure)
-        raw = sio.getvalue()
+        return '\n'.join(self.atom_lines(sio.getvalue()))
+
+    def atom_lines(self, raw):
+        """Select the lines of atom_site entries from CIF text.
+
+        Parameters
+        ----------
+        raw : str
+            The CIF text.
+
+        Returns
+        -------
+        lines : list
+            The lines which are not headers or comments.
+        """
+
         coords = []
         for line in raw.split('\n'):
-            # Exclude header/comment lines that start with: 1) "data_", 
+            # Exclude header/comment lines that start with: 1) "data_",
             # 2) "loop_",  3) "_", or 4) "#".
             if not line or \
                     line.startswith('data_') or \
@@ -80,7 +110,199 @@ class Loader(core.SimpleLoader):
                     line[0] in set('_#'):
                 continue
             coords.append(line)
-        return '\n'.join(coords)
+        return coords
+
+    def atom_site(self, structure):
+        """Write the atom_site block of a whole structure, including the unit
+        id of each atom.
+
+        Parameters
+        ----------
+        structure : fr3d.data.Structure
+            The structure to write.
+
+        Returns
+        -------
+        atom_site : tuple
+            The list of field names and the list of atom lines.
+        """
+
+        sio = StringIO()
+        writer = CifAtom(sio, unit_ids=True, protect_lists_of_lists=True)
+        writer(structure)
+        raw = sio.getvalue()
+        fields = re.findall(r'^_atom_site\.(\S+)', raw, re.MULTILINE)
+        return fields, self.atom_lines(raw)
+
+    def justification(self, fields, lines):
+        """Determine how each column of the atom_site lines is aligned. A
+        column is left justified if all values start at the same position and
+        right justified if they all end at the same position.
+
+        Parameters
+        ----------
+        fields : list
+            The field names.
+        lines : list
+            The atom lines.
+
+        Returns
+        -------
+        justify : list
+            For each column either 'left' or 'right', or None if the lines do
+            not have one value per field or are not aligned.
+        """
+
+        spans = []
+        for line in lines:
+            span = [m.span() for m in re.finditer(r'\S+', line)]
+            if len(span) != len(fields):
+                return None
+            spans.append(span)
+
+        justify = []
+        for index in range(len(fields)):
+            if len(set(s[index][0] for s in spans)) == 1:
+                justify.append('left')
+            elif len(set(s[index][1] for s in spans)) == 1:
+                justify.append('right')
+            else:
+                return None
+        return justify
+
+    def render(self, rows, justify, renumber=None, strip=True):
+        """Format rows of values as an aligned atom_site block, with each
+        column as wide as its longest value.
+
+        Parameters
+        ----------
+        rows : list
+            A list of lists of values.
+        justify : list
+            The alignment of each column from `justification`.
+        renumber : int, optional
+            The index of a column to replace with 1, 2, 3, ...
+        strip : bool, optional
+            If trailing whitespace should be removed from each line.
+
+        Returns
+        -------
+        text : str
+            The formatted lines.
+        """
+
+        if renumber is not None:
+            rows = [list(row) for row in rows]
+            for number, row in enumerate(rows):
+                row[renumber] = str(number + 1)
+
+        widths = [max(len(row[i]) for row in rows)
+                  for i in range(len(justify))]
+        lines = []
+        for row in rows:
+            parts = []
+            for value, width, how in zip(row, widths, justify):
+                if how == 'left':
+                    parts.append(value.ljust(width))
+                else:
+                    parts.append(value.rjust(width))
+            line = ' '.join(parts)
+            lines.append(line.rstrip() if strip else line + ' ')
+        return '\n'.join(lines)
+
+    def samples(self, units):
+        """Select the units to check the split coordinates with. This is the
+        first unit of each kind, which is the combination of its sequence,
+        alt id, insertion code and symmetry operator, along with
+        `sample_size` units spread evenly over the structure.
+
+        Parameters
+        ----------
+        units : list
+            The units to select from.
+
+        Returns
+        -------
+        samples : list
+            The selected units, in the order given.
+        """
+
+        selected = set()
+        kinds = set()
+        for index, unit in enumerate(units):
+            kind = (unit.sequence,
+                    getattr(unit, 'alt_id', None),
+                    getattr(unit, 'insertion_code', None),
+                    getattr(unit, 'symmetry', None))
+            if kind not in kinds:
+                kinds.add(kind)
+                selected.add(index)
+
+        if units and self.sample_size:
+            step = max(1, len(units) // self.sample_size)
+            selected.update(range(0, len(units), step))
+            selected.add(len(units) - 1)
+        return [units[index] for index in sorted(selected)]
+
+    def split_coordinates(self, pdb, structure, units):
+        """Compute the coordinates of all units by writing the structure once
+        and splitting it by unit id. The result is checked against writing
+        the units from `samples` one at a time with `coordinates`. If they
+        do not match, or the output cannot be split, None is returned.
+
+        Parameters
+        ----------
+        pdb : str
+            The PDB id to use.
+        structure : fr3d.data.Structure
+            The structure to write.
+        units : list
+            The units to get coordinates for.
+
+        Returns
+        -------
+        coordinates : dict
+            A mapping from unit id to the coordinates text, or None.
+        """
+
+        fields, lines = self.atom_site(structure)
+        justify = self.justification(fields, lines)
+        if 'unit_id' not in fields or justify is None:
+            self.logger.warning("Could not split coordinates of %s", pdb)
+            return None
+
+        unit_index = fields.index('unit_id')
+        keep = [i for i in range(len(fields)) if i != unit_index]
+        justify = [justify[i] for i in keep]
+        grouped = coll.defaultdict(list)
+        for line in lines:
+            values = line.split()
+            grouped[values[unit_index]].append([values[i] for i in keep])
+
+        fields = [fields[i] for i in keep]
+        numbering = [None]
+        if 'id' in fields:
+            numbering.append(fields.index('id'))
+
+        samples = self.samples([u for u in units if u.unit_id() in grouped])
+        if not samples:
+            return None
+
+        expected = [self.coordinates(pdb, u) for u in samples]
+        for renumber in numbering:
+            for strip in [True, False]:
+                found = [self.render(grouped[u.unit_id()], justify,
+                                     renumber=renumber, strip=strip)
+                         for u in samples]
+                if found == expected:
+                    return dict((unit_id, self.render(rows, justify,
+                                                      renumber=renumber,
+                                                      strip=strip))
+                                for unit_id, rows in grouped.items())
+
+        self.logger.warning("Split coordinates of %s do not match, writing "
+                            "units one at a time", pdb)
+        return None
 
     def data(self, pdb, **kwargs):
         """Compute the coordinate entries for the given PDB. This will exclude
@@ -92,17 +314,42 @@ class Loader(core.SimpleLoader):
         pdb : str
             The PDB id to use.
 
+        Returns
+        -------
+        coords : iterable
+            The UnitCoordinates objects with the coordinates to write.
+        """
+
+        structure = self.structure(pdb)
+        units = [u for u in structure.residues() if u.sequence != 'HOH']
+        return self.rows(pdb, structure, units)
+
+    def rows(self, pdb, structure, units):
+        """Create the coordinate entries for the given units of a structure.
+
+        Parameters
+        ----------
+        pdb : str
+            The PDB id to use.
+        structure : fr3d.data.Structure
+            The structure the units are from.
+        units : list
+            The units to compute coordinates for.
+
         Yields
         ------
         coord : UnitCoordinates
             A UnitCoordinates object with the coordinates to write.
         """
 
-        structure = self.structure(pdb)
-        for unit in structure.residues():
-            if unit.sequence == 'HOH':
-                continue
-            coord = self.coordinates(pdb, unit)
+        known = {}
+        if self.single_pass:
+            known = self.split_coordinates(pdb, structure, units) or {}
+
+        for unit in units:
+            coord = known.get(unit.unit_id())
+            if coord is None:
+                coord = self.coordinates(pdb, unit)
             self.logger.debug("data: PDB: %s" % pdb)
             self.logger.debug("data: unit: %s" % unit)
             self.logger.debug("data: coordinates: %s" % coord)
@@ -7,7 +7,9 @@ the configuration file.
 """
 
 import itertools as it
+
 import numpy as np
+from scipy.spatial import cKDTree
 
 import pymotifs.core as core
 from pymotifs import models as mod
@@ -21,9 +23,18 @@ class Loader(core.SimpleLoader):
     # some structures don't have complete nucleotides, otherwise fail to have distances < cutoff
     allow_no_data = True
 
-    max_insert = 5000
+    parallel = True
+    """Each structure is independent so they may be processed in parallel"""
+
+    insert_max = 5000
     """Number of distances to write at once"""
 
+    bulk_insert = True
+    """Write distances with executemany INSERTs"""
+
+    pipelined = True
+    """Write distances while computing the rest"""
+
     dependencies = set([InfoLoader])
     """Stages to depend on"""
 
@@ -33,6 +44,13 @@ class Loader(core.SimpleLoader):
     disallowed = set(['HOH'])
     """Set of components to ignore for distances"""
 
+    columns = ('unit_id_1', 'unit_id_2', 'distance')
+    """Columns of the distance tuples produced by data"""
+
+    @property
+    def table(self):
+        return mod.UnitPairsDistances
+
     def known(self):
         self.logger.info("Querying to find PDBs with distances calculated already")
         with self.session() as session:
@@ -178,37 +196,129 @@ class Loader(core.SimpleLoader):
         return pair[0].sequence not in self.disallowed and \
             pair[1].sequence not in self.disallowed
 
+    def centers(self, residues):
+        """Collect the center of each allowed residue into one array. Residues
+        in `self.disallowed` or without a usable center are left out.
+
+        Parameters
+        ----------
+        residues : iterable
+            The `fr3d.data.Component` objects to use.
+
+        Returns
+        -------
+        centers : tuple
+            A list of unit ids and a numpy array of shape (n, 3) with the
+            center of each unit.
+        """
+
+        unit_ids = []
+        centers = []
+        for residue in residues:
+            center = self.usable_center(residue)
+            if center is not None:
+                unit_ids.append(residue.unit_id())
+                centers.append(center)
+        return unit_ids, np.array(centers, dtype=float).reshape(-1, 3)
+
+    def usable_center(self, residue):
+        """Get the center of a residue to compute distances with.
+
+        Parameters
+        ----------
+        residue : fr3d.data.Component
+            The residue to get a center for.
+
+        Returns
+        -------
+        center : numpy.array
+            The center from `self.center`, or None if the residue is in
+            `self.disallowed` or has no center with 3 coordinates.
+        """
+
+        if residue.sequence in self.disallowed:
+            return None
+        center = self.center(residue)
+        if center is None or np.size(center) != 3:
+            return None
+        return center
+
+    def close_pairs(self, centers):
+        """Find all pairs of centers within `self.max_distance` of each other
+        and compute their distances. This uses a KD-tree to find the pairs and
+        computes all distances at once.
+
+        Parameters
+        ----------
+        centers : numpy.array
+            An array of shape (n, 3) of centers.
+
+        Returns
+        -------
+        pairs : tuple
+            An array of shape (m, 2) of the indices of each pair, with the
+            first index smaller than the second, sorted by index, and an
+            array of the m distances between them.
+        """
+
+        if len(centers) < 2:
+            return np.zeros((0, 2), dtype=int), np.zeros(0)
+
+        tree = cKDTree(centers)
+        pairs = sorted(tree.query_pairs(self.max_distance))
+        pairs = np.array(pairs, dtype=int).reshape(-1, 2)
+        differences = centers[pairs[:, 0]] - centers[pairs[:, 1]]
+        distances = np.sqrt(np.einsum('ij,ij->i', differences, differences))
+        return pairs, distances
+
     def data(self, pdb, **kwargs):
-        """Compute the distances for all valid pairs of residues in the given
-        PDB file. This will not compute distances for things in
-        `self.disallowed`.
+        """Compute the distances for all pairs of polymeric residues in the
+        given PDB file whose centers are within `self.max_distance` of each
+        other. This will not compute distances for things in
+        `self.disallowed`. Each pair is produced in both orders. These are
+        the same pairs as `structure.pairs` with a distance cutoff gives, so
+        ions and ligands are not included.
 
         Parameters
         ----------
         pdb : str
             The PDB id to use.
 
-        Yields
-        ------
-        distance : UnitPairDistances
-            A UnitPairsDistances entry for the two
+        Returns
+        -------
+        distances : iterable
+            The rows of unit_pairs_distances as tuples in the order of
+            `self.columns`.
         """
 
         structure = self.structure(pdb)
+        unit_ids, centers = self.centers(structure.residues())
+        self.logger.debug("Computing distances between %i units in %s",
+                          len(unit_ids), pdb)
+        return self.rows(unit_ids, centers)
 
-        # this list of pairs *might* come from fr3d-python/fr3d/structures.py
-        # or more likely from fr3d-python/fr3d/data/pairs.py
-        # scipy kdtree is used in fr3d-python/fr3d/data/base.py to speed up lookups within a cutoff
+    def rows(self, unit_ids, centers):
+        """Create the rows for all pairs of units within `self.max_distance`
+        of each other, in both orders.
 
-        pairs = structure.pairs(distance={'cutoff': self.max_distance})
-        pairs = it.ifilter(self.is_allowed, pairs)
+        Parameters
+        ----------
+        unit_ids : list
+            The unit ids.
+        centers : numpy.array
+            An array of shape (n, 3) with the center of each unit.
 
-        for residue1, residue2 in pairs:
-            distance = self.distance(residue1, residue2)
-            if distance:
-#                self.logger.info("Distance %s %s" % (residue1.unit_id(),residue2.unit_id()))
-#                self.logger.info(distance)
-                yield mod.UnitPairsDistances(unit_id_1=residue1.unit_id(),
-                                             unit_id_2=residue2.unit_id(),
-                                             distance=float(distance))
+        Yields
+        ------
+        distance : tuple
+            A row of unit_pairs_distances as a tuple in the order of
+            `self.columns`.
+        """
 
+        pairs, distances = self.close_pairs(centers)
+        for (index1, index2), distance in \
+                it.izip(pairs.tolist(), distances.tolist()):
+            if not distance:
+                continue
+            yield (unit_ids[index1], unit_ids[index2], distance)
+            yield (unit_ids[index2], unit_ids[index1], distance)
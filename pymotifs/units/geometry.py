@@ -0,0 +1,242 @@
+"""Load all unit level geometry in one pass. This computes the data of
+units.info, units.centers, units.rotation, units.distances,
+units.coordinates and units.incomplete for a structure while parsing and
+iterating over its residues only once, and writes all of it in a single
+transaction. Only the components which are missing for a structure are
+computed and written, so the tables of stages which have already been run
+are left as they are.
+
+This stage is experimental. It is not part of `units.loader` or of the
+`update` stage, and is only run when selected by name, as in `run
+units.geometry`. After it has run the individual stages find their data
+already stored. The individual stages are kept for recomputing just one
+table.
+"""
+
+import collections as coll
+
+import numpy as np
+
+from pymotifs import core
+from pymotifs import utils as ut
+from pymotifs.core import profiling
+from pymotifs.core.db import upsert
+from pymotifs.core.savers import DatabaseSaver
+from pymotifs.core.cache import StructureCache
+
+from pymotifs.units.info import Loader as InfoLoader
+from pymotifs.units.centers import Loader as CenterLoader
+from pymotifs.units.rotation import Loader as RotationLoader
+from pymotifs.units.distances import Loader as DistancesLoader
+from pymotifs.units.coordinates import Loader as CoordinateLoader
+from pymotifs.units.incomplete import Loader as IncompleteLoader
+
+
+class Loader(core.Loader):
+    """A loader which computes and stores the data of all unit geometry
+    stages at once.
+    """
+
+    dependencies = InfoLoader.dependencies
+    """Stages to depend on, the same as units.info"""
+
+    components = (InfoLoader, CenterLoader, RotationLoader, DistancesLoader,
+                  CoordinateLoader, IncompleteLoader)
+    """The stages whose data is computed, in the order it is written"""
+
+    allow_no_data = True
+    use_marks = True
+
+    def __init__(self, *args, **kwargs):
+        super(Loader, self).__init__(*args, **kwargs)
+        self.loaders = coll.OrderedDict()
+        for klass in self.components:
+            self.loaders[klass] = klass(*args, **kwargs)
+
+    def stage(self, klass):
+        """Get the stage used to compute the data of one component, sharing
+        the structure cache and profiler of this stage.
+        """
+
+        if self.structures is None:
+            max_size = self.config['structure_cache'].get('max_size', 0)
+            self.structures = StructureCache(max_size)
+
+        loader = self.loaders[klass]
+        loader.structures = self.structures
+        loader.profiler = self.profiler
+        return loader
+
+    def missing(self, pdb, **kwargs):
+        """Find the components which have not been computed for a PDB. A
+        component which may produce no data is only missing if it has no
+        data and was not marked as processed, since this stage marks all
+        components once it has run.
+
+        Parameters
+        ----------
+        pdb : str
+            The PDB id to check.
+
+        Returns
+        -------
+        components : list
+            The stages of the missing components, in the order of
+            `components`.
+        """
+
+        missing = []
+        for klass in self.components:
+            loader = self.stage(klass)
+            if loader.has_data(pdb, **kwargs):
+                continue
+            if loader.allow_no_data and loader.was_marked(pdb, **kwargs):
+                continue
+            missing.append(klass)
+        return missing
+
+    def has_data(self, pdb, **kwargs):
+        """Check if no component is missing for the PDB.
+        """
+        return not self.missing(pdb, **kwargs)
+
+    def remove(self, pdb, **kwargs):
+        """Do nothing. All data is written in one transaction, so if
+        processing fails nothing is left to clean up, and the data of other
+        components must not be removed since it was not written by this
+        stage. To recompute a table use the individual stage.
+        """
+        pass
+
+    def mark_processed(self, pdb, **kwargs):
+        """Mark this stage and all components as processed.
+        """
+
+        super(Loader, self).mark_processed(pdb, **kwargs)
+        for klass in self.components:
+            self.stage(klass).mark_processed(pdb, **kwargs)
+
+    def data(self, pdb, components=None, **kwargs):
+        """Compute the rows of the missing components. All residues are
+        visited once to build the rows of units.info, units.centers and
+        units.rotation, and to collect the centers and units used by
+        units.distances and units.coordinates. The centers, rotations and
+        distances are only produced for the residues that those stages would
+        use.
+
+        Parameters
+        ----------
+        pdb : str
+            The PDB id to use.
+        components : list, optional
+            The stages to compute the rows of, by default the ones from
+            `missing`.
+
+        Returns
+        -------
+        data : list
+            A list of tuples of each component stage and a list of its rows.
+        """
+
+        if components is None:
+            components = self.missing(pdb, **kwargs)
+        wanted = set(components)
+        if not wanted:
+            return []
+
+        info = self.stage(InfoLoader)
+        centers = self.stage(CenterLoader)
+        rotation = self.stage(RotationLoader)
+        distances = self.stage(DistancesLoader)
+        coordinates = self.stage(CoordinateLoader)
+        incomplete = self.stage(IncompleteLoader)
+
+        # The mmCIF file is parsed once, and both the structure and the
+        # incomplete units come from it.
+        cif = self.cif(pdb)
+        rows = coll.defaultdict(list)
+        if wanted != set([IncompleteLoader]):
+            structure = self.structure(cif)
+            default = set(r.unit_id() for r in structure.residues())
+
+            unit_ids = []
+            positions = []
+            units = []
+            for residue in structure.residues(polymeric=None):
+                if InfoLoader in wanted:
+                    rows[InfoLoader].append(info.as_unit(residue))
+
+                if residue.unit_id() not in default:
+                    continue
+
+                if DistancesLoader in wanted:
+                    center = distances.usable_center(residue)
+                    if center is not None:
+                        unit_ids.append(residue.unit_id())
+                        positions.append(center)
+                if CenterLoader in wanted:
+                    rows[CenterLoader].extend(centers.rows(pdb, residue))
+                if RotationLoader in wanted:
+                    matrix = rotation.row(pdb, residue)
+                    if matrix is not None:
+                        rows[RotationLoader].append(matrix)
+                if residue.sequence != 'HOH':
+                    units.append(residue)
+
+            if InfoLoader in wanted and not rows[InfoLoader]:
+                raise core.InvalidState("No units found in %s" % pdb)
+
+            if DistancesLoader in wanted:
+                positions = np.array(positions, dtype=float).reshape(-1, 3)
+                rows[DistancesLoader] = list(distances.rows(unit_ids,
+                                                            positions))
+            if CoordinateLoader in wanted:
+                rows[CoordinateLoader] = \
+                    list(coordinates.rows(pdb, structure, units))
+
+        if IncompleteLoader in wanted:
+            rows[IncompleteLoader] = incomplete.rows(pdb, cif)
+        return [(self.loaders[k], rows[k]) for k in self.components
+                if k in wanted]
+
+    def store(self, pdb, data, dry_run=False, **kwargs):
+        """Write the rows of all computed components in one transaction.
+        Rows which are dictionaries or tuples are written with executemany
+        INSERTs into the table of their stage, and mapped objects are added
+        to the session. Components which set `merge_data` use `INSERT ... ON
+        DUPLICATE KEY UPDATE` and merge objects instead.
+
+        Parameters
+        ----------
+        pdb : str
+            The PDB id the data is for.
+        data : list
+            The data from `data`.
+        dry_run : bool, optional
+            If true nothing is written.
+        """
+
+        with self.session() as session:
+            for loader, rows in data:
+                self.logger.debug("Saving %i rows of %s for %s", len(rows),
+                                  loader.name, pdb)
+                if dry_run or not rows:
+                    continue
+
+                saver = DatabaseSaver(self.config, self.session, stage=loader)
+                table = getattr(saver.table, '__table__', saver.table)
+                for chunk in ut.grouper(saver.insert_max, rows):
+                    if isinstance(chunk[0], (dict, tuple)):
+                        statement = table.insert()
+                        if saver.merge:
+                            statement = upsert(table)
+                        session.execute(statement,
+                                        [saver.to_row(r) for r in chunk])
+                    elif saver.merge:
+                        for row in chunk:
+                            session.merge(row)
+                        session.flush()
+                    else:
+                        session.add_all(chunk)
+                        session.flush()
+                    profiling.record('rows', len(chunk))
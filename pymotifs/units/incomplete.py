@@ -38,7 +38,7 @@ class Entry(coll.namedtuple('Entry', ['pdb_id', 'model', 'chain', 'number',
 
 
 class Loader(core.SimpleLoader):
-    merge = True
+    merge_data = True
     allow_no_data = True
     use_marks = True
     dependencies = set([InfoLoader])
@@ -57,7 +57,7 @@ class Loader(core.SimpleLoader):
         return session.query(mod.UnitIncomplete).\
             filter(mod.UnitIncomplete.pdb_id == pdb)
 
-    def missing_keys(self, pdb):
+    def missing_keys(self, pdb, cif=None):
         """Determine the unit ids in a file that are missing/unobserved. This
         parses the mmCIF file for the given PDB and examines the
         'pdbx_unobs_or_zero_occ_residues' and 'pdbx_unobs_or_zero_occ_atoms'
@@ -67,13 +67,16 @@ class Loader(core.SimpleLoader):
         ----------
         pdb : str
             The PDB id.
+        cif : fr3d.cif.reader.Cif, optional
+            The already parsed mmCIF file of the PDB, to avoid parsing it.
 
         Returns
         -------
         missing : set
             A set of Entry tuples
         """
-        cif = self.cif(pdb)
+        if cif is None:
+            cif = self.cif(pdb)
         total = it.chain(getattr(cif, 'pdbx_unobs_or_zero_occ_residues', []),
                          getattr(cif, 'pdbx_unobs_or_zero_occ_atoms', []))
         missing = set()
@@ -113,7 +116,24 @@ class Loader(core.SimpleLoader):
             A list of pymotifs.model.UnitIncomplete entries for all incomplete
             unit ids.
         """
+        return self.rows(pdb)
+
+    def rows(self, pdb, cif=None):
+        """Create the entries for all incomplete units of a PDB.
+
+        Parameters
+        ----------
+        pdb : str
+            The PDB id.
+        cif : fr3d.cif.reader.Cif, optional
+            The already parsed mmCIF file of the PDB.
+
+        Returns
+        -------
+        data : list
+            A list of pymotifs.model.UnitIncomplete entries.
+        """
         data = []
-        for key in self.missing_keys(pdb):
+        for key in self.missing_keys(pdb, cif=cif):
             data.append(mod.UnitIncomplete(**key._asdict()))
         return data
@@ -6,6 +6,10 @@
 - units.info
 - units.quality
 - units.rotation
+
+The experimental `units.geometry` stage computes the same data in a single
+pass over each structure. It is not run by this container and must be
+selected by name.
 """
 
 from pymotifs import core
@@ -13,6 +13,11 @@ class Loader(core.SimpleLoader):
 
     dependencies = set([InfoLoader])
     allow_no_data = True
+    bulk_insert = True
+
+    @property
+    def table(self):
+        return mod.UnitRotations
 
     def query(self, session, pdb):
         """Create a query to lookup the rotation matrices.
@@ -25,6 +30,33 @@ class Loader(core.SimpleLoader):
         return session.query(mod.UnitRotations).\
             filter_by(pdb_id=pdb)
 
+    def row(self, pdb, residue):
+        """Create the row for the rotation matrix of a residue.
+
+        :pdb: The pdb id the residue is from.
+        :residue: The residue to get the rotation matrix of.
+        :returns: A dictionary of the matrix, or None if the residue has none.
+        """
+
+        # if there are not enough atoms for the rotation matrix, it will be None
+        matrix = getattr(residue, 'rotation_matrix', None)
+        if matrix is None:
+            return None
+
+        return {
+            'unit_id': residue.unit_id(),
+            'pdb_id': pdb,
+            'cell_0_0': float(matrix[0, 0]),
+            'cell_0_1': float(matrix[0, 1]),
+            'cell_0_2': float(matrix[0, 2]),
+            'cell_1_0': float(matrix[1, 0]),
+            'cell_1_1': float(matrix[1, 1]),
+            'cell_1_2': float(matrix[1, 2]),
+            'cell_2_0': float(matrix[2, 0]),
+            'cell_2_1': float(matrix[2, 1]),
+            'cell_2_2': float(matrix[2, 2]),
+        }
+
     def data(self, pdb, **kwargs):
         """Get the rotation matrices for all RNA residues in the given pdb.
 
@@ -38,19 +70,6 @@ class Loader(core.SimpleLoader):
 #        structure.infer_hydrogens()
 
         for residue in structure.residues():
-
-            if hasattr(residue, 'rotation_matrix'):
-                matrix = residue.rotation_matrix
-                # if there are not enough atoms for the rotation matrix, it will be None
-                if matrix is not None:
-                    yield mod.UnitRotations(unit_id=residue.unit_id(),
-                                            pdb_id=pdb,
-                                            cell_0_0=float(matrix[0, 0]),
-                                            cell_0_1=float(matrix[0, 1]),
-                                            cell_0_2=float(matrix[0, 2]),
-                                            cell_1_0=float(matrix[1, 0]),
-                                            cell_1_1=float(matrix[1, 1]),
-                                            cell_1_2=float(matrix[1, 2]),
-                                            cell_2_0=float(matrix[2, 0]),
-                                            cell_2_1=float(matrix[2, 1]),
-                                            cell_2_2=float(matrix[2, 2]))
+            row = self.row(pdb, residue)
+            if row is not None:
+                yield row
@@ -1,6 +1,8 @@
 """This contains some utility functions for dealing with discrepancies.
 """
 
+import numpy as np
+
 from pymotifs.constants import MAX_RESOLUTION_DISCREPANCY
 from pymotifs.constants import MIN_NT_DISCREPANCY
 
@@ -61,3 +63,78 @@ def valid_chain(chain):
         return chain['resolution'] is not None and \
             chain['resolution'] <= MAX_RESOLUTION_DISCREPANCY
     return True
+
+
+def batch_matrix_discrepancy(centers1, rotations1, centers2, rotations2,
+                             mask=None):
+    """Compute the geometric discrepancy of many pairs of sets of units at
+    once. This computes the same value as
+    `fr3d.geometry.discrepancy.matrix_discrepancy` for each pair, which is
+    the square root of the sum of the squared distances between the centers
+    after the best superposition and the squared angles between the
+    superposed rotation matrices, divided by the number of units. All
+    superpositions are found with a single batched SVD.
+
+    Pairs with different numbers of units are computed together by padding
+    them to the same length and giving a mask of the units to use.
+
+    Parameters
+    ----------
+    centers1 : numpy.ndarray
+        A B x N x 3 array of the centers of the first set of each pair.
+    rotations1 : numpy.ndarray
+        A B x N x 3 x 3 array of the rotation matrices of the first sets.
+    centers2 : numpy.ndarray
+        A B x N x 3 array of the centers of the second set of each pair.
+    rotations2 : numpy.ndarray
+        A B x N x 3 x 3 array of the rotation matrices of the second sets.
+    mask : numpy.ndarray, optional
+        A B x N boolean array of which units to use in each pair, defaults
+        to all of them.
+
+    Returns
+    -------
+    discrepancies : numpy.ndarray
+        The discrepancy of each pair, NaN for pairs without any units.
+    """
+
+    centers1 = np.asarray(centers1, dtype=float)
+    centers2 = np.asarray(centers2, dtype=float)
+    rotations1 = np.asarray(rotations1, dtype=float)
+    rotations2 = np.asarray(rotations2, dtype=float)
+    if mask is None:
+        mask = np.ones(centers1.shape[0:2], dtype=bool)
+    weight = np.asarray(mask, dtype=float)
+    count = weight.sum(axis=1)
+    total = np.maximum(count, 1)[:, np.newaxis]
+
+    # Center each set on its mean, padding stays at zero
+    mean1 = np.einsum('bn,bni->bi', weight, centers1) / total
+    mean2 = np.einsum('bn,bni->bi', weight, centers2) / total
+    new1 = (centers1 - mean1[:, np.newaxis, :]) * weight[:, :, np.newaxis]
+    new2 = (centers2 - mean2[:, np.newaxis, :]) * weight[:, :, np.newaxis]
+
+    # The rotation which best superimposes the second set onto the first,
+    # without reflections
+    covariance = np.einsum('bni,bnj->bij', new2, new1)
+    u, _, vt = np.linalg.svd(covariance)
+    v = np.swapaxes(vt, 1, 2)
+    ut = np.swapaxes(u, 1, 2)
+    sign = np.sign(np.linalg.det(np.matmul(v, ut)))
+    sign[sign == 0] = 1
+    v[:, :, 2] *= sign[:, np.newaxis]
+    rotation = np.matmul(v, ut)
+
+    fit = np.einsum('bij,bnj->bni', rotation, new2)
+    sse = np.square(fit - new1).sum(axis=(1, 2))
+
+    # The angle of the rotation between the superposed orientations
+    relative = np.einsum('bij,bnjk,bnlk->bnil', rotation, rotations2,
+                         rotations1)
+    trace = np.einsum('bnii->bn', relative)
+    angles = np.arccos(np.clip((trace - 1.0) / 2.0, -1.0, 1.0))
+    orientation = (weight * np.square(angles)).sum(axis=1)
+
+    discrepancies = np.sqrt(sse + orientation) / total[:, 0]
+    discrepancies[count == 0] = np.nan
+    return discrepancies
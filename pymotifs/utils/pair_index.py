@@ -0,0 +1,244 @@
+"""An on disk index of which pairs of chains have been compared, and which
+chains have already been placed in a group. This is what is needed to only
+compare the chains which are new since the last time chain to chain
+discrepancies were computed.
+
+Each pair of chain ids is stored as a single integer, with the smaller id in
+the upper 32 bits and the larger in the lower 32 bits, so the compared pairs
+are one sorted integer array which is searched with `numpy.searchsorted`.
+The chains that have been grouped are a second sorted integer array. Both
+are written with `numpy.save` and loaded memory mapped.
+"""
+
+import os
+import json
+import shutil
+import logging
+import tempfile
+import threading
+
+import numpy as np
+
+
+"""The logger to use."""
+logger = logging.getLogger(__name__)
+
+"""The name of the file with the state of the index."""
+META = 'meta.json'
+
+"""The name of the file with the keys of all compared pairs."""
+PAIRS = 'pairs.npy'
+
+"""The name of the file with the ids of all grouped chains."""
+MEMBERS = 'members.npy'
+
+"""The number of bits the first chain id of a pair is shifted by."""
+SHIFT = 32
+
+
+def pair_keys(pairs):
+    """Encode pairs of chain ids as integers. The order of the chains in
+    each pair does not matter.
+
+    Parameters
+    ----------
+    pairs : iterable
+        Tuples of two chain ids.
+
+    Returns
+    -------
+    keys : numpy.ndarray
+        The integer key of each pair.
+    """
+
+    pairs = np.array(list(pairs), dtype=np.int64).reshape(-1, 2)
+    first = pairs.min(axis=1)
+    second = pairs.max(axis=1)
+    return (first << SHIFT) | second
+
+
+def _save(path, array):
+    """Write an array so that readers never see a partial file.
+    """
+
+    directory = os.path.dirname(path)
+    handle, temp = tempfile.mkstemp(dir=directory, suffix='.npy')
+    try:
+        with os.fdopen(handle, 'wb') as raw:
+            np.save(raw, array)
+        os.rename(temp, path)
+    except:
+        if os.path.exists(temp):
+            os.remove(temp)
+        raise
+
+
+def _load(path):
+    if not os.path.exists(path):
+        return np.zeros(0, dtype=np.int64)
+    return np.load(path, mmap_mode='r')
+
+
+def _contains(known, values):
+    """Check which values are in a sorted array.
+    """
+
+    if not len(known):
+        return np.zeros(len(values), dtype=bool)
+    index = np.searchsorted(known, values)
+    index[index == len(known)] = 0
+    return known[index] == values
+
+
+class PairIndex(object):
+    """The index of compared pairs and grouped chains.
+
+    Attributes
+    ----------
+    location : str
+        The directory the index is stored in.
+    """
+
+    def __init__(self, location):
+        self.location = location
+        self._lock = threading.Lock()
+        self._pairs = None
+        self._members = None
+
+    def path(self, *parts):
+        return os.path.join(self.location, *parts)
+
+    def _ensure(self):
+        if not os.path.isdir(self.location):
+            os.makedirs(self.location)
+
+    def is_seeded(self):
+        """Check if the index has been filled with the existing comparisons.
+
+        Returns
+        -------
+        seeded : bool
+            True if `seed` has been called since the index was last cleared.
+        """
+        return os.path.exists(self.path(META))
+
+    def seed(self, pairs):
+        """Fill the index with all pairs that have already been compared,
+        replacing any stored pairs.
+
+        Parameters
+        ----------
+        pairs : iterable
+            Tuples of two chain ids.
+        """
+
+        keys = np.unique(pair_keys(pairs))
+        with self._lock:
+            self._ensure()
+            self._pairs = None
+            _save(self.path(PAIRS), keys)
+            handle, temp = tempfile.mkstemp(dir=self.location, suffix='.json')
+            with os.fdopen(handle, 'wb') as raw:
+                json.dump({'seeded': len(keys)}, raw)
+            os.rename(temp, self.path(META))
+        logger.info("Seeded the pair index with %i pairs", len(keys))
+
+    def clear(self):
+        """Remove everything in the index, so it will be seeded again.
+        """
+
+        with self._lock:
+            if os.path.isdir(self.location):
+                shutil.rmtree(self.location)
+            self._pairs = None
+            self._members = None
+
+    def _load_pairs(self):
+        if self._pairs is None:
+            self._pairs = _load(self.path(PAIRS))
+        return self._pairs
+
+    def _load_members(self):
+        if self._members is None:
+            self._members = _load(self.path(MEMBERS))
+        return self._members
+
+    def missing(self, chain_ids):
+        """Find all pairs of the given chains which have not been compared.
+
+        Parameters
+        ----------
+        chain_ids : list
+            The chain ids of a group.
+
+        Returns
+        -------
+        pairs : list
+            The (first, second) pairs of chain ids, with first < second,
+            which have not been compared, sorted by first and then second.
+        """
+
+        chain_ids = np.unique(np.array(chain_ids, dtype=np.int64))
+        first, second = np.triu_indices(len(chain_ids), k=1)
+        first = chain_ids[first]
+        second = chain_ids[second]
+        with self._lock:
+            known = self._load_pairs()
+        found = _contains(known, (first << SHIFT) | second)
+        return zip(first[~found].tolist(), second[~found].tolist())
+
+    def add_pairs(self, pairs):
+        """Record that pairs of chains have been compared.
+
+        Parameters
+        ----------
+        pairs : iterable
+            Tuples of two chain ids.
+        """
+
+        keys = pair_keys(pairs)
+        if not len(keys):
+            return
+        with self._lock:
+            self._ensure()
+            merged = np.union1d(self._load_pairs(), keys)
+            self._pairs = None
+            _save(self.path(PAIRS), merged)
+        logger.debug("Added %i compared pairs", len(keys))
+
+    def new_members(self, chain_ids):
+        """Find which chains have not been grouped before.
+
+        Parameters
+        ----------
+        chain_ids : list
+            The chain ids of a group.
+
+        Returns
+        -------
+        new : list
+            The chain ids which have not been added with `add_members`.
+        """
+
+        chain_ids = np.array(chain_ids, dtype=np.int64)
+        with self._lock:
+            known = self._load_members()
+        return chain_ids[~_contains(known, chain_ids)].tolist()
+
+    def add_members(self, chain_ids):
+        """Record that chains have been placed in a group.
+
+        Parameters
+        ----------
+        chain_ids : iterable
+            The chain ids.
+        """
+
+        chain_ids = np.array(list(chain_ids), dtype=np.int64)
+        if not len(chain_ids):
+            return
+        with self._lock:
+            self._ensure()
+            merged = np.union1d(self._load_members(), chain_ids)
+            self._members = None
+            _save(self.path(MEMBERS), merged)
@@ -0,0 +1,368 @@
+"""An on disk index of which experimental sequence position each unit is
+mapped to, and which positions correspond to each other. This is what is
+needed to find the matching units of two chains when computing chain to chain
+discrepancies.
+
+The index is kept up to date instead of being rebuilt. The units of each
+structure are stored as a file of unit ids with the row range of each chain
+and an integer array of the position of each unit, along with the time the
+unit mapping of the structure was marked as processed, so that structures
+whose mapping was recomputed are added again. Correspondences between
+positions are kept as two sorted integer arrays, of the first and second
+position of each pair, along with the largest `correspondence_positions_id`
+added and the number of correspondences, so that only newer correspondences
+need to be added and changes to older ones can be detected. All arrays are
+written with `numpy.save` and loaded memory mapped, and the units of a
+structure are only loaded when one of its chains is used.
+"""
+
+import os
+import json
+import shutil
+import logging
+import tempfile
+import threading
+
+import numpy as np
+
+
+"""The logger to use."""
+logger = logging.getLogger(__name__)
+
+"""The name of the file with the state of the index."""
+META = 'meta.json'
+
+"""The name of the file with the first position of each correspondence."""
+SOURCES = 'sources.npy'
+
+"""The name of the file with the second position of each correspondence."""
+TARGETS = 'targets.npy'
+
+
+def _save(path, array):
+    """Write an array so that readers never see a partial file.
+    """
+
+    directory = os.path.dirname(path)
+    handle, temp = tempfile.mkstemp(dir=directory, suffix='.npy')
+    try:
+        with os.fdopen(handle, 'wb') as raw:
+            np.save(raw, array)
+        os.rename(temp, path)
+    except:
+        if os.path.exists(temp):
+            os.remove(temp)
+        raise
+
+
+def _load(path):
+    if not os.path.exists(path):
+        return np.zeros(0, dtype=np.int64)
+    return np.load(path, mmap_mode='r')
+
+
+class ChainPositions(object):
+    """A mapping from a chain name, like '1GID|1|A', to a dict of the
+    position of each unit in the chain.
+    """
+
+    def __init__(self, index):
+        self.index = index
+
+    def __getitem__(self, name):
+        return self.index.chain(name)
+
+    def __contains__(self, name):
+        return bool(self.index.chain(name))
+
+
+class Correspondences(object):
+    """A mapping from a position to the array of positions that correspond
+    to it.
+    """
+
+    def __init__(self, index):
+        self.index = index
+
+    def __getitem__(self, position):
+        return self.index.targets(position).tolist()
+
+
+class PositionIndex(object):
+    """The index of unit positions and position correspondences.
+
+    Attributes
+    ----------
+    location : str
+        The directory the index is stored in.
+    units : ChainPositions
+        The positions of units, looked up by chain name.
+    correspondences : Correspondences
+        The corresponding positions, looked up by position.
+    """
+
+    def __init__(self, location):
+        self.location = location
+        self.units = ChainPositions(self)
+        self.correspondences = Correspondences(self)
+        self._lock = threading.Lock()
+        self._structures = {}
+        self._chains = {}
+        self._pairs = None
+        self._meta = None
+
+    def path(self, *parts):
+        return os.path.join(self.location, *parts)
+
+    def _unit_path(self, pdb, extension):
+        return self.path('units', pdb.upper() + extension)
+
+    def meta(self):
+        """Load the state of the index.
+
+        Returns
+        -------
+        meta : dict
+            A dict with the 'last_correspondence' added, 0 if none have been,
+            and the number of 'correspondences' added.
+        """
+
+        if self._meta is None:
+            self._meta = {'last_correspondence': 0, 'correspondences': 0}
+            if os.path.exists(self.path(META)):
+                with open(self.path(META), 'rb') as raw:
+                    self._meta.update(json.load(raw))
+        return self._meta
+
+    def _write_meta(self):
+        handle, temp = tempfile.mkstemp(dir=self.location, suffix='.json')
+        with os.fdopen(handle, 'wb') as raw:
+            json.dump(self.meta(), raw)
+        os.rename(temp, self.path(META))
+
+    def _ensure(self):
+        directory = self.path('units')
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def clear(self):
+        """Remove everything in the index, so it will be built again.
+        """
+
+        with self._lock:
+            if os.path.isdir(self.location):
+                shutil.rmtree(self.location)
+            self._structures = {}
+            self._chains = {}
+            self._pairs = None
+            self._meta = None
+
+    def has_structure(self, pdb):
+        """Check if the units of a structure have been added.
+
+        Parameters
+        ----------
+        pdb : str
+            The PDB id.
+
+        Returns
+        -------
+        found : bool
+            True if the structure has been added, even if it has no units.
+        """
+        return os.path.exists(self._unit_path(pdb, '.json'))
+
+    def marked(self, pdb):
+        """Get the time the units of a structure were marked with when they
+        were added.
+
+        Parameters
+        ----------
+        pdb : str
+            The PDB id.
+
+        Returns
+        -------
+        marked : str
+            The time given to `add_structure`, None if there is none.
+        """
+
+        with self._lock:
+            return self._structure(pdb).get('marked')
+
+    def add_structure(self, pdb, mappings, marked=None):
+        """Add the units of a structure, replacing any that were added before.
+        A structure without units is not stored, and any units added before
+        are removed, so that it is added again later.
+
+        Parameters
+        ----------
+        pdb : str
+            The PDB id.
+        mappings : iterable
+            Tuples of a unit id and the position it is mapped to.
+        marked : str, optional
+            The time the mapping of the units was marked as processed.
+        """
+
+        chains = {}
+        for unit_id, position in mappings:
+            name = '|'.join(unit_id.split('|')[0:3])
+            chains.setdefault(name, []).append((unit_id, position))
+
+        unit_ids = []
+        positions = []
+        ranges = {}
+        for name in sorted(chains):
+            start = len(unit_ids)
+            for unit_id, position in chains[name]:
+                unit_ids.append(unit_id)
+                positions.append(position)
+            ranges[name] = [start, len(unit_ids)]
+
+        with self._lock:
+            if not unit_ids:
+                for extension in ['.json', '.npy']:
+                    if os.path.exists(self._unit_path(pdb, extension)):
+                        os.remove(self._unit_path(pdb, extension))
+            else:
+                self._ensure()
+                _save(self._unit_path(pdb, '.npy'),
+                      np.array(positions, dtype=np.int64))
+                handle, temp = tempfile.mkstemp(dir=self.path('units'),
+                                                suffix='.json')
+                with os.fdopen(handle, 'wb') as raw:
+                    json.dump({'unit_ids': unit_ids, 'chains': ranges,
+                               'marked': marked}, raw)
+                os.rename(temp, self._unit_path(pdb, '.json'))
+
+            self._structures.pop(pdb.upper(), None)
+            for name in list(self._chains):
+                if name.split('|')[0] == pdb.upper():
+                    self._chains.pop(name)
+
+    def _structure(self, pdb):
+        pdb = pdb.upper()
+        if pdb not in self._structures:
+            data = {'unit_ids': [], 'chains': {}}
+            if self.has_structure(pdb):
+                with open(self._unit_path(pdb, '.json'), 'rb') as raw:
+                    data = json.load(raw)
+            data['positions'] = _load(self._unit_path(pdb, '.npy'))
+            self._structures[pdb] = data
+        return self._structures[pdb]
+
+    def chain(self, name):
+        """Get the position of each unit in a chain.
+
+        Parameters
+        ----------
+        name : str
+            The chain name, like '1GID|1|A'.
+
+        Returns
+        -------
+        positions : dict
+            A dict from unit id to the position it is mapped to, empty if
+            the chain is not known.
+        """
+
+        with self._lock:
+            if name not in self._chains:
+                data = self._structure(name.split('|')[0])
+                start, stop = data['chains'].get(name, (0, 0))
+                units = data['unit_ids'][start:stop]
+                positions = data['positions'][start:stop]
+                self._chains[name] = dict((str(u), int(p)) for u, p in
+                                          zip(units, positions))
+            return self._chains[name]
+
+    def correspondence_count(self):
+        """Get the number of correspondences added.
+
+        Returns
+        -------
+        count : int
+            The number of pairs added since the correspondences were last
+            cleared.
+        """
+        with self._lock:
+            return self.meta()['correspondences']
+
+    def clear_correspondences(self):
+        """Remove all correspondences, so they will be added again.
+        """
+
+        with self._lock:
+            for name in [SOURCES, TARGETS]:
+                if os.path.exists(self.path(name)):
+                    os.remove(self.path(name))
+            self._pairs = None
+            self.meta().update(last_correspondence=0, correspondences=0)
+            if os.path.isdir(self.location):
+                self._write_meta()
+
+    def last_correspondence(self):
+        """Get the largest `correspondence_positions_id` added.
+
+        Returns
+        -------
+        last : int
+            The id, 0 if nothing has been added.
+        """
+        with self._lock:
+            return self.meta()['last_correspondence']
+
+    def _load_pairs(self):
+        if self._pairs is None:
+            self._pairs = (_load(self.path(SOURCES)),
+                           _load(self.path(TARGETS)))
+        return self._pairs
+
+    def add_correspondences(self, pairs, last):
+        """Add pairs of corresponding positions. These are merged with the
+        stored pairs, which are kept sorted by the first position.
+
+        Parameters
+        ----------
+        pairs : iterable
+            Tuples of two corresponding positions.
+        last : int
+            The largest `correspondence_positions_id` of the added pairs.
+        """
+
+        pairs = np.array(list(pairs), dtype=np.int64).reshape(-1, 2)
+        with self._lock:
+            self._ensure()
+            sources, targets = self._load_pairs()
+            sources = np.concatenate([sources, pairs[:, 0]])
+            targets = np.concatenate([targets, pairs[:, 1]])
+            order = np.argsort(sources, kind='mergesort')
+            self._pairs = None
+            _save(self.path(SOURCES), sources[order])
+            _save(self.path(TARGETS), targets[order])
+            self.meta()['last_correspondence'] = max(
+                int(last), self.meta()['last_correspondence'])
+            self.meta()['correspondences'] += len(pairs)
+            self._write_meta()
+        logger.info("Added %i position correspondences", len(pairs))
+
+    def targets(self, position):
+        """Get the positions which correspond to a position.
+
+        Parameters
+        ----------
+        position : int
+            The position.
+
+        Returns
+        -------
+        targets : numpy.ndarray
+            The corresponding positions.
+        """
+
+        with self._lock:
+            sources, targets = self._load_pairs()
+        start = np.searchsorted(sources, position, side='left')
+        stop = np.searchsorted(sources, position, side='right')
+        return targets[start:stop]
@@ -0,0 +1,115 @@
+"""A union-find structure, also known as a disjoint set forest, for finding
+the connected components of large graphs. This uses path compression and
+union by rank, so that building the components of a graph takes nearly
+linear time in the number of edges.
+"""
+
+
+class UnionFind(object):
+    """A collection of disjoint sets of hashable items. Items are added as
+    they are seen and are only merged by `union`.
+    """
+
+    def __init__(self, items=()):
+        self.index = {}
+        self.items = []
+        self.parent = []
+        self.rank = []
+        for item in items:
+            self.add(item)
+
+    def __len__(self):
+        return len(self.items)
+
+    def __contains__(self, item):
+        return item in self.index
+
+    def add(self, item):
+        """Add an item as its own set, if it has not been added.
+
+        :param item: The item to add.
+        :returns: The internal index of the item.
+        """
+
+        if item in self.index:
+            return self.index[item]
+        position = len(self.items)
+        self.index[item] = position
+        self.items.append(item)
+        self.parent.append(position)
+        self.rank.append(0)
+        return position
+
+    def _root(self, position):
+        parent = self.parent
+        root = position
+        while parent[root] != root:
+            root = parent[root]
+        while parent[position] != root:
+            parent[position], position = root, parent[position]
+        return root
+
+    def find(self, item):
+        """Find the representative item of the set an item is in.
+
+        :param item: The item to look up, which must have been added.
+        :returns: The representative of the set.
+        """
+        return self.items[self._root(self.index[item])]
+
+    def union(self, first, second):
+        """Merge the sets of two items, adding either if needed.
+
+        :param first: The first item.
+        :param second: The second item.
+        :returns: True if the items were in different sets.
+        """
+
+        root1 = self._root(self.add(first))
+        root2 = self._root(self.add(second))
+        if root1 == root2:
+            return False
+
+        rank = self.rank
+        if rank[root1] < rank[root2]:
+            root1, root2 = root2, root1
+        self.parent[root2] = root1
+        if rank[root1] == rank[root2]:
+            rank[root1] += 1
+        return True
+
+    def components(self):
+        """Get all sets. Each one is keyed by its first added item.
+
+        :returns: A dictionary of the first item of each set to the set of
+        all items in it.
+        """
+
+        keys = {}
+        components = {}
+        for position, item in enumerate(self.items):
+            root = self._root(position)
+            if root not in keys:
+                keys[root] = item
+                components[item] = set()
+            components[keys[root]].add(item)
+        return components
+
+
+def connected_components(connections):
+    """Find the connected components of a graph. This has the same contract
+    as `pymotifs.utils.connectedsets.find_connected`. Each vertex is assumed
+    to be connected to itself and all connections are assumed to be
+    symmetric, but unlike `find_connected` the given graph is not modified.
+
+    :param dict connections: A dictionary of vertex to an iterable of the
+    vertices it is connected to.
+    :returns: A dictionary of the first vertex of each component, in the
+    order of the keys of connections, to the set of all vertices in it.
+    """
+
+    sets = UnionFind(connections)
+    for vertex, linked in connections.iteritems():
+        for other in linked:
+            sets.union(vertex, other)
+    return sets.components()
@@ -0,0 +1,312 @@
+"""A columnar on disk store of the centers and rotation matrices of units.
+
+Each structure is stored in its own directory, with the base centers of all
+units as a single N x 3 array, the rotation matrices as a single N x 3 x 3
+array and an index of the unit ids, the position of each unit in its chain
+and the range of rows of each chain. Units are stored in chain order, so
+the rows of a chain are contiguous. The arrays are written with `numpy.save`
+and loaded memory mapped, so reading a structure only reads the index, and
+the centers and rotations of a chain are views into the mapped file.
+"""
+
+import os
+import json
+import shutil
+import logging
+import tempfile
+import threading
+import collections as coll
+
+import numpy as np
+
+
+"""The logger to use."""
+logger = logging.getLogger(__name__)
+
+"""The name of the file with the centers."""
+CENTERS = 'centers.npy'
+
+"""The name of the file with the rotation matrices."""
+ROTATIONS = 'rotations.npy'
+
+"""The name of the file with the index."""
+INDEX = 'index.json'
+
+
+def chain_name(unit_id):
+    """Get the name of the chain a unit is in, as it is used in IFE ids, for
+    example '1GID|1|A'.
+
+    Parameters
+    ----------
+    unit_id : str
+        The unit id.
+
+    Returns
+    -------
+    name : str
+        The PDB id, model and chain of the unit joined by '|'.
+    """
+    return '|'.join(unit_id.split('|')[0:3])
+
+
+class UnitGeometry(object):
+    """The stored centers and rotations of the units in one structure.
+
+    Attributes
+    ----------
+    unit_ids : list
+        The unit ids, in the order of the rows.
+    order : list
+        The position of each unit in its chain.
+    centers : numpy.ndarray
+        A N x 3 array of the base centers.
+    rotations : numpy.ndarray
+        A N x 3 x 3 array of the rotation matrices.
+    chains : dict
+        A mapping from chain name to the (start, stop) range of its rows.
+    """
+
+    def __init__(self, unit_ids, order, centers, rotations, chains):
+        self.unit_ids = unit_ids
+        self.order = order
+        self.centers = centers
+        self.rotations = rotations
+        self.chains = chains
+        self.index = dict((u, i) for i, u in enumerate(unit_ids))
+
+    def __len__(self):
+        return len(self.unit_ids)
+
+    def __contains__(self, unit_id):
+        return unit_id in self.index
+
+    def chain(self, name):
+        """Get the data of all units in a chain. The arrays are views into the
+        stored arrays, and so are not copied.
+
+        Parameters
+        ----------
+        name : str
+            The chain name, like '1GID|1|A'.
+
+        Returns
+        -------
+        data : tuple
+            A tuple of the unit ids, positions, centers and rotations of the
+            chain, all empty if the chain is not stored.
+        """
+
+        start, stop = self.chains.get(name, (0, 0))
+        return (self.unit_ids[start:stop], self.order[start:stop],
+                self.centers[start:stop], self.rotations[start:stop])
+
+    def units(self, unit_ids):
+        """Get the centers and rotations of the given units. As the units may
+        be in any order these are copied out of the stored arrays.
+
+        Parameters
+        ----------
+        unit_ids : list
+            The unit ids to look up.
+
+        Returns
+        -------
+        data : tuple
+            A tuple of a N x 3 array of centers and a N x 3 x 3 array of
+            rotations, in the order of the given unit ids.
+
+        Raises
+        ------
+        KeyError
+            If any unit is not stored.
+        """
+
+        rows = np.array([self.index[u] for u in unit_ids], dtype=int)
+        return self.centers[rows], self.rotations[rows]
+
+
+class UnitGeometryStore(object):
+    """A directory of stored unit geometry, one subdirectory per structure.
+    Loaded structures are kept so each is only read once, which is safe as
+    the arrays are memory mapped and are only paged in when used.
+
+    Attributes
+    ----------
+    location : str
+        The directory the data is in.
+    """
+
+    def __init__(self, location):
+        self.location = location
+        self._loaded = {}
+        self._lock = threading.Lock()
+
+    def path(self, pdb):
+        """Get the directory the data of a structure is written to.
+
+        Parameters
+        ----------
+        pdb : str
+            The PDB id.
+
+        Returns
+        -------
+        path : str
+            The directory for the structure.
+        """
+        return os.path.join(self.location, pdb.upper())
+
+    def has(self, pdb):
+        """Check if the data of a structure is stored.
+
+        Parameters
+        ----------
+        pdb : str
+            The PDB id.
+
+        Returns
+        -------
+        found : bool
+            True if the index of the structure exists.
+        """
+        return os.path.exists(os.path.join(self.path(pdb), INDEX))
+
+    def write(self, pdb, unit_ids, order, centers, rotations):
+        """Store the geometry of a structure, replacing any stored data. The
+        units must be sorted so that the units of each chain are together.
+        The data is written to a temporary directory that is moved into
+        place, so readers never see a partial structure.
+
+        Parameters
+        ----------
+        pdb : str
+            The PDB id.
+        unit_ids : list
+            The unit ids.
+        order : list
+            The position of each unit in its chain.
+        centers : array-like
+            The N x 3 base centers.
+        rotations : array-like
+            The N x 3 x 3 rotation matrices.
+
+        Returns
+        -------
+        path : str
+            The directory the data was written to.
+        """
+
+        centers = np.asarray(centers, dtype=float).reshape(-1, 3)
+        rotations = np.asarray(rotations, dtype=float).reshape(-1, 3, 3)
+        if not (len(unit_ids) == len(order) == len(centers) ==
+                len(rotations)):
+            raise ValueError("Unequal number of units and geometry for %s" %
+                             pdb)
+
+        chains = coll.OrderedDict()
+        for index, unit_id in enumerate(unit_ids):
+            name = chain_name(unit_id)
+            if name not in chains:
+                chains[name] = [index, index]
+            elif chains[name][1] != index:
+                raise ValueError("Units of chain %s are not together" % name)
+            chains[name][1] = index + 1
+
+        if not os.path.isdir(self.location):
+            os.makedirs(self.location)
+
+        path = self.path(pdb)
+        temp = tempfile.mkdtemp(dir=self.location, prefix='.' + pdb.upper())
+        try:
+            np.save(os.path.join(temp, CENTERS), centers)
+            np.save(os.path.join(temp, ROTATIONS), rotations)
+            with open(os.path.join(temp, INDEX), 'wb') as raw:
+                json.dump({
+                    'unit_ids': list(unit_ids),
+                    'order': [int(o) for o in order],
+                    'chains': chains,
+                }, raw)
+
+            with self._lock:
+                self._loaded.pop(path, None)
+                if os.path.isdir(path):
+                    shutil.rmtree(path)
+                os.rename(temp, path)
+        except:
+            shutil.rmtree(temp, ignore_errors=True)
+            raise
+
+        logger.debug("Stored geometry of %i units in %s", len(unit_ids), path)
+        return path
+
+    def load(self, pdb):
+        """Load the stored geometry of a structure.
+
+        Parameters
+        ----------
+        pdb : str
+            The PDB id.
+
+        Returns
+        -------
+        geometry : UnitGeometry
+            The stored data, or None if nothing is stored.
+        """
+
+        path = self.path(pdb)
+        with self._lock:
+            if path in self._loaded:
+                return self._loaded[path]
+
+            if not self.has(pdb):
+                return None
+
+            with open(os.path.join(path, INDEX), 'rb') as raw:
+                index = json.load(raw)
+            chains = dict((str(k), tuple(v))
+                          for k, v in index['chains'].items())
+            geometry = UnitGeometry(
+                [str(u) for u in index['unit_ids']],
+                index['order'],
+                np.load(os.path.join(path, CENTERS), mmap_mode='r'),
+                np.load(os.path.join(path, ROTATIONS), mmap_mode='r'),
+                chains,
+            )
+            self._loaded[path] = geometry
+            return geometry
+
+    def chain(self, name):
+        """Get the data of all units in a chain.
+
+        Parameters
+        ----------
+        name : str
+            The chain name, like '1GID|1|A'.
+
+        Returns
+        -------
+        data : tuple
+            The unit ids, positions, centers and rotations of the chain, or
+            None if the structure is not stored.
+        """
+
+        geometry = self.load(name.split('|')[0])
+        if geometry is None:
+            return None
+        return geometry.chain(name)
+
+    def remove(self, pdb):
+        """Remove the stored data of a structure, if any.
+
+        Parameters
+        ----------
+        pdb : str
+            The PDB id.
+        """
+
+        path = self.path(pdb)
+        with self._lock:
+            self._loaded.pop(path, None)
+            if os.path.isdir(path):
+                shutil.rmtree(path)
@@ -0,0 +1,81 @@
+import os
+import time
+import shutil
+import tempfile
+import unittest as ut
+
+from pymotifs.core.cache import CacheStore
+from pymotifs.core.cache import fingerprint
+
+
+class CacheStoreTest(ut.TestCase):
+    def setUp(self):
+        self.location = tempfile.mkdtemp()
+        self.store = CacheStore(self.location)
+
+    def tearDown(self):
+        shutil.rmtree(self.location)
+
+    def test_it_can_store_and_load_data(self):
+        self.store.store('example', {'a': [1, 2]})
+        assert self.store.load('example') == {'a': [1, 2]}
+
+    def test_it_gives_none_for_missing_data(self):
+        assert self.store.load('missing') is None
+
+    def test_it_can_compress_data(self):
+        self.store.compressed = True
+        self.store.store('example', range(100))
+        assert self.store.filename('example').endswith('.pickle.gz')
+        assert self.store.load('example') == range(100)
+
+    def test_it_replaces_data_with_other_compression(self):
+        self.store.store('example', 1)
+        self.store.compressed = True
+        self.store.store('example', 2)
+        assert not os.path.exists(os.path.join(self.location,
+                                               'example.pickle'))
+        assert self.store.load('example') == 2
+
+    def test_it_records_metadata(self):
+        self.store.store('example', [1], creator='nr.release',
+                         fingerprint='abc')
+        val = self.store.metadata('example')
+        assert val['creator'] == 'nr.release'
+        assert val['fingerprint'] == 'abc'
+        assert val['size'] == os.path.getsize(self.store.filename('example'))
+
+    def test_it_lists_entries(self):
+        self.store.store('b', 1)
+        self.store.store('a', 2)
+        assert [e['name'] for e in self.store.entries()] == ['a', 'b']
+
+    def test_it_can_evict_entries(self):
+        self.store.store('example', 1)
+        assert self.store.evict('example') is True
+        assert self.store.evict('example') is False
+        assert self.store.entries() == []
+
+    def test_it_evicts_least_recently_used_above_max_size(self):
+        self.store.store('a', 'a' * 1000)
+        self.store.store('b', 'b' * 1000)
+        time.sleep(0.01)
+        self.store.load('a')
+        self.store.max_size = 2500
+        self.store.store('c', 'c' * 1000)
+        assert [e['name'] for e in self.store.entries()] == ['a', 'c']
+
+    def test_it_prunes_entries_not_used_recently(self):
+        self.store.store('a', 1)
+        time.sleep(0.01)
+        removed = self.store.prune(older_than=0)
+        assert [e['name'] for e in removed] == ['a']
+
+
+class FingerprintTest(ut.TestCase):
+    def test_it_is_the_same_for_the_same_input(self):
+        assert fingerprint(['1GID', '1S72'], '1.0') == \
+            fingerprint(['1GID', '1S72'], '1.0')
+
+    def test_it_differs_for_other_input(self):
+        assert fingerprint(['1GID'], '1.0') != fingerprint(['1GID'], '1.1')
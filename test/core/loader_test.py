@@ -1,6 +1,8 @@
 from test import StageTest
 
+from pymotifs.core import profiling
 from pymotifs.core.stages import Loader
+from pymotifs.core.profiling import Profiler
 
 
 class ExampleLoader(Loader):
@@ -42,3 +44,48 @@ class RecomputingTest(StageTest):
 
     def test_it_does_not_use_time_gap_if_not_set(self):
         self.assertFalse(self.loader.been_long_enough('missing'))
+
+
+class PipelinedLoader(ExampleLoader):
+    pipelined = True
+    insert_max = 2
+    pipeline_depth = 1
+
+    def __init__(self, *args, **kwargs):
+        super(PipelinedLoader, self).__init__(*args, **kwargs)
+        self.stored = []
+        self.fail_store = False
+
+    def data(self, arg):
+        for index in range(5):
+            if arg == 'broken' and index == 3:
+                raise ValueError("Bad data")
+            yield index
+
+    def store(self, pdb, data, **kwargs):
+        for entry in data:
+            if self.fail_store:
+                raise ValueError("Bad write")
+            self.stored.append(entry)
+            profiling.record('rows')
+
+
+class PipelinedTest(StageTest):
+    loader_class = PipelinedLoader
+
+    def test_it_stores_all_data_in_order(self):
+        self.loader.process('missing')
+        self.assertEquals([0, 1, 2, 3, 4], self.loader.stored)
+
+    def test_it_raises_errors_from_computing(self):
+        self.assertRaises(ValueError, self.loader.process, 'broken')
+
+    def test_it_raises_errors_from_writing(self):
+        self.loader.fail_store = True
+        self.assertRaises(ValueError, self.loader.process, 'missing')
+
+    def test_it_records_rows_written_in_the_stage_span(self):
+        profiler = Profiler()
+        with profiler.span('stage', self.loader.name) as span:
+            self.loader.process('missing')
+        self.assertEquals(5, span.counts['rows'])
@@ -0,0 +1,131 @@
+import threading
+import multiprocessing as mp
+from unittest import TestCase
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool
+
+from pymotifs.core import parallel
+from pymotifs.core import profiling
+from pymotifs.core.profiling import Profiler
+from pymotifs.core.db import Session
+
+
+class FakeStage(object):
+    name = 'fake'
+    session = None
+
+    def square(self, value):
+        if value < 0:
+            raise ValueError("Negative")
+        return value * value
+
+
+class CountingStage(FakeStage):
+    profiler = None
+
+    def process_entry(self, index, entry, total, **kwargs):
+        with profiling.span(self.profiler, 'entry', self.name, entry=entry):
+            profiling.record('rows', entry)
+        return 'processed'
+
+    def __call__(self, entries, **kwargs):
+        with profiling.span(self.profiler, 'stage', self.name):
+            for index, entry in enumerate(entries):
+                self.process_entry(index, entry, len(entries))
+
+
+def nested(values):
+    stage = FakeStage()
+    return list(parallel.map_in_pool(stage, stage.square, values, 2))
+
+
+class MapInPoolTest(TestCase):
+    def setUp(self):
+        self.stage = FakeStage()
+
+    def test_it_applies_the_function_in_this_process(self):
+        val = list(parallel.map_in_pool(self.stage, self.stage.square,
+                                        [1, 2, 3], 1))
+        assert val == [1, 4, 9]
+
+    def test_it_applies_the_function_in_a_pool_in_order(self):
+        val = list(parallel.map_in_pool(self.stage, self.stage.square,
+                                        range(10), 3))
+        assert val == [v * v for v in range(10)]
+
+    def test_it_raises_errors_from_workers(self):
+        with self.assertRaises(ValueError):
+            list(parallel.map_in_pool(self.stage, self.stage.square,
+                                      [1, -1, 2], 2))
+
+    def test_it_keeps_pools_started_at_the_same_time_apart(self):
+        results = {}
+
+        def run(name, function):
+            results[name] = list(parallel.map_in_pool(self.stage, function,
+                                                      range(20), 2))
+
+        threads = [
+            threading.Thread(target=run, args=('square', self.stage.square)),
+            threading.Thread(target=run, args=('negate', lambda v: -v)),
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert results['square'] == [v * v for v in range(20)]
+        assert results['negate'] == [-v for v in range(20)]
+        assert parallel._STATE == {}
+
+    def test_it_applies_the_function_in_this_process_in_a_worker(self):
+        pool = mp.Pool(processes=1)
+        try:
+            val = pool.apply(nested, ([1, 2, 3],))
+        finally:
+            pool.close()
+            pool.join()
+        assert val == [1, 4, 9]
+
+
+class RebindTest(TestCase):
+    def test_it_keeps_the_pool_settings(self):
+        engine = create_engine('sqlite://', poolclass=QueuePool,
+                               pool_size=3, max_overflow=7)
+        stage = FakeStage()
+        stage.session = Session(sessionmaker(bind=engine))
+        parallel.rebind(stage)
+        local = parallel.bound_engine(stage.session)
+        assert local is not engine
+        assert local.url == engine.url
+        assert local.pool.size() == 3
+        assert local.pool._max_overflow == 7
+
+
+class ProfilingTest(TestCase):
+    def setUp(self):
+        self.profiler = Profiler(profile=True)
+        self.stage = CountingStage()
+        self.stage.profiler = self.profiler
+
+    def test_it_adds_counters_and_profiles_of_pool_workers(self):
+        with self.profiler.span('stage', 'fake') as span:
+            val = list(parallel.process_in_pool(self.stage, [1, 2, 3], 2))
+        assert val == [(1, 'processed'), (2, 'processed'), (3, 'processed')]
+        assert span.counts['rows'] == 6
+        assert len(self.profiler.take()[1]) == 3
+
+    def test_it_sends_back_spans_of_a_stage_process(self):
+        with self.profiler.span('stage', 'earlier'):
+            pass
+        receiver, sender = mp.Pipe(duplex=False)
+        process = parallel.stage_process(self.stage, [1, 2], results=sender)
+        process.start()
+        sender.close()
+        stages, profiles = receiver.recv()
+        process.join()
+        assert process.exitcode == 0
+        assert [s.stage for s in stages] == ['fake']
+        assert stages[0].counts['rows'] == 3
+        assert sorted(s.entry for s, _ in profiles) == [1, 2]
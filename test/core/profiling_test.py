@@ -0,0 +1,111 @@
+import os
+import json
+import shutil
+import tempfile
+import threading
+import unittest as ut
+
+from pymotifs.core import profiling
+from pymotifs.core.profiling import Profiler
+
+
+class ProfilerTest(ut.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, 'timings.jsonl')
+        self.profiler = Profiler(filename=self.filename, profile=True,
+                                 slowest=1,
+                                 directory=os.path.join(self.directory, 'p'))
+
+    def tearDown(self):
+        self.profiler.close()
+        shutil.rmtree(self.directory)
+
+    def run_stage(self):
+        with self.profiler.span('stage', 'units.distances'):
+            for entry in ['1GID', '1FJG']:
+                profiling.record('entries')
+                with self.profiler.span('entry', 'units.distances', entry):
+                    with profiling.phase('should_process'):
+                        pass
+                    profiling.record('rows', 3)
+
+    def test_does_nothing_without_open_spans(self):
+        profiling.record('rows', 3)
+        with profiling.phase('data'):
+            pass
+        self.assertFalse(profiling.active())
+
+    def test_records_counters_into_all_open_spans(self):
+        self.run_stage()
+        self.assertEquals(1, len(self.profiler.stages))
+        counts = self.profiler.stages[0].counts
+        self.assertEquals(2, counts['entries'])
+        self.assertEquals(6, counts['rows'])
+        self.assertTrue(counts['should_process_seconds'] >= 0)
+
+    def test_writes_all_spans_as_json_lines(self):
+        self.run_stage()
+        self.profiler.close()
+        with open(self.filename, 'rb') as raw:
+            lines = [json.loads(line) for line in raw]
+        self.assertEquals(['entry', 'entry', 'stage'],
+                          [l['kind'] for l in lines])
+        self.assertEquals(['1GID', '1FJG', None], [l['entry'] for l in lines])
+        self.assertEquals(3, lines[0]['rows'])
+
+    def test_times_iterables_but_not_lists(self):
+        data = [1, 2]
+        with self.profiler.span('entry', 'units.distances', '1GID') as span:
+            self.assertTrue(profiling.timed(data, 'data') is data)
+            values = list(profiling.timed(iter(data), 'data'))
+        self.assertEquals(data, values)
+        self.assertTrue('data_seconds' in span.counts)
+
+    def test_excludes_nested_phase(self):
+        with self.profiler.span('entry', 'units.distances', '1GID') as span:
+            with profiling.phase('save', exclude='data'):
+                profiling.record('data_seconds', 100)
+        self.assertTrue(span.counts['save_seconds'] < 0)
+
+    def test_merges_counters_collected_in_other_threads(self):
+        counts = {}
+
+        def work():
+            with profiling.collect() as collected:
+                profiling.record('rows', 4)
+                profiling.record('save_seconds', 2)
+            counts.update(collected)
+
+        with self.profiler.span('stage', 'units.distances') as span:
+            thread = threading.Thread(target=work)
+            thread.start()
+            thread.join()
+            profiling.merge(counts)
+        self.assertEquals(4, span.counts['rows'])
+        self.assertEquals(0, span.counts['save_seconds'])
+        self.assertFalse(profiling.active())
+
+    def test_takes_and_adds_spans_and_profiles(self):
+        self.run_stage()
+        stages, profiles = self.profiler.take()
+        self.assertEquals(['units.distances'], [s.stage for s in stages])
+        self.assertEquals(1, len(profiles))
+        self.assertEquals(([], []), self.profiler.take())
+        self.profiler.add(stages=stages, profiles=profiles)
+        self.assertEquals(1, len(self.profiler.summary()))
+        self.assertEquals(1, len(self.profiler.dump_profiles()))
+
+    def test_summary_has_a_row_per_stage(self):
+        self.run_stage()
+        rows = self.profiler.summary()
+        self.assertEquals(1, len(rows))
+        self.assertEquals('units.distances', rows[0][0])
+        self.assertEquals(2, rows[0][1])
+        self.assertEquals(2, len(self.profiler.table().split('\n')))
+
+    def test_dumps_only_the_slowest_profiles(self):
+        self.run_stage()
+        filenames = self.profiler.dump_profiles()
+        self.assertEquals(1, len(filenames))
+        self.assertTrue(os.path.exists(filenames[0]))
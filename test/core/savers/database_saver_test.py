@@ -83,3 +83,55 @@ class SimpleDatabaseSavingTest(StageTest):
                 result = session.query(PdbInfo.resolution).\
                     filter_by(pdb_id='0000').one()
                 self.assertEquals(9, result.resolution)
+
+
+class BulkDatabaseSavingTest(StageTest):
+    def setUp(self):
+        self.saver = DatabaseSaver(CONFIG, Session)
+        self.saver.table = PdbInfo
+        self.saver.bulk = True
+
+    def tearDown(self):
+        with Session() as session:
+            session.query(PdbInfo).\
+                filter(PdbInfo.pdb_id.like('0%')).\
+                delete(synchronize_session=False)
+
+    def store_and_count(self, name, data, **kwargs):
+        self.saver(name, data, **kwargs)
+        with Session() as session:
+            return session.query(PdbInfo).\
+                filter(PdbInfo.pdb_id.like('0%')).\
+                count()
+
+    def test_it_can_bulk_save_dicts(self):
+        data = [{'pdb_id': '0000', 'resolution': 10},
+                {'pdb_id': '000A', 'resolution': 2}]
+        self.assertEquals(2, self.store_and_count('0000', data))
+
+    def test_it_can_bulk_save_tuples(self):
+        self.saver.columns = ['pdb_id', 'resolution']
+        data = [('0000', 10), ('000A', 2), ('000B', 3)]
+        self.assertEquals(3, self.store_and_count('0000', data))
+
+    def test_it_saves_in_chunks(self):
+        self.saver.insert_max = 2
+        data = ({'pdb_id': '000%s' % i, 'resolution': i} for i in range(5))
+        self.assertEquals(5, self.store_and_count('0000', data))
+
+    def test_it_will_complain_given_nothing_in_bulk(self):
+        self.assertRaises(InvalidState, self.saver, '0000', [])
+
+    def test_it_will_not_bulk_write_if_given_dry_run(self):
+        data = [{'pdb_id': '0000', 'resolution': 10}]
+        self.assertEquals(0, self.store_and_count('0000', data, dry_run=True))
+
+    def test_it_can_bulk_merge_if_requested(self):
+        self.saver.merge = True
+        self.saver('0000', [{'pdb_id': '0000', 'resolution': 10}])
+        self.saver('0000', [{'pdb_id': '0000', 'resolution': 9}])
+
+        with self.saver.session() as session:
+                result = session.query(PdbInfo.resolution).\
+                    filter_by(pdb_id='0000').one()
+                self.assertEquals(9, result.resolution)
@@ -1,6 +1,7 @@
 from test import StageTest
 
 from pymotifs import core
+from pymotifs.core import db
 from pymotifs import utils as ut
 from pymotifs import models as mod
 
@@ -15,6 +16,16 @@ class Simple(core.SimpleLoader):
         return [pdb]
 
 
+class Overridden(Simple):
+    def has_data(self, pdb, **kwargs):
+        return False
+
+
+class AlwaysMissing(Simple):
+    def is_missing(self, pdb, **kwargs):
+        return True
+
+
 class HasDataTest(StageTest):
     loader_class = Simple
 
@@ -76,3 +87,64 @@ class RemovingTest(StageTest):
         self.dummy(1)
         self.loader.remove('0000', dry_run=True)
         self.assertEquals(1, self.count())
+
+    def test_it_can_remove_entries_in_chunks(self):
+        self.dummy(20)
+        self.loader.delete_max = 7
+        self.loader.remove('0000')
+        self.assertEquals(0, self.count())
+
+    def test_it_will_not_translate_queries_of_columns(self):
+        with self.loader.session() as session:
+            query = session.query(mod.UnitInfo.unit_id)
+            self.assertRaises(ValueError, db.delete_statement, query)
+
+
+class BulkHasDataTest(StageTest):
+    loader_class = Simple
+
+    def test_it_finds_entries_with_data(self):
+        val = self.loader.bulk_has_data(['1GID', '0GID'])
+        self.assertEquals(set(['1GID']), val)
+
+    def test_it_checks_entries_in_chunks(self):
+        self.loader.bulk_size = 1
+        val = self.loader.bulk_has_data(['0GID', '1GID', '0GIE'])
+        self.assertEquals(set(['1GID']), val)
+
+    def test_it_is_used_when_checking_if_to_process(self):
+        self.loader._status = self.loader.bulk_status(['1GID', '0GID'])
+        self.assertFalse(self.loader.should_process('1GID'))
+        self.assertTrue(self.loader.should_process('0GID'))
+
+
+class BulkHasDataOverrideTest(StageTest):
+    loader_class = Overridden
+
+    def test_it_does_not_check_in_bulk_with_custom_has_data(self):
+        self.assertEquals(None, self.loader.bulk_has_data(['1GID']))
+
+    def test_it_uses_the_custom_has_data(self):
+        self.loader._status = self.loader.bulk_status(['1GID'])
+        self.assertTrue(self.loader.should_process('1GID'))
+
+
+class BulkIsMissingOverrideTest(StageTest):
+    loader_class = AlwaysMissing
+
+    def test_it_does_not_check_in_bulk_with_custom_is_missing(self):
+        self.assertEquals(None, self.loader.bulk_has_data(['1GID']))
+
+    def test_it_uses_the_custom_is_missing(self):
+        self.loader._status = self.loader.bulk_status(['1GID'])
+        self.assertTrue(self.loader.should_process('1GID'))
+
+
+class BulkUnhashableTest(StageTest):
+    loader_class = Simple
+
+    def test_it_does_not_check_unhashable_entries_in_bulk(self):
+        self.loader.bulk_has_data = None
+        val = self.loader.bulk_status([['1GID', '0GID']])
+        self.assertEquals(None, val['has_data'])
+        self.assertEquals(set(), val['entries'])
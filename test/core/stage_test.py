@@ -3,7 +3,9 @@ import os
 import pytest
 
 from pymotifs.core.stages import Stage
+from pymotifs.core.cache import StructureCache
 from pymotifs.core import Skip
+from pymotifs.core import StageFailed
 
 from test import StageTest as Base
 from test import CONFIG
@@ -155,13 +157,38 @@ class ProcessingTests(Base):
         self.assertEqual(val, ['A', 'B'])
 
 
+class ParallelStage(SomeStage):
+    parallel = True
+
+    def process(self, entry, **kwargs):
+        if entry == 'C':
+            raise ValueError("Failed %s" % entry)
+
+
+class ParallelProcessingTests(Base):
+    def test_it_will_not_use_jobs_if_not_parallel(self):
+        stage = SomeStage(CONFIG, None)
+        self.assertEqual(1, stage.jobs(['A', 'B'], jobs=4))
+
+    def test_it_will_not_use_more_jobs_than_entries(self):
+        stage = ParallelStage(CONFIG, None)
+        self.assertEqual(2, stage.jobs(['A', 'B'], jobs=4))
+
+    def test_it_processes_like_serial_given_jobs(self):
+        stage = ParallelStage(CONFIG, None)
+        val = stage(['A', '', 'B', 'D'], jobs=2)
+        self.assertEqual(val, ['A', 'B', 'D'])
+
+    def test_it_collects_failures_given_jobs(self):
+        stage = ParallelStage(CONFIG, None)
+        self.assertRaises(StageFailed, stage, ['A', 'C', 'B'], jobs=2)
+
+
 class CachingTest(Base):
     loader_class = SomeStage
 
     def tearDown(self):
-        filename = self.loader.cache_filename('example')
-        if os.path.exists(filename):
-            os.remove(filename)
+        self.loader.evict('example')
 
     def test_it_can_cache_data(self):
         ans = [1]
@@ -176,3 +203,40 @@ class CachingTest(Base):
         self.loader.cache('example', ans)
         self.assertEquals(ans, self.loader.cached('example', remove=True))
         self.assertEquals(None, self.loader.cached('example', remove=True))
+
+    def test_it_ignores_data_with_another_fingerprint(self):
+        self.loader.cache('example', [1], fingerprint='a')
+        self.assertEquals([1], self.loader.cached('example', fingerprint='a'))
+        self.assertEquals(None, self.loader.cached('example', fingerprint='b'))
+
+    def test_it_knows_the_fingerprint_of_cached_data(self):
+        fingerprint = self.loader.fingerprint(['1GID', '1S72'], '1.0')
+        self.loader.cache('example', [1], fingerprint=fingerprint)
+        self.assertEquals(fingerprint,
+                          self.loader.cached_fingerprint('example'))
+        self.assertEquals(None, self.loader.cached_fingerprint('bob'))
+
+
+class ModifyingStage(SomeStage):
+    modifies_structure = True
+
+
+class SharingStructuresTest(Base):
+    loader_class = SomeStage
+
+    def setUp(self):
+        super(SharingStructuresTest, self).setUp()
+        self.loader.structures = StructureCache(10 ** 9)
+        self.other = SomeStage(CONFIG, None)
+        self.other.structures = self.loader.structures
+        self.modifying = ModifyingStage(CONFIG, None)
+        self.modifying.structures = self.loader.structures
+
+    def test_it_shares_structures_between_stages(self):
+        self.assertTrue(self.loader.structure('1GID') is
+                        self.other.structure('1GID'))
+
+    def test_it_does_not_share_structures_with_modifying_stages(self):
+        structure = self.loader.structure('1GID')
+        self.assertFalse(structure is self.modifying.structure('1GID'))
+        self.assertTrue(structure is self.loader.structure('1GID'))
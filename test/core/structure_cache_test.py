@@ -0,0 +1,168 @@
+import os
+import shutil
+import tempfile
+import unittest as ut
+
+import numpy as np
+
+from fr3d.cif.reader import Cif
+
+from pymotifs.core.cache import StructureCache
+from pymotifs.core.cache import ParsedStructureStore
+
+
+class StructureCacheTest(ut.TestCase):
+    def setUp(self):
+        self.files = []
+        for size in [10, 20, 30]:
+            handle, filename = tempfile.mkstemp()
+            os.write(handle, 'a' * size)
+            os.close(handle)
+            self.files.append(filename)
+        self.cache = StructureCache(50)
+        self.cache.parsed_factor = 1
+        self.built = []
+
+    def tearDown(self):
+        for filename in self.files:
+            os.remove(filename)
+
+    def fetch(self, index, kind='cif'):
+        def build():
+            self.built.append((index, kind))
+            return (index, kind)
+        return self.cache.fetch(self.files[index], kind, build)
+
+    def test_it_builds_missing_entries(self):
+        assert self.fetch(0) == (0, 'cif')
+        assert self.cache.misses == 1
+        assert self.cache.hits == 0
+
+    def test_it_reuses_cached_entries(self):
+        self.fetch(0)
+        assert self.fetch(0) == (0, 'cif')
+        assert self.built == [(0, 'cif')]
+        assert self.cache.hits == 1
+
+    def test_it_caches_kinds_separately(self):
+        self.fetch(0)
+        assert self.fetch(0, kind='structure') == (0, 'structure')
+        assert self.cache.size == 20
+
+    def test_it_evicts_least_recently_used(self):
+        self.fetch(0)
+        self.fetch(1)
+        self.fetch(0)
+        self.fetch(2)
+        assert self.cache.evictions == 1
+        assert self.cache.size == 40
+        self.fetch(1)
+        assert self.built[-1] == (1, 'cif')
+
+    def test_it_does_not_cache_files_larger_than_max(self):
+        self.cache.max_size = 5
+        self.fetch(0)
+        self.fetch(0)
+        assert self.cache.hits == 0
+        assert self.cache.size == 0
+
+
+class EstimatingSizeTest(ut.TestCase):
+    filename = 'test/files/cif/1GID.cif'
+
+    @classmethod
+    def setUpClass(cls):
+        with open(cls.filename, 'rb') as raw:
+            cls.structure = Cif(raw).structure()
+
+    def setUp(self):
+        self.cache = StructureCache(1024 ** 3)
+
+    def test_it_estimates_structures_from_their_atoms(self):
+        atoms = len(self.structure.coordinates())
+        assert self.cache.estimate(self.structure, 10) == \
+            atoms * StructureCache.atom_size
+
+    def test_it_estimates_other_objects_from_the_file(self):
+        assert self.cache.estimate(object(), 10) == \
+            10 * StructureCache.parsed_factor
+
+    def test_it_counts_the_estimated_size(self):
+        self.cache.fetch(self.filename, 'structure', lambda: self.structure)
+        assert self.cache.size == \
+            self.cache.estimate(self.structure, 0)
+        assert self.cache.size > os.path.getsize(self.filename)
+
+
+class ParsedStructureStoreTest(ut.TestCase):
+    filename = 'test/files/cif/1GID.cif'
+
+    @classmethod
+    def setUpClass(cls):
+        with open(cls.filename, 'rb') as raw:
+            cls.structure = Cif(raw).structure()
+
+    def setUp(self):
+        self.location = tempfile.mkdtemp()
+        self.store = ParsedStructureStore(self.location)
+
+    def tearDown(self):
+        shutil.rmtree(self.location)
+
+    def test_it_loads_nothing_if_not_stored(self):
+        assert self.store.load(self.filename) is None
+
+    def test_it_rebuilds_the_same_units(self):
+        self.store.save(self.filename, self.structure)
+        val = self.store.load(self.filename)
+        ans = self.structure.residues(polymeric=None)
+        assert [r.unit_id() for r in val.residues(polymeric=None)] == \
+            [r.unit_id() for r in ans]
+
+    def test_it_rebuilds_the_same_coordinates(self):
+        self.store.save(self.filename, self.structure)
+        val = self.store.load(self.filename)
+        np.testing.assert_array_equal(val.coordinates(),
+                                      self.structure.coordinates())
+
+    def test_it_stores_under_pdb_and_checksum(self):
+        self.store.save(self.filename, self.structure)
+        checksum = self.store.checksum(self.filename)
+        path = os.path.join(self.location, '1GID', checksum)
+        assert os.path.isfile(os.path.join(path, 'coordinates.npy'))
+
+    def pairs(self, structure):
+        return [(r.unit_id(), r) for r in structure.residues(polymeric=None)]
+
+    def test_it_rebuilds_the_same_atoms(self):
+        self.store.save(self.filename, self.structure)
+        val = self.store.load(self.filename)
+        for (unit1, first), (unit2, second) in zip(self.pairs(val),
+                                                   self.pairs(self.structure)):
+            assert unit1 == unit2
+            assert [a.name for a in first.atoms()] == \
+                [a.name for a in second.atoms()]
+
+    def test_it_rebuilds_the_same_centers(self):
+        self.store.save(self.filename, self.structure)
+        val = self.store.load(self.filename)
+        for (_, first), (_, second) in zip(self.pairs(val),
+                                           self.pairs(self.structure)):
+            for name in ['base', '*']:
+                if name not in second.centers:
+                    continue
+                np.testing.assert_array_almost_equal(first.centers[name],
+                                                     second.centers[name])
+
+    def test_it_infers_the_same_hydrogens(self):
+        with open(self.filename, 'rb') as raw:
+            fresh = Cif(raw).structure()
+        self.store.save(self.filename, fresh)
+        val = self.store.load(self.filename)
+        fresh.infer_hydrogens()
+        val.infer_hydrogens()
+        assert [a.unit_id() for a in val.atoms()] == \
+            [a.unit_id() for a in fresh.atoms()]
+        np.testing.assert_array_almost_equal(val.coordinates(),
+                                             fresh.coordinates())
+        assert self.store.usable
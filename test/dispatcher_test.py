@@ -233,3 +233,68 @@ class StagesTest(ut.TestCase):
             'interactions.summary',
             'ife.info',
         ]
+
+
+class RequirementsTest(ut.TestCase):
+    def setUp(self):
+        self.dispatcher = Dispatcher('units.info', CONFIG, Session)
+
+    def requirements(self, name):
+        deps, exclude, allowed = self.dispatcher.plan(name)
+        stages = self.dispatcher.flatten(deps, exclude, allowed)
+        return self.dispatcher.requirements(stages, deps)
+
+    def test_it_requires_direct_dependencies(self):
+        assert self.requirements('units.info') == {
+            'download': set(),
+            'pdbs.info': set(),
+            'units.info': set(['download', 'pdbs.info']),
+        }
+
+    def test_it_does_not_require_excluded_stages(self):
+        self.dispatcher.exclude = set(['pdbs.loader'])
+        val = self.requirements('units.loader')
+        assert val['units.info'] == set(['download'])
+        assert val['units.distances'] == set(['units.info'])
+
+
+class FakeStage(object):
+    def __init__(self, name, calls, fail=False):
+        self.name = name
+        self.calls = calls
+        self.fail = fail
+
+    def __call__(self, entries, **kwargs):
+        if self.fail:
+            raise core.StageFailed(self.name)
+        self.calls.append(self.name)
+
+
+class RunConcurrentlyTest(ut.TestCase):
+    def setUp(self):
+        self.dispatcher = Dispatcher('units.info', CONFIG, Session,
+                                     concurrent_stages=2)
+        self.calls = []
+
+    def test_it_runs_stages_after_their_requirements(self):
+        stages = [FakeStage(n, self.calls) for n in ['a', 'b', 'c']]
+        reqs = {'a': set(), 'b': set(), 'c': set(['a', 'b'])}
+        self.dispatcher.run_concurrently(stages, reqs, ['1GID'])
+        assert sorted(self.calls[:2]) == ['a', 'b']
+        assert self.calls[2] == 'c'
+
+    def test_it_does_not_start_dependents_of_failed_stages(self):
+        stages = [FakeStage('a', self.calls, fail=True),
+                  FakeStage('b', self.calls)]
+        reqs = {'a': set(), 'b': set(['a'])}
+        with pytest.raises(core.StageFailed):
+            self.dispatcher.run_concurrently(stages, reqs, ['1GID'])
+        assert self.calls == []
+
+    def test_it_uses_threads_by_default(self):
+        assert self.dispatcher.stage_mode == 'thread'
+
+    def test_it_uses_processes_for_stages_with_several_jobs(self):
+        dispatcher = Dispatcher('units.info', CONFIG, Session,
+                                concurrent_stages=2, jobs=2)
+        assert dispatcher.stage_mode == 'process'
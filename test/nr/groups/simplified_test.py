@@ -377,6 +377,28 @@ class LoadingIfeTest(StageTest):
         pass
 
 
+class BulkLoadingIfeTest(StageTest):
+    loader_class = Grouper
+
+    def test_loads_the_same_ifes_as_each_pdb(self):
+        pdbs = ['4V9Q', '1EKD', '1ET4']
+        val = self.loader.bulk_ifes(pdbs)
+        ans = []
+        for pdb in pdbs:
+            ans.extend(self.loader.ifes(pdb))
+        self.assertEquals(ans, val)
+
+    def test_skips_pdbs_without_ifes(self):
+        val = self.loader.bulk_ifes(['0000', '1EKD'])
+        self.assertEquals(self.loader.ifes('1EKD'), val)
+
+    def test_loads_the_same_ifes_in_chunks(self):
+        pdbs = ['4V9Q', '1EKD', '1ET4']
+        val = self.loader.bulk_ifes(pdbs)
+        self.loader.bulk_size = 1
+        self.assertEquals(val, self.loader.bulk_ifes(pdbs))
+
+
 class PairsTest(StageTest):
     loader_class = Grouper
 
@@ -488,3 +510,47 @@ class GroupingTest(StageTest):
         groups = self.group('4V9Q', '3CW5', '4TUE')
         assert set(['4TUE|1|QV', '4TUE|1|XV']) in groups
         assert set(['4TUE|1|QA', '4TUE|1|XA', '4V9Q|1|BA', '4V9Q|1|DA']) in groups
+
+
+class CandidatePairsTest(StageTest):
+    loader_class = Grouper
+
+    def setUp(self):
+        super(CandidatePairsTest, self).setUp()
+        self.chains = [basic_data(i) for i in range(1, 6)]
+        self.chains[1]['species'] = 562
+        self.chains.append(dict(basic_data(6), id='1S72|1|0'))
+        self.chains.append(dict(basic_data(7), id='1FG0|1|A'))
+        self.align = {
+            1: {2: True, 3: True, 4: False},
+            2: {1: True},
+            3: {1: True, 5: True},
+            4: {1: False},
+            5: {3: False},
+        }
+        self.loader.use_discrepancy = False
+
+    def ids(self, pairs):
+        return [(a['id'], b['id']) for a, b in pairs]
+
+    def all_pairs(self):
+        self.loader.use_candidates = False
+        return self.ids(self.loader.pairs(self.chains, self.align, {}))
+
+    def test_it_only_builds_pairs_from_good_alignments_and_joins(self):
+        val = self.ids(self.loader.candidates(self.chains, self.align))
+        assert val == [('1', '2'), ('1', '3'), ('3', '5'),
+                       ('1S72|1|0', '1FG0|1|A')]
+
+    def test_it_finds_the_same_equivalent_pairs_as_all_pairs(self):
+        val = self.ids(self.loader.pairs(self.chains, self.align, {}))
+        assert val == self.all_pairs()
+
+    def test_it_builds_the_same_groups_as_all_pairs(self):
+        def groups():
+            found = self.loader.group(self.chains, self.align, {})
+            return sorted(sorted(c['id'] for c in g) for g in found)
+
+        val = groups()
+        self.loader.use_candidates = False
+        assert val == groups()
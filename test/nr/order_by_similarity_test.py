@@ -0,0 +1,100 @@
+import random
+from unittest import TestCase
+
+import numpy as np
+
+from pymotifs.nr import orderBySimilarity as obs
+
+
+def loop_insertion(distance, order):
+    path = order[:2]
+    score = distance[path[0], path[1]]
+    for p in range(2, len(order)):
+        bestScore = distance[order[p]][path[0]]
+        bestPosition = 0
+        currentScore = distance[path[-1]][order[p]]
+        if currentScore < bestScore:
+            bestScore = currentScore
+            bestPosition = len(path)
+        for position in range(1, len(path)):
+            currentScore = distance[path[position-1]][order[p]] + \
+                distance[order[p]][path[position]] - \
+                distance[path[position-1]][path[position]]
+            if currentScore < bestScore:
+                bestScore = currentScore
+                bestPosition = position
+        path.insert(bestPosition, order[p])
+        score += bestScore
+    return path, score
+
+
+def loop_penalty(distance):
+    Z = obs.linkage(obs.squareform(distance), 'average')
+    penalty = np.zeros(distance.shape)
+    group = [[i] for i in range(distance.shape[0])]
+    for merger in Z:
+        a = int(merger[0])
+        b = int(merger[1])
+        group.append(group[a] + group[b])
+        for i in group[a]:
+            for j in group[b]:
+                penalty[i][j] = merger[2]
+                penalty[j][i] = merger[2]
+    return penalty * np.mean(distance) / max(0.00000001, np.mean(penalty))
+
+
+def dataset(size, seed):
+    state = np.random.RandomState(seed)
+    points = state.normal(size=(size, 3)) + state.randint(0, 4, (size, 1))
+    return np.sqrt(((points[:, None] - points[None]) ** 2).sum(axis=2))
+
+
+class GreedyInsertionTest(TestCase):
+    def test_it_matches_inserting_one_position_at_a_time(self):
+        rng = random.Random(1)
+        for seed in range(5):
+            distance = dataset(40, seed)
+            # ties between positions must be broken the same way
+            distance = np.round(distance, 1)
+            order = range(40)
+            rng.shuffle(order)
+            path, score = obs.greedyInsertionPathLength(distance, order)
+            ans_path, ans_score = loop_insertion(distance, list(order))
+            self.assertEquals(ans_path, path)
+            self.assertAlmostEquals(ans_score, score)
+
+    def test_same_seed_gives_the_same_ordering(self):
+        distance = dataset(30, 2)
+        val1 = obs.multipleGreedyInsertionPathLength(distance, 10, seed=4)
+        val2 = obs.multipleGreedyInsertionPathLength(distance, 10, seed=4)
+        self.assertEquals(val1, val2)
+
+    def test_mapper_does_not_change_the_ordering(self):
+        distance = dataset(30, 3)
+        mapper = lambda fn, items: [fn(i) for i in reversed(items)][::-1]
+        val1 = obs.multipleGreedyInsertionPathLength(distance, 10, seed=4)
+        val2 = obs.multipleGreedyInsertionPathLength(distance, 10, seed=4,
+                                                     mapper=mapper)
+        self.assertEquals(val1, val2)
+
+
+class TreePenaltyTest(TestCase):
+    def test_it_matches_filling_each_merger(self):
+        distance = dataset(25, 5)
+        np.testing.assert_allclose(loop_penalty(distance),
+                                   obs.treePenalty(distance))
+
+
+class ImputeTest(TestCase):
+    def test_it_fills_missing_values_with_the_largest(self):
+        distance = np.array([
+            [0, 1, np.nan],
+            [1, 0, -1],
+            [np.nan, 2, 0],
+        ])
+        val = obs.imputeNANValues(distance)
+        np.testing.assert_array_equal(val, np.array([
+            [0, 1, 1],
+            [1, 0, 1],
+            [1, 1, 0],
+        ]))
@@ -1,8 +1,15 @@
+import os
+import time
+import unittest as ut
+
+import numpy as np
 import pytest
 
 from pymotifs import core
 from pymotifs import models as mod
 from pymotifs.nr.ordering import Loader
+from pymotifs.nr.ordering import ReleaseDistances
+from pymotifs.nr.orderBySimilarity import multipleGreedyInsertionPathLength
 
 from test import StageTest
 
@@ -116,3 +123,63 @@ class OrderingTest(StageTest):
             '1VY4|1|AA',
             '4V8I|1|AA'
         ]
+
+
+class MapperTest(StageTest):
+    loader_class = Loader
+
+    def test_it_does_not_process_classes_in_a_pool(self):
+        assert self.loader.parallel is False
+
+    def test_it_runs_restarts_in_several_processes(self):
+        mapper = self.loader.mapper(jobs=2)
+        pids = set()
+
+        def recording(function, items):
+            def call(item):
+                time.sleep(0.01)
+                return os.getpid(), function(item)
+
+            for pid, result in mapper(call, items):
+                pids.add(pid)
+                yield result
+
+        dist = np.random.RandomState(1).rand(10, 10)
+        dist = dist + dist.T
+        np.fill_diagonal(dist, 0)
+        multipleGreedyInsertionPathLength(dist, 20, 1, recording)
+        assert len(pids) > 1
+        assert os.getpid() not in pids
+
+
+class ReleaseDistancesTest(ut.TestCase):
+    def setUp(self):
+        members = {1: ['A', 'B', 'C'], 2: ['D']}
+        self.distances = ReleaseDistances('1.0', members)
+        for class_id, ife1, ife2, value in [(1, 'A', 'B', 0.5),
+                                            (1, 'B', 'A', 0.5),
+                                            (1, 'C', 'A', 2.0),
+                                            (1, 'C', 'B', None),
+                                            (1, 'A', 'E', 1.0),
+                                            (3, 'A', 'B', 1.0)]:
+            self.distances.add(class_id, ife1, ife2, value)
+
+    def test_it_builds_a_matrix_per_class(self):
+        assert self.distances.matrices[1][0, 1] == 0.5
+        assert self.distances.matrices[1][2, 0] == 2.0
+        assert np.isnan(self.distances.matrices[1][1, 2])
+        assert np.isnan(self.distances.matrices[1][2, 1])
+        assert self.distances.matrices[2].shape == (1, 1)
+
+    def test_it_slices_in_the_given_order(self):
+        val = self.distances.matrix(1, ['C', 'A'])
+        assert val[0, 1] == 2.0
+        assert np.isnan(val[1, 0])
+
+    def test_it_uses_nan_for_unknown_ifes(self):
+        val = self.distances.matrix(1, ['A', 'E', 'B'])
+        assert val[0, 2] == 0.5
+        assert np.isnan(val[1]).all()
+
+    def test_it_ignores_unknown_classes(self):
+        assert 3 not in self.distances.matrices
@@ -1,4 +1,5 @@
 from test import StageTest
+from test import CifStageTest
 
 from pymotifs.units.coordinates import Loader
 
@@ -31,3 +32,59 @@ class CoordianteTest(StageTest):
 
     def test_it_creates_entries_for_each_residue(self):
         assert len(self.data) == 24
+
+
+class SinglePassTest(StageTest):
+    loader_class = Loader
+
+    def test_it_matches_writing_units_one_at_a_time(self):
+        single = list(self.loader.data('157D'))
+        self.loader.single_pass = False
+        separate = list(self.loader.data('157D'))
+        assert [(c.unit_id, c.coordinates) for c in single] == \
+            [(c.unit_id, c.coordinates) for c in separate]
+
+
+class FullSplitTest(CifStageTest):
+    loader_class = Loader
+    filename = 'test/files/cif/1GID.cif'
+
+    def coordinates(self, single_pass):
+        self.loader.single_pass = single_pass
+        units = [u for u in self.structure.residues() if u.sequence != 'HOH']
+        rows = self.loader.rows(self.structure.pdb, self.structure, units)
+        return [(c.unit_id, c.coordinates) for c in rows]
+
+    def test_it_matches_writing_every_unit_one_at_a_time(self):
+        assert self.coordinates(True) == self.coordinates(False)
+
+
+class FullSplitWithProteinTest(FullSplitTest):
+    filename = 'test/files/cif/1A34.cif'
+
+
+class FullSplitWithDnaTest(FullSplitTest):
+    filename = 'test/files/cif/124D.cif'
+
+
+class SplittingTest(CifStageTest):
+    loader_class = Loader
+    filename = 'test/files/cif/1GID.cif'
+
+    def test_it_samples_each_kind_of_unit(self):
+        units = list(self.structure.residues())
+        val = self.loader.samples(units)
+        assert set(u.sequence for u in val) == set(u.sequence for u in units)
+
+    def test_it_samples_units_across_the_structure(self):
+        units = list(self.structure.residues())
+        val = self.loader.samples(units)
+        assert len(val) >= self.loader.sample_size
+        assert val[-1] is units[-1]
+
+    def test_it_splits_every_unit(self):
+        units = [u for u in self.structure.residues() if u.sequence != 'HOH']
+        val = self.loader.split_coordinates(self.structure.pdb,
+                                            self.structure, units)
+        assert val is not None
+        assert set(u.unit_id() for u in units) <= set(val)
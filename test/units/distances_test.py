@@ -107,6 +107,29 @@ class DistancesLoaderTest(CifStageTest):
     def test_can_load_distances(self):
         val = list(self.loader.data(self.structure))
         self.assertEquals(2708, len(val))
+        self.assertTrue(all(0 < d <= 10.0 for _, _, d in val))
+
+    def test_produces_pairs_in_both_orders(self):
+        val = set(self.loader.data(self.structure))
+        self.assertEquals(val, set((b, a, d) for a, b, d in val))
+
+    def test_finds_all_pairs_within_the_cutoff(self):
+        residues = list(self.structure.residues())
+        unit_ids, centers = self.loader.centers(residues)
+        expected = set()
+        for i, first in enumerate(centers):
+            for j, second in enumerate(centers):
+                distance = np.linalg.norm(first - second)
+                if i != j and 0 < distance <= 10.0:
+                    expected.add((unit_ids[i], unit_ids[j]))
+        val = set((a, b) for a, b, _ in self.loader.data(self.structure))
+        self.assertEquals(expected, val)
+
+    def test_computes_same_distance_as_single_pairs(self):
+        unit1, unit2, distance = next(self.loader.data(self.structure))
+        ans = self.loader.distance(self.structure.residue(unit1),
+                                   self.structure.residue(unit2))
+        np.testing.assert_almost_equal(ans, distance)
 
 
 class ProblematicStructureTest(CifStageTest):
@@ -0,0 +1,74 @@
+from test import StageTest
+
+from pymotifs.units.geometry import Loader
+from pymotifs.units.info import Loader as InfoLoader
+from pymotifs.units.centers import Loader as CenterLoader
+from pymotifs.units.rotation import Loader as RotationLoader
+from pymotifs.units.distances import Loader as DistancesLoader
+from pymotifs.units.coordinates import Loader as CoordinateLoader
+from pymotifs.units.incomplete import Loader as IncompleteLoader
+
+
+def normalize(row):
+    if isinstance(row, dict):
+        return tuple(sorted(row.items()))
+    if isinstance(row, tuple):
+        return row
+    return tuple(sorted((k, v) for k, v in vars(row).items()
+                        if not k.startswith('_')))
+
+
+class DataTest(StageTest):
+    loader_class = Loader
+
+    def setUp(self):
+        super(DataTest, self).setUp()
+        self.data = dict((type(l), rows) for l, rows in
+                         self.loader.data('1GID',
+                                          components=Loader.components))
+
+    def separate(self, klass):
+        loader = self.loader.stage(klass)
+        return sorted(normalize(r) for r in loader.data('1GID'))
+
+    def fused(self, klass):
+        return sorted(normalize(r) for r in self.data[klass])
+
+    def test_it_has_data_for_each_component(self):
+        assert sorted(self.data.keys()) == sorted(Loader.components)
+
+    def test_it_matches_info(self):
+        assert self.fused(InfoLoader) == self.separate(InfoLoader)
+
+    def test_it_matches_centers(self):
+        assert self.fused(CenterLoader) == self.separate(CenterLoader)
+
+    def test_it_matches_rotations(self):
+        assert self.fused(RotationLoader) == self.separate(RotationLoader)
+
+    def test_it_matches_distances(self):
+        assert self.fused(DistancesLoader) == self.separate(DistancesLoader)
+
+    def test_it_matches_coordinates(self):
+        assert self.fused(CoordinateLoader) == \
+            self.separate(CoordinateLoader)
+
+    def test_it_matches_incomplete(self):
+        assert self.fused(IncompleteLoader) == \
+            self.separate(IncompleteLoader)
+
+
+class MissingTest(StageTest):
+    loader_class = Loader
+
+    def test_it_does_not_find_stored_components_missing(self):
+        assert self.loader.stage(InfoLoader).has_data('1GID')
+        assert InfoLoader not in self.loader.missing('1GID')
+
+    def test_it_only_computes_missing_components(self):
+        data = self.loader.data('1GID', components=[IncompleteLoader])
+        assert [type(l) for l, _ in data] == [IncompleteLoader]
+
+    def test_it_does_not_remove_any_data(self):
+        self.loader.remove('1GID')
+        assert self.loader.stage(InfoLoader).has_data('1GID')
@@ -0,0 +1,79 @@
+import numpy as np
+
+from unittest import TestCase
+
+from fr3d.geometry.discrepancy import matrix_discrepancy
+
+from pymotifs.utils.discrepancy import batch_matrix_discrepancy
+
+
+def rotation(random):
+    q, _ = np.linalg.qr(random.normal(size=(3, 3)))
+    if np.linalg.det(q) < 0:
+        q[:, 0] *= -1
+    return q
+
+
+def chain(random, size):
+    centers = random.normal(size=(size, 3)) * 10
+    rotations = np.array([rotation(random) for _ in range(size)])
+    return centers, rotations
+
+
+def moved(random, centers, rotations):
+    turn = rotation(random)
+    shifted = centers + random.normal(size=centers.shape)
+    shifted = np.dot(shifted, turn.T) + random.normal(size=3)
+    turned = np.array([np.dot(np.dot(turn, r), rotation(random))
+                       for r in rotations])
+    return shifted, turned
+
+
+class BatchMatrixDiscrepancyTest(TestCase):
+    def setUp(self):
+        random = np.random.RandomState(7)
+        self.pairs = []
+        for size in [3, 12, 40, 7]:
+            c1, r1 = chain(random, size)
+            c2, r2 = moved(random, c1, r1)
+            self.pairs.append((c1, r1, c2, r2))
+
+    def test_it_matches_matrix_discrepancy_on_one_pair(self):
+        c1, r1, c2, r2 = self.pairs[1]
+        val = batch_matrix_discrepancy(c1[None], r1[None], c2[None], r2[None])
+        assert np.allclose(val[0], matrix_discrepancy(c1, r1, c2, r2))
+
+    def test_it_matches_matrix_discrepancy_with_padding(self):
+        size = max(len(p[0]) for p in self.pairs)
+        shape = (len(self.pairs), size)
+        c1 = np.zeros(shape + (3,))
+        c2 = np.zeros(shape + (3,))
+        r1 = np.zeros(shape + (3, 3))
+        r2 = np.zeros(shape + (3, 3))
+        mask = np.zeros(shape, dtype=bool)
+        for index, pair in enumerate(self.pairs):
+            count = len(pair[0])
+            c1[index, :count], r1[index, :count] = pair[0], pair[1]
+            c2[index, :count], r2[index, :count] = pair[2], pair[3]
+            mask[index, :count] = True
+
+        val = batch_matrix_discrepancy(c1, r1, c2, r2, mask=mask)
+        ans = [matrix_discrepancy(*pair) for pair in self.pairs]
+        assert np.allclose(val, ans)
+
+    def test_it_gives_zero_for_a_rigid_motion(self):
+        random = np.random.RandomState(3)
+        c1, r1 = chain(random, 10)
+        turn = rotation(random)
+        c2 = np.dot(c1, turn.T) + 5
+        r2 = np.array([np.dot(turn, r) for r in r1])
+        val = batch_matrix_discrepancy(c1[None], r1[None], c2[None], r2[None])
+        assert np.allclose(val, 0, atol=1e-6)
+
+    def test_it_gives_nan_without_units(self):
+        val = batch_matrix_discrepancy(np.zeros((1, 2, 3)),
+                                       np.zeros((1, 2, 3, 3)),
+                                       np.zeros((1, 2, 3)),
+                                       np.zeros((1, 2, 3, 3)),
+                                       mask=np.zeros((1, 2), dtype=bool))
+        assert np.isnan(val[0])
@@ -0,0 +1,60 @@
+import os
+import shutil
+import tempfile
+
+from unittest import TestCase
+
+from pymotifs.utils.pair_index import PairIndex
+from pymotifs.utils.pair_index import pair_keys
+
+
+class PairKeysTest(TestCase):
+    def test_it_ignores_the_order_of_a_pair(self):
+        assert pair_keys([(3, 7)]).tolist() == pair_keys([(7, 3)]).tolist()
+
+    def test_it_gives_different_pairs_different_keys(self):
+        keys = pair_keys([(1, 2), (1, 3), (2, 3), (100000, 200000)])
+        assert len(set(keys.tolist())) == 4
+
+
+class PairIndexTest(TestCase):
+    def setUp(self):
+        self.location = os.path.join(tempfile.mkdtemp(), 'pairs')
+        self.index = PairIndex(self.location)
+        self.index.seed([(1, 2), (3, 2)])
+
+    def tearDown(self):
+        shutil.rmtree(os.path.dirname(self.location), ignore_errors=True)
+
+    def test_it_knows_it_was_seeded(self):
+        assert self.index.is_seeded() is True
+
+    def test_it_finds_pairs_not_compared(self):
+        assert self.index.missing([3, 1, 2, 4]) == [(1, 3), (1, 4), (2, 4),
+                                                    (3, 4)]
+
+    def test_it_finds_nothing_missing_in_a_compared_group(self):
+        assert self.index.missing([1, 2]) == []
+
+    def test_it_records_compared_pairs(self):
+        self.index.add_pairs([(4, 1), (3, 1)])
+        assert self.index.missing([1, 2, 3, 4]) == [(2, 4), (3, 4)]
+
+    def test_it_reloads_from_disk(self):
+        self.index.add_pairs([(1, 3)])
+        index = PairIndex(self.location)
+        assert index.missing([1, 2, 3]) == []
+
+    def test_it_finds_new_members(self):
+        self.index.add_members([1, 2, 3])
+        assert self.index.new_members([2, 5, 3, 4]) == [5, 4]
+
+    def test_everything_is_new_without_members(self):
+        assert self.index.new_members([2, 1]) == [2, 1]
+
+    def test_it_can_be_cleared(self):
+        self.index.add_members([1])
+        self.index.clear()
+        assert self.index.is_seeded() is False
+        assert self.index.missing([1, 2]) == [(1, 2)]
+        assert self.index.new_members([1]) == [1]
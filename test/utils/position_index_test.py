@@ -0,0 +1,90 @@
+import shutil
+import tempfile
+
+from unittest import TestCase
+
+from pymotifs.utils.position_index import PositionIndex
+
+
+class PositionIndexTest(TestCase):
+    def setUp(self):
+        self.location = tempfile.mkdtemp()
+        self.index = PositionIndex(self.location)
+        self.index.add_structure('1GID', [
+            ('1GID|1|A|G|103', 10),
+            ('1GID|1|B|G|103', 20),
+            ('1GID|1|A|A|104', 11),
+        ])
+        self.index.add_correspondences([(10, 30), (11, 31), (10, 40)], 3)
+
+    def tearDown(self):
+        shutil.rmtree(self.location, ignore_errors=True)
+
+    def test_it_knows_which_structures_were_added(self):
+        assert self.index.has_structure('1GID') is True
+        assert self.index.has_structure('1S72') is False
+
+    def test_it_loads_the_positions_of_a_chain(self):
+        assert self.index.units['1GID|1|A'] == {
+            '1GID|1|A|G|103': 10,
+            '1GID|1|A|A|104': 11,
+        }
+
+    def test_it_has_no_positions_for_unknown_chains(self):
+        assert self.index.units['1S72|1|0'] == {}
+        assert '1GID|1|C' not in self.index.units
+
+    def test_it_finds_corresponding_positions(self):
+        assert sorted(self.index.correspondences[10]) == [30, 40]
+        assert self.index.correspondences[12] == []
+
+    def test_it_merges_new_correspondences(self):
+        self.index.add_correspondences([(5, 6), (11, 32)], 5)
+        assert self.index.correspondences[5] == [6]
+        assert sorted(self.index.correspondences[11]) == [31, 32]
+        assert self.index.last_correspondence() == 5
+
+    def test_it_is_persistent(self):
+        index = PositionIndex(self.location)
+        assert index.last_correspondence() == 3
+        assert index.units['1GID|1|B'] == {'1GID|1|B|G|103': 20}
+        assert sorted(index.correspondences[10]) == [30, 40]
+
+    def test_it_replaces_the_units_of_a_structure(self):
+        assert self.index.units['1GID|1|B']
+        self.index.add_structure('1GID', [('1GID|1|A|G|103', 12)])
+        assert self.index.units['1GID|1|A'] == {'1GID|1|A|G|103': 12}
+        assert self.index.units['1GID|1|B'] == {}
+
+    def test_it_can_be_cleared(self):
+        self.index.clear()
+        assert self.index.has_structure('1GID') is False
+        assert self.index.last_correspondence() == 0
+
+    def test_it_does_not_store_structures_without_units(self):
+        self.index.add_structure('1S72', [])
+        assert self.index.has_structure('1S72') is False
+
+    def test_it_removes_structures_which_lost_their_units(self):
+        self.index.add_structure('1GID', [])
+        assert self.index.has_structure('1GID') is False
+        assert self.index.units['1GID|1|A'] == {}
+
+    def test_it_records_when_units_were_marked(self):
+        assert self.index.marked('1GID') is None
+        self.index.add_structure('1GID', [('1GID|1|A|G|103', 12)],
+                                 marked='2017-01-01T00:00:00')
+        assert PositionIndex(self.location).marked('1GID') == \
+            '2017-01-01T00:00:00'
+
+    def test_it_counts_correspondences(self):
+        assert self.index.correspondence_count() == 3
+        self.index.add_correspondences([(5, 6)], 5)
+        assert PositionIndex(self.location).correspondence_count() == 4
+
+    def test_it_can_clear_correspondences(self):
+        self.index.clear_correspondences()
+        assert self.index.correspondences[10] == []
+        assert self.index.last_correspondence() == 0
+        assert PositionIndex(self.location).correspondence_count() == 0
+        assert self.index.has_structure('1GID') is True
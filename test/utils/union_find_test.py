@@ -0,0 +1,80 @@
+import random
+import unittest as ut
+
+from pymotifs.utils.connectedsets import find_connected
+from pymotifs.utils.union_find import UnionFind
+from pymotifs.utils.union_find import connected_components as conn
+
+
+class UnionFindTest(ut.TestCase):
+
+    def setUp(self):
+        self.sets = UnionFind(['A', 'B', 'C', 'D'])
+
+    def test_items_start_in_their_own_set(self):
+        self.assertEquals('B', self.sets.find('B'))
+        self.assertEquals(4, len(self.sets.components()))
+
+    def test_union_merges_sets(self):
+        self.assertTrue(self.sets.union('A', 'B'))
+        self.assertTrue(self.sets.union('C', 'B'))
+        self.assertEquals(self.sets.find('A'), self.sets.find('C'))
+        self.assertNotEqual(self.sets.find('A'), self.sets.find('D'))
+
+    def test_union_of_the_same_set_does_nothing(self):
+        self.sets.union('A', 'B')
+        self.assertFalse(self.sets.union('B', 'A'))
+
+    def test_union_adds_new_items(self):
+        self.sets.union('A', 'E')
+        self.assertTrue('E' in self.sets)
+        self.assertEquals(self.sets.find('A'), self.sets.find('E'))
+
+    def test_components_are_keyed_by_first_item(self):
+        self.sets.union('D', 'B')
+        self.sets.union('C', 'D')
+        self.assertEquals({'A': set(['A']), 'B': set(['B', 'C', 'D'])},
+                          self.sets.components())
+
+
+class ConnectedComponentsTest(ut.TestCase):
+
+    def test_returns_empty_given_none(self):
+        self.assertEquals({}, conn({}))
+
+    def test_basic_test(self):
+        connections = {}
+        connections['A'] = ['B', 'C']
+        connections['B'] = ['D']
+        connections['C'] = ['E']
+        connections['E'] = ['A']
+        connections['F'] = ['B']
+        connections['zA'] = ['zB', 'zC']
+        connections['zB'] = ['zD']
+        connections['zC'] = ['zE']
+        connections['zD'] = ['zF']
+        connections['zE'] = ['zA']
+        connections['zF'] = ['zB']
+        for key in connections.keys():
+            connections[key] = set(connections[key])
+        ans = {'A': set(['A', 'C', 'B', 'E', 'D', 'F']),
+               'zD': set(['zD', 'zE', 'zF', 'zA', 'zB', 'zC'])}
+        val = conn(connections)
+        self.assertEquals(ans, val)
+
+    def test_it_does_not_modify_the_graph(self):
+        connections = {1: set([2]), 3: set()}
+        conn(connections)
+        self.assertEquals({1: set([2]), 3: set()}, connections)
+
+    def test_it_finds_the_same_components_as_find_connected(self):
+        rng = random.Random(1)
+        for _ in range(10):
+            connections = {}
+            for node in range(200):
+                linked = rng.sample(range(300), rng.randint(0, 2))
+                connections[node] = set(linked)
+            expected = find_connected(dict(connections)).values()
+            val = conn(connections).values()
+            self.assertEquals(sorted(sorted(s) for s in expected),
+                              sorted(sorted(s) for s in val))
@@ -0,0 +1,70 @@
+import shutil
+import tempfile
+
+import numpy as np
+
+from unittest import TestCase
+
+from pymotifs.utils.unit_geometry import UnitGeometryStore
+
+
+UNITS = ['1GID|1|A|G|103', '1GID|1|A|A|104', '1GID|1|B|U|103']
+
+
+class StoreTest(TestCase):
+    def setUp(self):
+        self.location = tempfile.mkdtemp()
+        self.store = UnitGeometryStore(self.location)
+        self.centers = np.arange(9, dtype=float).reshape(3, 3)
+        self.rotations = np.arange(27, dtype=float).reshape(3, 3, 3)
+        self.store.write('1GID', UNITS, [1, 2, 1], self.centers,
+                         self.rotations)
+
+    def tearDown(self):
+        shutil.rmtree(self.location)
+
+    def test_it_knows_what_is_stored(self):
+        assert self.store.has('1GID') is True
+        assert self.store.has('1S72') is False
+
+    def test_it_loads_nothing_if_not_stored(self):
+        assert self.store.load('1S72') is None
+        assert self.store.chain('1S72|1|A') is None
+
+    def test_it_loads_memory_mapped_arrays(self):
+        geometry = self.store.load('1GID')
+        assert isinstance(geometry.centers, np.memmap)
+        np.testing.assert_array_equal(geometry.rotations, self.rotations)
+
+    def test_it_gets_a_chain(self):
+        units, order, centers, rotations = self.store.chain('1GID|1|A')
+        assert units == UNITS[0:2]
+        assert order == [1, 2]
+        np.testing.assert_array_equal(centers, self.centers[0:2])
+        np.testing.assert_array_equal(rotations, self.rotations[0:2])
+
+    def test_it_gets_an_empty_unknown_chain(self):
+        units, order, centers, rotations = self.store.chain('1GID|1|C')
+        assert units == []
+        assert centers.shape == (0, 3)
+
+    def test_it_gets_units_in_order(self):
+        geometry = self.store.load('1GID')
+        centers, rotations = geometry.units([UNITS[2], UNITS[0]])
+        np.testing.assert_array_equal(centers, self.centers[[2, 0]])
+        np.testing.assert_array_equal(rotations, self.rotations[[2, 0]])
+
+    def test_it_replaces_stored_data(self):
+        self.store.load('1GID')
+        self.store.write('1GID', UNITS[0:1], [1], self.centers[0:1],
+                         self.rotations[0:1])
+        assert len(self.store.load('1GID')) == 1
+
+    def test_it_requires_chains_to_be_together(self):
+        with self.assertRaises(ValueError):
+            self.store.write('1GID', [UNITS[0], UNITS[2], UNITS[1]],
+                             [1, 1, 2], self.centers, self.rotations)
+
+    def test_it_can_remove_data(self):
+        self.store.remove('1GID')
+        assert self.store.has('1GID') is False